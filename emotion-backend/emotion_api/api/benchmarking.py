@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Utilidades compartidas por los comandos de benchmark (manage.py benchmark_*)
+
+def synthetic_frame(width=640, height=480, seed=0):
+    """Genera un frame BGR sintético con ruido suave y una elipse con forma de cara."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 256, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_LINEAR)
+    center = (width // 2, height // 2)
+    axes = (width // 8, height // 5)
+    cv2.ellipse(frame, center, axes, 0, 0, 360, (150, 180, 220), -1)
+    return frame
+
+
+def load_frames(images_dir=None, count=20, width=640, height=480):
+    """Carga imágenes de una carpeta (si se indica) o genera `count` frames sintéticos."""
+    if images_dir:
+        frames = []
+        for name in sorted(os.listdir(images_dir)):
+            image = cv2.imread(os.path.join(images_dir, name), cv2.IMREAD_COLOR)
+            if image is not None:
+                frames.append(image)
+        if frames:
+            return frames
+    return [synthetic_frame(width, height, seed=i) for i in range(count)]
+
+
+def caja_rostro(results, shape):
+    """Primera detección de MediaPipe en píxeles; si no hay rostro (frames sintéticos), la elipse central."""
+    ih, iw = shape[:2]
+    if results.detections:
+        bbox = results.detections[0].location_data.relative_bounding_box
+        x, y = max(0, int(bbox.xmin * iw)), max(0, int(bbox.ymin * ih))
+        return x, y, min(iw - x, int(bbox.width * iw)), min(ih - y, int(bbox.height * ih))
+    return iw // 2 - iw // 8, ih // 2 - ih // 5, iw // 4, 2 * ih // 5
+
+
+def timed(fn, *args, **kwargs):
+    """Ejecuta fn y devuelve (resultado, segundos transcurridos)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def summarize(samples_s):
+    """Resume una lista de latencias (en segundos) en milisegundos."""
+    if not samples_s:
+        return {'n': 0}
+    ms = np.asarray(samples_s, dtype=np.float64) * 1000.0
+    return {
+        'n': int(ms.size),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+    }
+
+
+def format_summary(label, summary):
+    if not summary.get('n'):
+        return f"{label:<28} sin muestras"
+    return (
+        f"{label:<28} n={summary['n']:<6} media={summary['mean_ms']:8.2f} ms  "
+        f"p50={summary['p50_ms']:8.2f} ms  p95={summary['p95_ms']:8.2f} ms  p99={summary['p99_ms']:8.2f} ms"
+    )
+
+
+def crear_sesiones_benchmark(n=1, prefijo='bench'):
+    """
+    Crea `n` sesiones de actividad de prueba (con su alumno, materia y actividad) y las confirma.
+    Los comandos que envían frames desde otros hilos o a un servidor (benchmark_detector, loadtest_*)
+    necesitan las filas confirmadas y las borran al terminar con borrar_sesiones_benchmark; dentro de
+    transaction.atomic() se revierten con la transacción (benchmark_frame_upload).
+    """
+    from django.utils import timezone
+    from api.models import Actividad, Materia, Nivel, SesionActividad, Usuario
+
+    nivel = Nivel.objects.create(nombre=f'{prefijo}-nivel')
+    materia = Materia.objects.create(nivel=nivel, nombre=f'{prefijo}-materia', nrc='0', descripcion='')
+    actividad = Actividad.objects.create(
+        materia=materia, nombre=f'{prefijo}-actividad', descripcion='', fecha_inicio=timezone.now()
+    )
+    sesiones = []
+    for i in range(n):
+        # Usuario.CI admite 20 caracteres: un hash del prefijo y el índice cabe con cualquier prefijo
+        ci = hashlib.sha1(f'{prefijo}-{i}'.encode()).hexdigest()[:20]
+        alumno = Usuario.objects.create(username=f'{prefijo}-alumno-{i}', CI=ci, rol='alumno', genero='O')
+        sesiones.append(SesionActividad.objects.create(actividad=actividad, alumno=alumno))
+    return sesiones
+
+
+def borrar_sesiones_benchmark(prefijo='bench'):
+    """
+    Borra lo creado por crear_sesiones_benchmark (las sesiones y sus análisis caen en cascada).
+    Antes espera a que el write-behind (de este proceso o del servidor probado) guarde sus frames:
+    si no, esas filas llegarían después de borrar la sesión y fallarían por la clave foránea.
+    """
+    from api.models import Nivel, SesionActividad, Usuario
+    from api.write_behind import esperar_write_behind
+    sesiones = SesionActividad.objects.filter(alumno__username__startswith=f'{prefijo}-alumno-').values_list('id', flat=True)
+    pendientes = esperar_write_behind(list(sesiones))
+    if pendientes:
+        logger.warning("%d análisis de las sesiones de prueba '%s' siguen sin guardarse", pendientes, prefijo)
+    Nivel.objects.filter(nombre=f'{prefijo}-nivel').delete()
+    Usuario.objects.filter(username__startswith=f'{prefijo}-alumno-').delete()
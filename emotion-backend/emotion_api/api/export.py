@@ -0,0 +1,88 @@
+import csv
+import json
+from datetime import datetime
+
+from .models import AnalisisEmocion
+
+# Exportación de los análisis de emociones para investigación (GET exportar/emociones/ y
+# manage.py export_emotions).
+#
+# Las filas se leen con values_list(...).iterator(chunk_size) en el orden del índice
+# (sesion_id, momento_segundo) y se escriben como CSV o NDJSON línea a línea: la memoria no depende
+# del número de filas exportadas.
+
+CHUNK_SIZE = 2000
+
+# (columna en la exportación, campo de AnalisisEmocion)
+COLUMNAS = (
+    ('materia_id', 'sesion__actividad__materia_id'),
+    ('materia', 'sesion__actividad__materia__nombre'),
+    ('actividad_id', 'sesion__actividad_id'),
+    ('actividad', 'sesion__actividad__nombre'),
+    ('alumno_id', 'sesion__alumno_id'),
+    ('alumno', 'sesion__alumno__username'),
+    ('sesion_id', 'sesion_id'),
+    ('inicio_sesion', 'sesion__fecha_hora_inicio_real'),
+    ('momento_segundo', 'momento_segundo'),
+    ('emocion_predominante', 'emocion_predominante'),
+    ('confianza_emocion', 'confianza_emocion'),
+    ('reutilizado', 'reutilizado'),
+    *((f'prob_{emocion}', f'prob_{emocion}') for emocion in AnalisisEmocion.PROBABILIDADES),
+)
+NOMBRES = [nombre for nombre, _ in COLUMNAS]
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def analisis_a_exportar(analisis=None, materia=None, actividad=None, alumno=None, desde=None, hasta=None):
+    """
+    Tuplas (en el orden de COLUMNAS) de los análisis filtrados, leídas por bloques de CHUNK_SIZE.
+    `desde`/`hasta` son fechas (inclusive) de inicio de la sesión. `analisis` permite partir de un
+    queryset ya restringido (ej. a las materias de un docente).
+    """
+    analisis = AnalisisEmocion.objects.all() if analisis is None else analisis
+    if materia is not None:
+        analisis = analisis.filter(sesion__actividad__materia_id=materia)
+    if actividad is not None:
+        analisis = analisis.filter(sesion__actividad_id=actividad)
+    if alumno is not None:
+        analisis = analisis.filter(sesion__alumno_id=alumno)
+    if desde is not None:
+        analisis = analisis.filter(sesion__fecha_hora_inicio_real__date__gte=desde)
+    if hasta is not None:
+        analisis = analisis.filter(sesion__fecha_hora_inicio_real__date__lte=hasta)
+    return (
+        analisis.order_by('sesion_id', 'momento_segundo')
+        .values_list(*(campo for _, campo in COLUMNAS))
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def _valor(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+
+class _Linea:
+    """Destino de csv.writer que devuelve la línea escrita en lugar de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def lineas_csv(filas):
+    escritor = csv.writer(_Linea())
+    yield escritor.writerow(NOMBRES)
+    for fila in filas:
+        yield escritor.writerow([_valor(v) for v in fila])
+
+
+def lineas_ndjson(filas):
+    for fila in filas:
+        yield json.dumps(dict(zip(NOMBRES, map(_valor, fila))), ensure_ascii=False) + '\n'
+
+
+def lineas(formato, filas):
+    return lineas_csv(filas) if formato == 'csv' else lineas_ndjson(filas)
@@ -0,0 +1,255 @@
+import logging
+import random
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from rest_framework import status
+
+from .metrics import contar_resultado, medir_etapa
+from .ml_model.dedup import get_frame_dedup_cache
+from .ml_model.detector import (
+    MENSAJE_ROSTRO_PEQUENO,
+    MENSAJE_SIN_ROSTRO,
+    detectar_emocion_bytes,
+    detectar_emociones_lote_bytes,
+)
+from .models import AnalisisEmocion
+from .session_state import validar_sesion_frame
+from .write_behind import get_write_behind_buffer
+
+# Flujo común de todas las vías de entrada de frames (HTTP base64, HTTP binario, WebSocket):
+# detección (o reutilización de un frame casi idéntico) y registro del AnalisisEmocion.
+# Devuelve (payload, código HTTP) para que cada vía lo entregue a su manera.
+
+MENSAJE_REGISTRADO = "Análisis de emoción registrado."
+MENSAJE_NO_DETECTADO = "Frame recibido, pero no se detectó rostro o hubo un problema."
+
+logger = logging.getLogger(__name__)
+
+
+def _muestrear_log():
+    # Solo una fracción de los frames se registra en el log (EMOCION_METRICS['LOG_SAMPLE_RATE'])
+    tasa = getattr(settings, 'EMOCION_METRICS', {}).get('LOG_SAMPLE_RATE', 0.01)
+    return tasa > 0 and random.random() < tasa
+
+
+def resultado_frame(emotion_results, reutilizado):
+    """Clasificación del resultado del detector para métricas y logs."""
+    if reutilizado:
+        return 'reutilizado'
+    if not emotion_results:
+        return 'error'
+    if emotion_results.get('detected', False):
+        return 'detectado'
+    if emotion_results.get('invalid_image'):
+        return 'imagen_invalida'
+    if emotion_results.get('error'):
+        return 'error'
+    if emotion_results.get('message') == MENSAJE_ROSTRO_PEQUENO:
+        return 'rostro_pequeno'
+    if emotion_results.get('message') == MENSAJE_SIN_ROSTRO:
+        return 'sin_rostro'
+    return 'error'
+
+
+def _reutilizable(emotion_results):
+    # Un resultado con error o de una imagen inválida no se reutiliza para los frames siguientes
+    return bool(emotion_results) and not emotion_results.get('error') and not emotion_results.get('invalid_image')
+
+
+def validar_analisis(filas):
+    """
+    Valida las filas como lo hacía AnalisisEmocionWriteSerializer (sin consultar la sesión, que ya validó
+    validar_sesion_frame). Devuelve {índice: {campo: [errores]}} de las filas inválidas.
+    """
+    errores = {}
+    for i, fila in enumerate(filas):
+        try:
+            fila.full_clean(exclude=['sesion'], validate_unique=False, validate_constraints=False)
+        except ValidationError as e:
+            errores[i] = e.message_dict
+    return errores
+
+
+def guardar_analisis(filas):
+    """
+    Guarda filas de AnalisisEmocion sin guardar. Con EMOCION_WRITE_BEHIND activo se encolan y
+    un hilo las inserta en bloque; si no, se insertan ya con un único upsert. Un frame reenviado
+    con el mismo (sesion, momento_segundo) reemplaza al anterior.
+
+    Las filas se validan antes: una fila inválida encolada se aceptaría con 201 y terminaría
+    apartada en un .rejected sin que nadie se entere. Si alguna es inválida no se guarda ninguna
+    y se devuelven sus errores (ver validar_analisis); si no, {}.
+    """
+    errores = validar_analisis(filas)
+    if errores:
+        return errores
+    buffer = get_write_behind_buffer()
+    with medir_etapa('guardado'):
+        if buffer is not None:
+            buffer.add(filas)
+        else:
+            AnalisisEmocion.objects.upsert(filas)
+    return {}
+
+
+def datos_analisis(sesion_id, momento_segundo, emotion_results, reutilizado):
+    """Campos de AnalisisEmocion (sin la sesión) a partir del resultado del detector."""
+    resultado = resultado_frame(emotion_results, reutilizado)
+    contar_resultado(resultado)
+    if _muestrear_log():
+        nivel = logging.WARNING if resultado == 'error' else logging.INFO
+        logger.log(
+            nivel, "frame sesion_id=%s momento_segundo=%s resultado=%s emocion=%s confianza=%s detalle=%s",
+            sesion_id, momento_segundo, resultado,
+            (emotion_results or {}).get('emotion'), (emotion_results or {}).get('confidence'),
+            (emotion_results or {}).get('error') or (emotion_results or {}).get('message'),
+        )
+
+    if emotion_results and emotion_results.get('detected', False): # Si hubo detección exitosa
+        return {
+            'momento_segundo': momento_segundo,
+            'emocion_predominante': emotion_results.get('emotion'),
+            'confianza_emocion': emotion_results.get('confidence'),
+            'datos_raw_emociones': emotion_results.get('all_emotions', {}),
+            'reutilizado': reutilizado,
+        }
+
+    # No hubo detección o hubo un error en el detector
+    return {
+        'momento_segundo': momento_segundo,
+        'emocion_predominante': 'no_detectado', # Valor para "no detectado"
+        'confianza_emocion': 0.0,
+        'datos_raw_emociones': emotion_results.get('all_emotions', {}) if emotion_results else {},
+        'reutilizado': reutilizado,
+    }
+
+
+def registrar_frame(sesion_id, momento_segundo, image_bytes):
+    """Analiza y registra un frame codificado (JPEG/PNG/WebP) de una sesión."""
+    # Sesión inexistente, finalizada o fuera de la ventana de análisis: se rechaza sin leer la base de datos
+    rechazo = validar_sesion_frame(sesion_id)
+    if rechazo is not None:
+        return rechazo
+
+    try:
+        # Frames casi idénticos al último analizado de la sesión reutilizan su resultado
+        dedup = get_frame_dedup_cache()
+        with medir_etapa('dedup'):
+            frame_hash, emotion_results = dedup.check(sesion_id, image_bytes) if dedup else (None, None)
+        reutilizado = emotion_results is not None
+
+        if not reutilizado:
+            # --- LLAMADA AL NUEVO detector.py ---
+            # El detector decodifica por etapas: detección a resolución reducida y recorte a resolución completa solo si hace falta
+            with medir_etapa('analisis'):
+                emotion_results = detectar_emocion_bytes(image_bytes, sesion_id=sesion_id)
+
+            if emotion_results.get('invalid_image'):
+                contar_resultado('imagen_invalida')
+                return {"error": "No se pudo decodificar la imagen o es inválida."}, status.HTTP_400_BAD_REQUEST
+
+        # Preparar datos para AnalisisEmocion y guardar (o encolar en el write-behind)
+        datos = datos_analisis(sesion_id, momento_segundo, emotion_results, reutilizado)
+        errores = guardar_analisis([AnalisisEmocion(sesion_id=sesion_id, **datos)])
+        if errores:
+            return errores[0], status.HTTP_400_BAD_REQUEST
+        # Solo un frame ya guardado sirve de referencia: si el guardado falla, el siguiente se analiza
+        if dedup and not reutilizado and _reutilizable(emotion_results):
+            dedup.remember(sesion_id, frame_hash, emotion_results)
+
+        response_data = {
+            "emocion": datos['emocion_predominante'],
+            "confianza": datos['confianza_emocion'],
+            "message": MENSAJE_REGISTRADO,
+            "reutilizado": reutilizado
+        }
+        if not (emotion_results and emotion_results.get('detected', False)):
+            response_data["message"] = MENSAJE_NO_DETECTADO
+
+        return response_data, status.HTTP_201_CREATED
+
+    except Exception as e:
+        logger.exception("Error interno del servidor al registrar el frame (sesion_id=%s, momento_segundo=%s)", sesion_id, momento_segundo)
+        return {"error": f"Error interno del servidor: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+def registrar_lote(sesion_id, frames):
+    """
+    Analiza y registra varios frames de una sesión enviados juntos: [(momento_segundo, image_bytes), ...].
+    Los frames se procesan en orden de momento_segundo, los rostros se clasifican en una sola pasada
+    del modelo y todas las filas se guardan con un único upsert.
+    """
+    rechazo = validar_sesion_frame(sesion_id)
+    if rechazo is not None:
+        return rechazo
+
+    try:
+        frames = sorted(frames, key=lambda f: f[0])
+        dedup = get_frame_dedup_cache()
+
+        # Cada frame se compara con el último analizado de la sesión, que puede ser uno anterior del
+        # mismo lote: los casi idénticos reutilizan su resultado y el resto va al detector
+        with medir_etapa('dedup'):
+            if dedup:
+                hashes, origen, previo = dedup.check_batch(sesion_id, [image_bytes for _, image_bytes in frames])
+            else:
+                hashes, origen, previo = [None] * len(frames), [None] * len(frames), None
+        resultados = [None] * len(frames)
+
+        def analizar(indices):
+            if not indices:
+                return
+            with medir_etapa('analisis_lote'):
+                nuevos = detectar_emociones_lote_bytes([frames[i][1] for i in indices], sesion_id=sesion_id)
+            for i, resultado in zip(indices, nuevos):
+                resultados[i] = resultado
+
+        analizar([i for i, o in enumerate(origen) if o is None])
+        # Si el frame de referencia del lote no dio un resultado reutilizable, los que lo reutilizaban se analizan
+        repetir = [i for i, o in enumerate(origen) if o is not None and o >= 0 and not _reutilizable(resultados[o])]
+        for i in repetir:
+            origen[i] = None
+        analizar(repetir)
+        for i, o in enumerate(origen):
+            if o is not None:
+                resultados[i] = previo if o < 0 else resultados[o]
+
+        filas, respuesta = [], []
+        for i, ((momento_segundo, _), emotion_results) in enumerate(zip(frames, resultados)):
+            if emotion_results and emotion_results.get('invalid_image'):
+                contar_resultado('imagen_invalida')
+                respuesta.append({
+                    "momento_segundo": momento_segundo,
+                    "error": "No se pudo decodificar la imagen o es inválida.",
+                    "status": status.HTTP_400_BAD_REQUEST,
+                })
+                continue
+            datos = datos_analisis(sesion_id, momento_segundo, emotion_results, reutilizado=origen[i] is not None)
+            filas.append(AnalisisEmocion(sesion_id=sesion_id, **datos))
+            respuesta.append({
+                "momento_segundo": momento_segundo,
+                "emocion": datos['emocion_predominante'],
+                "confianza": datos['confianza_emocion'],
+                "message": MENSAJE_REGISTRADO if emotion_results and emotion_results.get('detected') else MENSAJE_NO_DETECTADO,
+                "reutilizado": datos['reutilizado'],
+                "status": status.HTTP_201_CREATED,
+            })
+
+        errores = guardar_analisis(filas)
+        if errores:
+            return {
+                "error": "Hay análisis inválidos; no se guardó ningún frame del lote.",
+                "frames": {filas[i].momento_segundo: error for i, error in errores.items()},
+            }, status.HTTP_400_BAD_REQUEST
+        # Ya guardado: el último frame analizado con resultado reutilizable pasa a ser la referencia de la sesión
+        if dedup:
+            analizados = [i for i, o in enumerate(origen) if o is None and hashes[i] is not None and _reutilizable(resultados[i])]
+            if analizados:
+                ultimo = analizados[-1]
+                dedup.remember(sesion_id, hashes[ultimo], resultados[ultimo], reusos=origen.count(ultimo))
+        return {"sesion_id": sesion_id, "registrados": len(filas), "resultados": respuesta}, status.HTTP_201_CREATED
+
+    except Exception as e:
+        logger.exception("Error interno del servidor al registrar el lote (sesion_id=%s, frames=%s)", sesion_id, len(frames))
+        return {"error": f"Error interno del servidor: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import SesionActividad
+from api.video_analysis import analizar_video, plan_segmentos, propiedades_video
+
+
+class Command(BaseCommand):
+    help = (
+        "Analiza un video grabado de una actividad y registra sus AnalisisEmocion en una sesión. "
+        "El video se procesa por segmentos en un pool de procesos; si se interrumpe, volver a "
+        "ejecutar el mismo comando reanuda desde el checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        config = getattr(settings, 'EMOCION_VIDEO_ANALYSIS', {})
+        parser.add_argument('video', help="Ruta del archivo de video (cualquier formato que lea OpenCV).")
+        parser.add_argument('--sesion-id', type=int, required=True, help="SesionActividad a la que se asocian los análisis.")
+        parser.add_argument('--fps', type=float, default=config.get('SAMPLE_FPS', 1.0),
+                            help="Frames analizados por segundo de video (como mucho 1).")
+        parser.add_argument('--workers', type=int, default=config.get('WORKERS'),
+                            help="Procesos del pool (por defecto, uno por CPU).")
+        parser.add_argument('--segment-seconds', type=int, default=config.get('SEGMENT_SECONDS', 60),
+                            help="Segundos de video por tarea del pool.")
+        parser.add_argument('--checkpoint', help="Archivo de checkpoint (por defecto, <video>.checkpoint.json).")
+
+    def handle(self, *args, **options):
+        if not 0 < options['fps'] <= 1:
+            raise CommandError("--fps debe estar entre 0 y 1 (se guarda como mucho un análisis por segundo de sesión).")
+        try:
+            propiedades = propiedades_video(options['video'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        segmentos = plan_segmentos(propiedades['duracion'], options['segment_seconds'])
+        self.stdout.write(
+            f"{options['video']}: {propiedades['duracion']:.1f} s a {propiedades['fps']:.1f} fps, "
+            f"{len(segmentos)} segmentos de {options['segment_seconds']} s, muestreo a {options['fps']} fps"
+        )
+
+        def progreso(p):
+            ritmo = p['frames_registrados'] / p['segundos_transcurridos'] if p['segundos_transcurridos'] else 0.0
+            self.stdout.write(
+                f"  {p['segmentos_completados']}/{p['segmentos_total']} segmentos · "
+                f"{p['frames_registrados']} frames registrados · {ritmo:.1f} frames/s"
+            )
+
+        try:
+            resultado = analizar_video(
+                options['video'], options['sesion_id'],
+                fps=options['fps'],
+                workers=options['workers'],
+                segundos_por_segmento=options['segment_seconds'],
+                checkpoint_path=options['checkpoint'],
+                progreso=progreso,
+            )
+        except SesionActividad.DoesNotExist:
+            raise CommandError(f"No existe la SesionActividad {options['sesion_id']}.")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Análisis completado: {resultado['frames_registrados']} frames registrados en la sesión {options['sesion_id']}."
+        ))
@@ -0,0 +1,61 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarking import format_summary, summarize
+from api.ml_model.backends import BACKENDS, default_model_path
+from api.ml_model.conversion import verification_inputs
+
+
+class Command(BaseCommand):
+    help = "Compara latencia y throughput de los backends de inferencia disponibles (keras, tflite, onnx)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+        parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8, 32])
+        parser.add_argument('--iterations', type=int, default=200, help="Llamadas a predict por tamaño de lote.")
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--threads', type=int, default=None, help="Hilos de CPU para TFLite/ONNX.")
+        parser.add_argument('--json', dest='json_path', help="Guardar los resultados en este archivo JSON.")
+
+    def handle(self, *args, **options):
+        results = {}
+        for name in options['backends']:
+            path = default_model_path(name)
+            if not os.path.exists(path):
+                self.stdout.write(self.style.WARNING(f"{name}: no existe {path}, se omite (ver export_emotion_model)."))
+                continue
+            kwargs = {} if name == 'keras' else {'num_threads': options['threads']}
+            backend = BACKENDS[name](path, **kwargs)
+            results[name] = {}
+
+            for batch_size in options['batch_sizes']:
+                batch = verification_inputs(batch_size)
+                for _ in range(options['warmup']):
+                    backend.predict(batch)
+
+                samples = []
+                started = time.perf_counter()
+                for _ in range(options['iterations']):
+                    t0 = time.perf_counter()
+                    backend.predict(batch)
+                    samples.append(time.perf_counter() - t0)
+                elapsed = time.perf_counter() - started
+
+                summary = summarize(samples)
+                summary['faces_per_s'] = batch_size * options['iterations'] / elapsed
+                results[name][str(batch_size)] = summary
+                self.stdout.write(
+                    format_summary(f"{name} lote={batch_size}", summary)
+                    + f"  {summary['faces_per_s']:10.1f} rostros/s"
+                )
+
+        if not results:
+            raise CommandError("No hay ningún backend con modelo disponible.")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json_path']}"))
@@ -0,0 +1,220 @@
+import base64
+import json
+import os
+import platform
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import cv2
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarking import (
+    borrar_sesiones_benchmark,
+    caja_rostro,
+    crear_sesiones_benchmark,
+    format_summary,
+    load_frames,
+    summarize,
+)
+from api.ml_model.detector import EMOTION_LABELS, get_model, predecir, preprocesar_gris, warmup
+from api.ml_model.face_detector_pool import get_face_detector_pool
+from api.ml_model.pipeline import FrameEscalonado
+from api.models import AnalisisEmocion
+
+# Etapas del flujo de emocion-detection/, en orden (clave en el JSON, etiqueta en pantalla)
+ETAPAS = (
+    ('base64', 'decodificación base64'),
+    ('imdecode', 'imdecode (reducida)'),
+    ('color', 'BGR->RGB'),
+    ('deteccion', 'detección de rostro'),
+    ('preproceso', 'recorte+preproceso'),
+    ('prediccion', 'predict'),
+    ('insercion_db', 'upsert AnalisisEmocion'),
+)
+
+PREFIJO = 'bench-detector'
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _cambio(antes, despues):
+    return (despues - antes) / antes * 100.0 if antes else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide por etapas el flujo de emocion-detection/ (base64, imdecode, color, detección, preproceso, "
+        "predict, INSERT) con frames sintéticos o de una carpeta, a varios niveles de concurrencia. "
+        "Guarda los resultados en JSON y los compara con una ejecución anterior."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames', type=int, default=200, help="Frames procesados por nivel de concurrencia.")
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8], help="Hilos concurrentes a medir.")
+        parser.add_argument('--images-dir', help="Carpeta con imágenes reales (por defecto, frames sintéticos reproducibles).")
+        parser.add_argument('--width', type=int, default=640)
+        parser.add_argument('--height', type=int, default=480)
+        parser.add_argument('--quality', type=int, default=80, help="Calidad JPEG (el frontend usa 0.8).")
+        parser.add_argument('--json', dest='json_path', help="Guardar los resultados en este archivo JSON.")
+        parser.add_argument('--compare', help="JSON de una ejecución anterior con el que comparar.")
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help="Aumento de p95 (%%) a partir del cual una etapa se marca como regresión.")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Terminar con error si alguna etapa supera --threshold.")
+
+    def _frame(self, pool, frame_base64, sesion_id, momento):
+        t0 = time.perf_counter()
+
+        # Mismo orden que EmocionDetectionAPIView -> ingest.registrar_frame -> detector
+        _, datos = frame_base64.split(',', 1)
+        image_bytes = base64.b64decode(datos)
+        t1 = time.perf_counter()
+        frame = FrameEscalonado(image_bytes)
+        t2 = time.perf_counter()
+        rgb = cv2.cvtColor(frame.reducida, cv2.COLOR_BGR2RGB)
+        t3 = time.perf_counter()
+        results = pool.process(rgb)
+        t4 = time.perf_counter()
+        box = caja_rostro(results, frame.reducida.shape)
+        input_tensor = preprocesar_gris(frame.recorte_gris(box))
+        t5 = time.perf_counter()
+        predictions = predecir(input_tensor)
+        t6 = time.perf_counter()
+        idx = int(predictions.argmax())
+        AnalisisEmocion.objects.upsert([AnalisisEmocion(
+            sesion_id=sesion_id,
+            momento_segundo=momento,
+            emocion_predominante=EMOTION_LABELS[idx],
+            confianza_emocion=float(predictions[idx]),
+            datos_raw_emociones={e: float(p) for e, p in zip(EMOTION_LABELS, predictions)},
+        )])
+        t7 = time.perf_counter()
+
+        tiempos = [t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4, t6 - t5, t7 - t6]
+        return tiempos, t7 - t0
+
+    def _nivel(self, pool, encoded, sesiones, hilos, total):
+        def uno(i):
+            # Cada hilo escribe en su propia sesión, como alumnos distintos
+            return self._frame(pool, encoded[i % len(encoded)], sesiones[i % hilos].id, i)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as executor:
+            muestras = list(executor.map(uno, range(total)))
+        elapsed = time.perf_counter() - started
+
+        por_etapa = list(zip(*(tiempos for tiempos, _ in muestras)))
+        return {
+            'etapas': {clave: summarize(list(ts)) for (clave, _), ts in zip(ETAPAS, por_etapa)},
+            'total': summarize([t for _, t in muestras]),
+            'frames_por_s': total / elapsed,
+        }
+
+    def handle(self, *args, **options):
+        if options['frames'] < 1 or min(options['concurrency']) < 1:
+            raise CommandError("--frames y --concurrency deben ser al menos 1.")
+        if not warmup() or get_model() is None:
+            raise CommandError("No se pudo cargar el modelo de emociones.")
+
+        frames = load_frames(options['images_dir'], width=options['width'], height=options['height'])
+        params = [cv2.IMWRITE_JPEG_QUALITY, options['quality']]
+        encoded = [
+            'data:image/jpeg;base64,' + base64.b64encode(cv2.imencode('.jpg', f, params)[1]).decode('ascii')
+            for f in frames
+        ]
+        pool = get_face_detector_pool()
+
+        resultados = {
+            'metadata': {
+                'fecha': datetime.now().isoformat(timespec='seconds'),
+                'git': _git_revision(),
+                'backend': repr(get_model()),
+                'batching': getattr(settings, 'EMOCION_BATCH_ENABLED', True),
+                'face_detector_pool': pool.size,
+                'resolucion': f"{frames[0].shape[1]}x{frames[0].shape[0]}",
+                'imagenes': options['images_dir'] or 'sinteticas',
+                'frames': options['frames'],
+                'cpus': os.cpu_count(),
+                'plataforma': platform.platform(),
+                'python': platform.python_version(),
+            },
+            'niveles': {},
+        }
+
+        borrar_sesiones_benchmark(PREFIJO)
+        sesiones = crear_sesiones_benchmark(max(options['concurrency']), PREFIJO)
+        try:
+            # Calentamiento: primera detección, primer predict e INSERT con la conexión ya abierta
+            for i in range(3):
+                self._frame(pool, encoded[i % len(encoded)], sesiones[0].id, 0)
+
+            for hilos in options['concurrency']:
+                nivel = self._nivel(pool, encoded, sesiones, hilos, options['frames'])
+                resultados['niveles'][str(hilos)] = nivel
+                self.stdout.write(f"\nConcurrencia {hilos}: {nivel['frames_por_s']:.1f} frames/s")
+                for clave, etiqueta in ETAPAS:
+                    self.stdout.write(format_summary(f"  {etiqueta}", nivel['etapas'][clave]))
+                self.stdout.write(format_summary("  total", nivel['total']))
+        finally:
+            borrar_sesiones_benchmark(PREFIJO)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(resultados, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"\nResultados guardados en {options['json_path']}"))
+
+        if options['compare']:
+            regresiones = self._comparar(options['compare'], resultados, options['threshold'])
+            if regresiones and options['fail_on_regression']:
+                raise CommandError(f"{regresiones} etapas con regresión de p95 mayor que {options['threshold']}%.")
+
+    def _comparar(self, path, actual, umbral):
+        with open(path) as f:
+            anterior = json.load(f)
+        self.stdout.write(
+            f"\nComparación con {path} (git {anterior['metadata'].get('git')}, {anterior['metadata'].get('fecha')}):"
+        )
+        for clave in ('resolucion', 'imagenes', 'backend', 'batching', 'cpus'):
+            if anterior['metadata'].get(clave) != actual['metadata'][clave]:
+                self.stdout.write(self.style.WARNING(
+                    f"  Aviso: '{clave}' distinto ({anterior['metadata'].get(clave)} -> {actual['metadata'][clave]})"
+                ))
+        regresiones = 0
+        for hilos, nivel in actual['niveles'].items():
+            previo = anterior['niveles'].get(hilos)
+            if previo is None:
+                continue
+            self.stdout.write(
+                f"  Concurrencia {hilos}: {previo['frames_por_s']:.1f} -> {nivel['frames_por_s']:.1f} frames/s "
+                f"({_cambio(previo['frames_por_s'], nivel['frames_por_s']):+.1f}%)"
+            )
+            filas = [(etiqueta, previo['etapas'].get(clave), nivel['etapas'][clave]) for clave, etiqueta in ETAPAS]
+            filas.append(('total', previo['total'], nivel['total']))
+            for etiqueta, antes, despues in filas:
+                if not antes or not antes.get('n'):
+                    continue
+                cambio_p95 = _cambio(antes['p95_ms'], despues['p95_ms'])
+                linea = (
+                    f"    {etiqueta:<24} p50 {antes['p50_ms']:8.2f} -> {despues['p50_ms']:8.2f} ms "
+                    f"({_cambio(antes['p50_ms'], despues['p50_ms']):+6.1f}%)   "
+                    f"p95 {antes['p95_ms']:8.2f} -> {despues['p95_ms']:8.2f} ms ({cambio_p95:+6.1f}%)"
+                )
+                if cambio_p95 > umbral:
+                    regresiones += 1
+                    self.stdout.write(self.style.ERROR(linea))
+                elif cambio_p95 < -umbral:
+                    self.stdout.write(self.style.SUCCESS(linea))
+                else:
+                    self.stdout.write(linea)
+        return regresiones
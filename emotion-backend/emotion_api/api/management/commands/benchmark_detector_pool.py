@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import mediapipe as mp
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarking import format_summary, load_frames, summarize, timed
+from api.ml_model.face_detector_pool import (
+    MIN_DETECTION_CONFIDENCE,
+    MODEL_SELECTION,
+    FaceDetectorPool,
+)
+
+
+def _detect_fresh(rgb_frame):
+    # Comportamiento anterior: un grafo nuevo de MediaPipe por cada frame
+    face_detection = mp.solutions.face_detection.FaceDetection(
+        model_selection=MODEL_SELECTION,
+        min_detection_confidence=MIN_DETECTION_CONFIDENCE
+    )
+    try:
+        return face_detection.process(rgb_frame)
+    finally:
+        face_detection.close()
+
+
+class Command(BaseCommand):
+    help = "Compara la latencia por frame de la detección de rostros con y sin el pool de detectores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames', type=int, default=100, help="Número de frames a procesar por modo.")
+        parser.add_argument('--images-dir', help="Carpeta con imágenes reales (por defecto se usan frames sintéticos).")
+        parser.add_argument('--width', type=int, default=640)
+        parser.add_argument('--height', type=int, default=480)
+        parser.add_argument('--threads', type=int, default=1, help="Hilos concurrentes enviando frames.")
+        parser.add_argument('--pool-size', type=int, default=None, help="Tamaño del pool (por defecto, igual a --threads).")
+
+    def handle(self, *args, **options):
+        if options['frames'] < 1 or options['threads'] < 1:
+            raise CommandError("--frames y --threads deben ser al menos 1.")
+
+        frames = load_frames(options['images_dir'], width=options['width'], height=options['height'])
+        rgb_frames = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in frames]
+        total = options['frames']
+        threads = options['threads']
+        pool = FaceDetectorPool(size=options['pool_size'] or threads)
+
+        def run(detect):
+            def one(i):
+                return timed(detect, rgb_frames[i % len(rgb_frames)])[1]
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                return list(executor.map(one, range(total)))
+
+        try:
+            # Calentamiento para no medir la primera carga de recursos de MediaPipe
+            pool.process(rgb_frames[0])
+            _detect_fresh(rgb_frames[0])
+
+            before = summarize(run(_detect_fresh))
+            after = summarize(run(pool.process))
+        finally:
+            pool.close()
+
+        self.stdout.write(f"Frames: {total}  Hilos: {threads}  Resolución: {rgb_frames[0].shape[1]}x{rgb_frames[0].shape[0]}")
+        self.stdout.write(format_summary("Antes (grafo por frame)", before))
+        self.stdout.write(format_summary("Después (pool)", after))
+        if before['mean_ms'] > 0:
+            self.stdout.write(self.style.SUCCESS(f"Aceleración media: {before['mean_ms'] / after['mean_ms']:.2f}x"))
@@ -0,0 +1,179 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.benchmarking import format_summary, summarize
+from api.models import AnalisisEmocion
+
+EMOCIONES = AnalisisEmocion.PROBABILIDADES
+
+# Tabla api_analisisemocion antes (JSON por fila) y después (una columna REAL por emoción) de la
+# migración 0004, con las mismas columnas e índice que crea Django en SQLite.
+TABLA_JSON = """
+CREATE TABLE analisis (
+    id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+    momento_segundo integer unsigned NOT NULL,
+    emocion_predominante varchar(20) NOT NULL,
+    confianza_emocion real NOT NULL,
+    datos_raw_emociones text NOT NULL CHECK ((JSON_VALID(datos_raw_emociones) OR datos_raw_emociones IS NULL)),
+    sesion_id bigint NOT NULL,
+    reutilizado bool NOT NULL
+)
+"""
+TABLA_COLUMNAS = """
+CREATE TABLE analisis (
+    id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+    momento_segundo integer unsigned NOT NULL,
+    emocion_predominante varchar(20) NOT NULL,
+    confianza_emocion real NOT NULL,
+    sesion_id bigint NOT NULL,
+    reutilizado bool NOT NULL,
+    {}
+)
+""".format(',\n    '.join(f'prob_{e} real NULL' for e in EMOCIONES))
+INDICE = "CREATE INDEX analisis_sesion_id ON analisis (sesion_id)"
+
+# Consultas de agregación típicas de los reportes, en las dos versiones
+CONSULTAS = (
+    (
+        'promedio por sesión',
+        "SELECT sesion_id, {} FROM analisis GROUP BY sesion_id".format(
+            ', '.join(f"AVG(json_extract(datos_raw_emociones, '$.{e}'))" for e in EMOCIONES)),
+        "SELECT sesion_id, {} FROM analisis GROUP BY sesion_id".format(
+            ', '.join(f"AVG(prob_{e})" for e in EMOCIONES)),
+    ),
+    (
+        'promedio de una sesión',
+        "SELECT AVG(json_extract(datos_raw_emociones, '$.felicidad')) FROM analisis WHERE sesion_id = 1",
+        "SELECT AVG(prob_felicidad) FROM analisis WHERE sesion_id = 1",
+    ),
+    (
+        'frames con felicidad > 0.5',
+        "SELECT COUNT(*) FROM analisis WHERE json_extract(datos_raw_emociones, '$.felicidad') > 0.5",
+        "SELECT COUNT(*) FROM analisis WHERE prob_felicidad > 0.5",
+    ),
+)
+
+
+def _filas(total, sesiones, no_detectados, seed=0):
+    """Filas sintéticas con probabilidades float32 (como las devuelve el modelo)."""
+    rng = np.random.default_rng(seed)
+    probabilidades = rng.dirichlet(np.ones(len(EMOCIONES)), size=total).astype(np.float32)
+    sin_rostro = rng.random(total) < no_detectados
+    for i in range(total):
+        if sin_rostro[i]:
+            yield i // sesiones, 'no_detectado', 0.0, i % sesiones + 1, {}
+        else:
+            datos = dict(zip(EMOCIONES, probabilidades[i].tolist()))
+            emocion = max(datos, key=datos.get)
+            yield i // sesiones, emocion, datos[emocion], i % sesiones + 1, datos
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el tamaño de la tabla de AnalisisEmocion y el tiempo de las consultas de agregación "
+        "con las probabilidades en un JSON por fila (antes) frente a siete columnas REAL (después). "
+        "Usa bases SQLite temporales con filas sintéticas; no toca la base de datos del proyecto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help="Filas sintéticas por tabla.")
+        parser.add_argument('--sessions', type=int, default=40, help="Sesiones entre las que se reparten las filas.")
+        parser.add_argument('--no-detected', type=float, default=0.1, help="Fracción de frames sin rostro.")
+        parser.add_argument('--repeat', type=int, default=5, help="Repeticiones de cada consulta.")
+        parser.add_argument('--json', dest='json_path', help="Guardar los resultados en este archivo JSON.")
+
+    def _crear(self, path, columnar, options):
+        conexion = sqlite3.connect(path)
+        conexion.execute(TABLA_COLUMNAS if columnar else TABLA_JSON)
+        conexion.execute(INDICE)
+        filas = _filas(options['rows'], options['sessions'], options['no_detected'])
+        started = time.perf_counter()
+        with conexion:
+            if columnar:
+                conexion.executemany(
+                    "INSERT INTO analisis (momento_segundo, emocion_predominante, confianza_emocion, sesion_id, "
+                    f"reutilizado, {', '.join(f'prob_{e}' for e in EMOCIONES)}) "
+                    f"VALUES (?, ?, ?, ?, 0, {', '.join('?' * len(EMOCIONES))})",
+                    ((m, e, c, s, *(d.get(x) for x in EMOCIONES)) for m, e, c, s, d in filas),
+                )
+            else:
+                conexion.executemany(
+                    "INSERT INTO analisis (momento_segundo, emocion_predominante, confianza_emocion, sesion_id, "
+                    "reutilizado, datos_raw_emociones) VALUES (?, ?, ?, ?, 0, ?)",
+                    ((m, e, c, s, json.dumps(d)) for m, e, c, s, d in filas),
+                )
+        insercion = time.perf_counter() - started
+        conexion.execute("VACUUM")
+        conexion.execute("ANALYZE")
+        return conexion, insercion
+
+    def _medir(self, conexion, sql, repeticiones):
+        conexion.execute(sql).fetchall() # Páginas ya en caché: se compara el costo de CPU
+        muestras = []
+        for _ in range(repeticiones):
+            started = time.perf_counter()
+            conexion.execute(sql).fetchall()
+            muestras.append(time.perf_counter() - started)
+        return summarize(muestras)
+
+    def handle(self, *args, **options):
+        resultados = {}
+        with tempfile.TemporaryDirectory() as directorio:
+            for clave, columnar in (('json', False), ('columnas', True)):
+                path = os.path.join(directorio, f'{clave}.sqlite3')
+                conexion, insercion = self._crear(path, columnar, options)
+                tabla = conexion.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name = 'analisis'"
+                ).fetchone()[0] if self._tiene_dbstat(conexion) else None
+                resultados[clave] = {
+                    'archivo_bytes': os.path.getsize(path),
+                    'tabla_bytes': tabla,
+                    'insercion_s': insercion,
+                    'consultas': {
+                        nombre: self._medir(conexion, antes if not columnar else despues, options['repeat'])
+                        for nombre, antes, despues in CONSULTAS
+                    },
+                }
+                conexion.close()
+
+        filas = options['rows']
+        antes, despues = resultados['json'], resultados['columnas']
+        self.stdout.write(f"{filas} filas en {options['sessions']} sesiones ({options['no_detected']:.0%} sin rostro)\n")
+        for etiqueta, clave in (("JSON (antes)", 'json'), ("Columnas (después)", 'columnas')):
+            r = resultados[clave]
+            tamano = r['tabla_bytes'] or r['archivo_bytes']
+            self.stdout.write(
+                f"{etiqueta:<20} {tamano / 1024 / 1024:8.2f} MiB ({tamano / filas:6.1f} bytes/fila)   "
+                f"inserción {filas / r['insercion_s']:10.0f} filas/s"
+            )
+        for nombre, _, _ in CONSULTAS:
+            self.stdout.write(f"\n{nombre}:")
+            self.stdout.write(format_summary("  JSON (antes)", antes['consultas'][nombre]))
+            self.stdout.write(format_summary("  Columnas (después)", despues['consultas'][nombre]))
+
+        tamano_antes = antes['tabla_bytes'] or antes['archivo_bytes']
+        tamano_despues = despues['tabla_bytes'] or despues['archivo_bytes']
+        self.stdout.write(self.style.SUCCESS(
+            f"\nTabla {(1 - tamano_despues / tamano_antes) * 100:.0f}% más pequeña; promedio por sesión "
+            f"{antes['consultas'][CONSULTAS[0][0]]['p50_ms'] / despues['consultas'][CONSULTAS[0][0]]['p50_ms']:.1f}x más rápido (p50)"
+        ))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'filas': filas, 'sesiones': options['sessions'], **resultados}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json_path']}"))
+
+    @staticmethod
+    def _tiene_dbstat(conexion):
+        # dbstat solo existe si SQLite se compiló con SQLITE_ENABLE_DBSTAT_VTAB; si no, se usa el tamaño del archivo
+        try:
+            conexion.execute("SELECT 1 FROM dbstat LIMIT 1")
+            return True
+        except sqlite3.OperationalError:
+            return False
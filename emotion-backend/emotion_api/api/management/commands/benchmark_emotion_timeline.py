@@ -0,0 +1,132 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.benchmarking import format_summary, summarize
+from api.models import AnalisisEmocion
+
+EMOCIONES = AnalisisEmocion.PROBABILIDADES
+
+# api_analisisemocion antes (solo el índice de la FK) y después (restricción única
+# (sesion_id, momento_segundo)) de la migración 0005, con las columnas de la 0004.
+TABLA = """
+CREATE TABLE analisis (
+    id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+    momento_segundo integer unsigned NOT NULL,
+    emocion_predominante varchar(20) NOT NULL,
+    confianza_emocion real NOT NULL,
+    sesion_id bigint NOT NULL,
+    reutilizado bool NOT NULL,
+    {}{}
+)
+"""
+COLUMNAS = ',\n    '.join(f'prob_{e} real NULL' for e in EMOCIONES)
+UNICA = ',\n    CONSTRAINT analisis_sesion_momento_unico UNIQUE (sesion_id, momento_segundo)'
+INDICE_FK = "CREATE INDEX analisis_sesion_id ON analisis (sesion_id)"
+
+INSERT = (
+    "INSERT INTO analisis (momento_segundo, emocion_predominante, confianza_emocion, sesion_id, reutilizado, "
+    f"{', '.join(f'prob_{e}' for e in EMOCIONES)}) VALUES (?, ?, ?, ?, 0, {', '.join('?' * len(EMOCIONES))})"
+)
+UPSERT = INSERT + (
+    " ON CONFLICT (sesion_id, momento_segundo) DO UPDATE SET emocion_predominante = excluded.emocion_predominante, "
+    "confianza_emocion = excluded.confianza_emocion, reutilizado = excluded.reutilizado, "
+    + ', '.join(f'prob_{e} = excluded.prob_{e}' for e in EMOCIONES)
+)
+
+# Lecturas de la línea de tiempo (las del endpoint analisis-emocion/?sesion=&desde=&hasta=)
+SESION = "SELECT * FROM analisis WHERE sesion_id = ? ORDER BY momento_segundo"
+RANGO = "SELECT * FROM analisis WHERE sesion_id = ? AND momento_segundo >= ? AND momento_segundo <= ? ORDER BY momento_segundo"
+
+
+def _filas(sesiones, segundos, seed=0):
+    """Como llegan en clase: en cada segundo, un frame de cada sesión (las filas de una sesión quedan dispersas)."""
+    rng = random.Random(seed)
+    for momento in range(segundos):
+        for sesion in range(1, sesiones + 1):
+            probabilidades = [rng.random() for _ in EMOCIONES]
+            total = sum(probabilidades)
+            probabilidades = [p / total for p in probabilidades]
+            i = max(range(len(EMOCIONES)), key=probabilidades.__getitem__)
+            yield (momento, EMOCIONES[i], probabilidades[i], sesion, *probabilidades)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara las lecturas de la línea de tiempo de una sesión (completa y por rango de segundos) y "
+        "el costo de escritura con solo el índice de la FK (antes) frente al índice único "
+        "(sesion_id, momento_segundo) con upsert (después). Usa bases SQLite temporales con millones "
+        "de filas sintéticas; no toca la base de datos del proyecto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=1000, help="Sesiones (alumnos) sintéticas.")
+        parser.add_argument('--seconds', type=int, default=2400, help="Segundos de cada sesión (un frame por segundo).")
+        parser.add_argument('--window', type=int, default=300, help="Segundos de la consulta por rango.")
+        parser.add_argument('--queries', type=int, default=50, help="Consultas de cada tipo (a sesiones al azar).")
+        parser.add_argument('--json', dest='json_path', help="Guardar los resultados en este archivo JSON.")
+
+    def _crear(self, path, unica, options):
+        conexion = sqlite3.connect(path)
+        conexion.execute(TABLA.format(COLUMNAS, UNICA if unica else ''))
+        conexion.execute(INDICE_FK)
+        started = time.perf_counter()
+        with conexion:
+            conexion.executemany(UPSERT if unica else INSERT, _filas(options['sessions'], options['seconds']))
+        insercion = time.perf_counter() - started
+        conexion.execute("ANALYZE")
+        return conexion, insercion
+
+    def _medir(self, conexion, sql, parametros):
+        muestras = []
+        filas = 0
+        for params in parametros:
+            started = time.perf_counter()
+            filas += len(conexion.execute(sql, params).fetchall())
+            muestras.append(time.perf_counter() - started)
+        return summarize(muestras), filas
+
+    def handle(self, *args, **options):
+        sesiones, segundos, ventana = options['sessions'], options['seconds'], options['window']
+        total = sesiones * segundos
+        rng = random.Random(1)
+        consultas = {
+            'sesion completa': (SESION, [(rng.randint(1, sesiones),) for _ in range(options['queries'])]),
+            f'rango de {ventana} s': (RANGO, [
+                (rng.randint(1, sesiones), desde, desde + ventana - 1)
+                for desde in (rng.randint(0, max(0, segundos - ventana)) for _ in range(options['queries']))
+            ]),
+        }
+
+        self.stdout.write(f"{total} filas ({sesiones} sesiones x {segundos} s)\n")
+        resultados = {}
+        with tempfile.TemporaryDirectory() as directorio:
+            for clave, etiqueta, unica in (('antes', 'Índice de la FK (antes)', False),
+                                           ('despues', 'Índice único + upsert (después)', True)):
+                conexion, insercion = self._crear(os.path.join(directorio, f'{clave}.sqlite3'), unica, options)
+                resultado = {'insercion_filas_s': total / insercion, 'consultas': {}, 'planes': {}}
+                self.stdout.write(f"{etiqueta}: inserción {total / insercion:.0f} filas/s")
+                for nombre, (sql, parametros) in consultas.items():
+                    plan = ' / '.join(fila[-1] for fila in conexion.execute('EXPLAIN QUERY PLAN ' + sql, parametros[0]))
+                    resumen, filas = self._medir(conexion, sql, parametros)
+                    resultado['consultas'][nombre] = {**resumen, 'filas_por_consulta': filas / len(parametros)}
+                    resultado['planes'][nombre] = plan
+                    self.stdout.write(format_summary(f"  {nombre}", resumen))
+                    self.stdout.write(f"    plan: {plan}")
+                conexion.close()
+                resultados[clave] = resultado
+
+        for nombre in consultas:
+            antes = resultados['antes']['consultas'][nombre]['p50_ms']
+            despues = resultados['despues']['consultas'][nombre]['p50_ms']
+            self.stdout.write(self.style.SUCCESS(f"{nombre}: {antes:.2f} -> {despues:.2f} ms p50 ({antes / despues:.1f}x)"))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'filas': total, 'sesiones': sesiones, 'segundos': segundos, **resultados}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json_path']}"))
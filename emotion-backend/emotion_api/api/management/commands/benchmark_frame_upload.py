@@ -0,0 +1,84 @@
+import base64
+import json
+import time
+
+import cv2
+from django.db import transaction
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from api.benchmarking import crear_sesiones_benchmark, load_frames, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara bytes en la red y CPU por frame entre emocion-detection/ (base64 en JSON) y "
+        "emocion-detection/frame/ (JPEG binario, cuerpo crudo o multipart). Las filas creadas se revierten."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames', type=int, default=50, help="Frames enviados por cada formato.")
+        parser.add_argument('--images-dir', help="Carpeta con imágenes reales (por defecto, frames sintéticos).")
+        parser.add_argument('--width', type=int, default=1280)
+        parser.add_argument('--height', type=int, default=720)
+        parser.add_argument('--quality', type=int, default=80, help="Calidad JPEG (el frontend usa 0.8).")
+
+    def _formatos(self):
+        # Cada formato devuelve (bytes enviados, función que hace la petición)
+        client = Client(HTTP_HOST='localhost')
+
+        def json_base64(sesion_id, jpeg, momento):
+            body = json.dumps({
+                'sesion_id': sesion_id,
+                'momento_segundo': momento,
+                'frame_base64': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode(),
+            })
+            return len(body), lambda: client.post('/api/emocion-detection/', data=body, content_type='application/json')
+
+        def binario(sesion_id, jpeg, momento):
+            return len(jpeg), lambda: client.post(
+                '/api/emocion-detection/frame/', data=jpeg, content_type='image/jpeg',
+                HTTP_X_SESION_ID=str(sesion_id), HTTP_X_MOMENTO_SEGUNDO=str(momento),
+            )
+
+        return {'JSON + base64': json_base64, 'binario (image/jpeg)': binario}
+
+    def handle(self, *args, **options):
+        frames = load_frames(options['images_dir'], count=options['frames'], width=options['width'], height=options['height'])
+        params = [cv2.IMWRITE_JPEG_QUALITY, options['quality']]
+        # Frames distintos entre sí para que la supresión de duplicados no altere la comparación
+        jpegs = [
+            cv2.imencode('.jpg', cv2.resize(f, (options['width'], options['height'])), params)[1].tobytes()
+            for f in frames
+        ]
+        total = options['frames']
+
+        with transaction.atomic():
+            sesiones = crear_sesiones_benchmark(2, prefijo='upload-bench')
+            resultados = {}
+            # Una sesión por formato para que el seguimiento y la supresión de duplicados no se mezclen
+            for (nombre, preparar), sesion in zip(self._formatos().items(), sesiones):
+                preparar(sesion.id, jpegs[0], 0)[1]() # Calentamiento (carga del modelo y del detector)
+                enviados, cpu, pared, codigos = [], [], [], {}
+                for i in range(total):
+                    n, peticion = preparar(sesion.id, jpegs[i % len(jpegs)], i + 1)
+                    c0, t0 = time.process_time(), time.perf_counter()
+                    respuesta = peticion()
+                    cpu.append(time.process_time() - c0)
+                    pared.append(time.perf_counter() - t0)
+                    enviados.append(n)
+                    codigos[respuesta.status_code] = codigos.get(respuesta.status_code, 0) + 1
+                resultados[nombre] = (sum(enviados) / len(enviados), summarize(cpu), summarize(pared), codigos)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Frames: {total}  Resolución: {options['width']}x{options['height']}  Calidad JPEG: {options['quality']}")
+        for nombre, (bytes_medios, cpu, pared, codigos) in resultados.items():
+            self.stdout.write(
+                f"{nombre:<22} {bytes_medios / 1024:8.1f} KiB/frame  CPU={cpu['mean_ms']:7.2f} ms/frame  "
+                f"pared p50={pared['p50_ms']:7.2f} ms  p95={pared['p95_ms']:7.2f} ms  respuestas={codigos}"
+            )
+        (b_json, cpu_json, _, _), (b_bin, cpu_bin, _, _) = resultados.values()
+        self.stdout.write(self.style.SUCCESS(
+            f"Binario: {100 * (1 - b_bin / b_json):.1f}% menos bytes y "
+            f"{cpu_json['mean_ms'] - cpu_bin['mean_ms']:.2f} ms menos de CPU por frame"
+        ))
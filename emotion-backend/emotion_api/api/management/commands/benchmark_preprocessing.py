@@ -0,0 +1,103 @@
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.benchmarking import caja_rostro, format_summary, load_frames, summarize
+from api.ml_model.detector import preprocesar_gris, preprocesar_rostro
+from api.ml_model.face_detector_pool import FaceDetectorPool
+from api.ml_model.pipeline import FrameEscalonado
+
+RESOLUCIONES = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+ETAPAS_ANTES = ('decodificación', 'BGR->RGB', 'detección', 'recorte+preproceso')
+ETAPAS_DESPUES = ('decodif. reducida', 'BGR->RGB', 'detección', 'recorte+preproceso')
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide por etapas el preprocesamiento de frames JPEG: decodificación completa + RGB del frame entero "
+        "(antes) frente a detección sobre una decodificación reducida y recorte a resolución completa solo "
+        "cuando hace falta (después)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames', type=int, default=50, help="Frames a procesar por resolución y modo.")
+        parser.add_argument('--images-dir', help="Carpeta con imágenes reales (se reescalan a cada resolución).")
+        parser.add_argument('--resolutions', nargs='+', default=list(RESOLUCIONES), choices=list(RESOLUCIONES))
+        parser.add_argument('--quality', type=int, default=80, help="Calidad JPEG (el frontend usa 0.8).")
+
+    def _encode(self, options, width, height):
+        frames = load_frames(options['images_dir'], width=width, height=height)
+        params = [cv2.IMWRITE_JPEG_QUALITY, options['quality']]
+        return [cv2.imencode('.jpg', cv2.resize(f, (width, height)), params)[1].tobytes() for f in frames]
+
+    def _antes(self, pool, data):
+        # Flujo anterior de la vista y del detector
+        t0 = time.perf_counter()
+        imagen = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        t1 = time.perf_counter()
+        rgb = cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB)
+        t2 = time.perf_counter()
+        results = pool.process(rgb)
+        t3 = time.perf_counter()
+        x, y, w, h = caja_rostro(results, imagen.shape)
+        preprocesar_rostro(imagen[y:y+h, x:x+w])
+        t4 = time.perf_counter()
+        return [t1 - t0, t2 - t1, t3 - t2, t4 - t3], False
+
+    def _despues(self, pool, data):
+        t0 = time.perf_counter()
+        frame = FrameEscalonado(data)
+        t1 = time.perf_counter()
+        rgb = cv2.cvtColor(frame.reducida, cv2.COLOR_BGR2RGB)
+        t2 = time.perf_counter()
+        results = pool.process(rgb)
+        t3 = time.perf_counter()
+        preprocesar_gris(frame.recorte_gris(caja_rostro(results, frame.reducida.shape)))
+        t4 = time.perf_counter()
+        return [t1 - t0, t2 - t1, t3 - t2, t4 - t3], frame.decodificado_completo
+
+    def _medir(self, fn, pool, encoded, total):
+        muestras = [[] for _ in range(4)]
+        completos = 0
+        for i in range(total):
+            tiempos, completo = fn(pool, encoded[i % len(encoded)])
+            completos += completo
+            for etapa, t in zip(muestras, tiempos):
+                etapa.append(t)
+        totales = [sum(ts) for ts in zip(*muestras)]
+        return [summarize(m) for m in muestras], summarize(totales), completos
+
+    def handle(self, *args, **options):
+        pool = FaceDetectorPool(size=1)
+        total = options['frames']
+        try:
+            for nombre in options['resolutions']:
+                width, height = RESOLUCIONES[nombre]
+                encoded = self._encode(options, width, height)
+                # Calentamiento de MediaPipe con ambos tamaños de entrada
+                self._antes(pool, encoded[0])
+                self._despues(pool, encoded[0])
+
+                antes, total_antes, _ = self._medir(self._antes, pool, encoded, total)
+                despues, total_despues, completos = self._medir(self._despues, pool, encoded, total)
+
+                factor = FrameEscalonado(encoded[0]).factor
+                self.stdout.write(f"\n{nombre} ({width}x{height}, JPEG {sum(map(len, encoded)) // len(encoded) // 1024} KiB, "
+                                  f"reducción 1/{factor}, recortes a resolución completa: {completos}/{total})")
+                for etapa, resumen in zip(ETAPAS_ANTES, antes):
+                    self.stdout.write(format_summary(f"  antes · {etapa}", resumen))
+                self.stdout.write(format_summary("  antes · total", total_antes))
+                for etapa, resumen in zip(ETAPAS_DESPUES, despues):
+                    self.stdout.write(format_summary(f"  después · {etapa}", resumen))
+                self.stdout.write(format_summary("  después · total", total_despues))
+                self.stdout.write(self.style.SUCCESS(
+                    f"  Aceleración media: {total_antes['mean_ms'] / total_despues['mean_ms']:.2f}x"
+                ))
+        finally:
+            pool.close()
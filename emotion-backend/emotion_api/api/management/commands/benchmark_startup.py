@@ -0,0 +1,56 @@
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.benchmarking import format_summary, summarize
+
+# Arranque medido: igual que manage.py, pero con argv[1] == '1' carga el modelo justo después de
+# django.setup(), como hacía antes el import del detector. Los dos modos pasan por aquí.
+ARRANQUE = (
+    "import os, sys\n"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emotion_api.settings')\n"
+    "import django\n"
+    "django.setup()\n"
+    "if sys.argv[1] == '1':\n"
+    "    from api.ml_model.detector import get_model\n"
+    "    get_model()\n"
+    "from django.core.management import execute_from_command_line\n"
+    "execute_from_command_line(['manage.py', *sys.argv[2:]])\n"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el tiempo de arranque de 'manage.py <comando>' con carga diferida del modelo "
+        "frente a la carga al importar (el comportamiento anterior)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--target', nargs='+', default=['check'], help="Comando de manage.py a medir.")
+
+    def _measure(self, eager, runs, target):
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run(
+                [sys.executable, '-c', ARRANQUE, '1' if eager else '0', *target],
+                cwd=settings.BASE_DIR, check=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            samples.append(time.perf_counter() - started)
+        return summarize(samples)
+
+    def handle(self, *args, **options):
+        runs, target = options['runs'], options['target']
+        self.stdout.write(f"Midiendo 'manage.py {' '.join(target)}' ({runs} ejecuciones por modo)...")
+        before = self._measure(True, runs, target)
+        after = self._measure(False, runs, target)
+        self.stdout.write(format_summary("Antes (carga al importar)", before))
+        self.stdout.write(format_summary("Después (carga diferida)", after))
+        self.stdout.write(self.style.SUCCESS(
+            f"Ahorro medio: {(before['mean_ms'] - after['mean_ms']) / 1000:.2f} s por arranque"
+        ))
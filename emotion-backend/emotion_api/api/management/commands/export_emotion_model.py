@@ -0,0 +1,67 @@
+import importlib.util
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ml_model.backends import BACKENDS, KerasBackend, default_model_path
+from api.ml_model.conversion import compare_backends, convert_to_onnx, convert_to_tflite, verification_inputs
+
+
+class Command(BaseCommand):
+    help = (
+        "Convierte raf_model.keras a TFLite (y opcionalmente ONNX) y verifica que las salidas "
+        "coincidan con el modelo Keras dentro de una tolerancia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=default_model_path('keras'), help="Modelo Keras de origen.")
+        parser.add_argument('--output-dir', default=os.path.dirname(default_model_path('keras')),
+                            help="Carpeta de salida (por defecto, api/ml_model).")
+        parser.add_argument('--onnx', action='store_true', help="Exportar también a ONNX (requiere tf2onnx y onnxruntime).")
+        parser.add_argument('--skip-tflite', action='store_true', help="No exportar a TFLite.")
+        parser.add_argument('--opset', type=int, default=13, help="Opset de ONNX.")
+        parser.add_argument('--tolerance', type=float, default=1e-4,
+                            help="Diferencia absoluta máxima permitida entre probabilidades.")
+        parser.add_argument('--samples', type=int, default=256, help="Entradas aleatorias usadas en la verificación.")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['source']):
+            raise CommandError(f"No existe el modelo de origen: {options['source']}")
+
+        reference = KerasBackend(options['source'])
+        inputs = verification_inputs(options['samples'])
+        base_name = os.path.splitext(os.path.basename(options['source']))[0]
+        os.makedirs(options['output_dir'], exist_ok=True)
+
+        targets = []
+        if not options['skip_tflite']:
+            path = os.path.join(options['output_dir'], f"{base_name}.tflite")
+            with open(path, 'wb') as f:
+                f.write(convert_to_tflite(reference.model))
+            targets.append(('tflite', path))
+
+        if options['onnx']:
+            if any(importlib.util.find_spec(paquete) is None for paquete in ('tf2onnx', 'onnxruntime')):
+                raise CommandError("La exportación a ONNX requiere 'pip install tf2onnx onnxruntime'.")
+            path = os.path.join(options['output_dir'], f"{base_name}.onnx")
+            convert_to_onnx(reference.model, path, opset=options['opset'])
+            targets.append(('onnx', path))
+
+        failed = []
+        for name, path in targets:
+            report = compare_backends(reference, BACKENDS[name](path), inputs)
+            line = (
+                f"{name:<7} {path}\n"
+                f"        tamaño={os.path.getsize(path) / 1024:.1f} KiB  "
+                f"max_abs_diff={report['max_abs_diff']:.2e}  top1={report['top1_agreement'] * 100:.2f}%"
+            )
+            if report['max_abs_diff'] <= options['tolerance']:
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(self.style.ERROR(line))
+                failed.append(name)
+
+        if failed:
+            raise CommandError(
+                f"Las salidas de {', '.join(failed)} difieren del modelo Keras más de {options['tolerance']}."
+            )
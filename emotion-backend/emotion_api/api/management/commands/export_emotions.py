@@ -0,0 +1,47 @@
+import sys
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import FORMATOS, analisis_a_exportar, lineas
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta los análisis de emociones (una fila por frame) a CSV o NDJSON, filtrando por materia, "
+        "actividad, alumno y fechas de inicio de la sesión. Las filas se leen por bloques y se escriben "
+        "a medida que llegan: la memoria no crece con el tamaño de la exportación."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--materia', type=int, help="ID de la materia.")
+        parser.add_argument('--actividad', type=int, help="ID de la actividad.")
+        parser.add_argument('--alumno', type=int, help="ID del alumno.")
+        parser.add_argument('--desde', type=date.fromisoformat, help="Sesiones iniciadas desde esta fecha (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=date.fromisoformat, help="Sesiones iniciadas hasta esta fecha (AAAA-MM-DD).")
+        parser.add_argument('--format', dest='formato', choices=sorted(FORMATOS), default='csv', help="Formato de salida.")
+        parser.add_argument('--output', help="Archivo de salida (por defecto, la salida estándar).")
+
+    def handle(self, *args, **options):
+        if options['desde'] and options['hasta'] and options['desde'] > options['hasta']:
+            raise CommandError("--desde no puede ser mayor que --hasta.")
+
+        filas = analisis_a_exportar(**{
+            clave: options[clave] for clave in ('materia', 'actividad', 'alumno', 'desde', 'hasta')
+        })
+        started = time.perf_counter()
+        total = -1 if options['formato'] == 'csv' else 0 # La primera línea del CSV es el encabezado
+        salida = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for linea in lineas(options['formato'], filas):
+                salida.write(linea)
+                total += 1
+        finally:
+            if options['output']:
+                salida.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{total} filas exportadas a {options['output']} en {time.perf_counter() - started:.1f} s."
+            ))
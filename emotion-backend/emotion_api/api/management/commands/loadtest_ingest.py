@@ -0,0 +1,298 @@
+import base64
+import http.client
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarking import borrar_sesiones_benchmark, crear_sesiones_benchmark, load_frames, summarize
+
+RUTAS = {
+    'json': '/api/emocion-detection/',
+    'binario': '/api/emocion-detection/frame/',
+}
+
+
+def _variantes(frame, n, seed, quality):
+    """
+    `n` JPEG de un mismo alumno: pequeños desplazamientos y ruido de sensor sobre su frame base,
+    como una webcam con el alumno casi quieto (la supresión de duplicados acierta a veces, no siempre).
+    """
+    rng = np.random.default_rng(seed)
+    h, w = frame.shape[:2]
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    jpegs = []
+    for _ in range(n):
+        dx, dy = rng.integers(-6, 7, size=2)
+        m = np.float32([[1, 0, dx], [0, 1, dy]])
+        movido = cv2.warpAffine(frame, m, (w, h), borderMode=cv2.BORDER_REPLICATE)
+        ruido = rng.normal(0, 3, size=movido.shape)
+        jpegs.append(cv2.imencode('.jpg', np.clip(movido + ruido, 0, 255).astype(np.uint8), params)[1].tobytes())
+    return jpegs
+
+
+class _ClienteLocal:
+    """Peticiones al Django de este mismo proceso (django.test.Client), sin servidor HTTP."""
+
+    def __init__(self, timeout):
+        from django.test import Client
+        self._client = Client(HTTP_HOST='localhost')
+
+    def post(self, ruta, body, headers):
+        extra = {f"HTTP_{k.upper().replace('-', '_')}": v for k, v in headers.items() if k != 'Content-Type'}
+        return self._client.post(ruta, data=body, content_type=headers['Content-Type'], **extra).status_code
+
+    def cerrar(self):
+        # Cada hilo de alumno abre su propia conexión a la base de datos
+        from django.db import connection
+        connection.close()
+
+
+class _ClienteHTTP:
+    """Conexión keep-alive a un servidor (runserver, gunicorn, uvicorn), como un navegador."""
+
+    def __init__(self, url, timeout):
+        partes = urlsplit(url)
+        clase = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+        self._nueva = lambda: clase(partes.hostname, partes.port, timeout=timeout)
+        self._conn = self._nueva()
+
+    def post(self, ruta, body, headers):
+        try:
+            self._conn.request('POST', ruta, body=body, headers=headers)
+            respuesta = self._conn.getresponse()
+            respuesta.read()
+            return respuesta.status
+        except (http.client.HTTPException, OSError):
+            self._conn.close()
+            self._conn = self._nueva() # La siguiente petición abre otra conexión
+            raise
+
+    def cerrar(self):
+        self._conn.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generador de carga en lazo cerrado para la recepción de frames: cada alumno simulado envía un frame, "
+        "espera la respuesta y el resto del intervalo de captura del frontend (1500 ms). La carga sube por "
+        "etapas hasta encontrar el punto de saturación. Sin --url usa el Django de este proceso; con --url, "
+        "un servidor local que comparta la base de datos. Crea sesiones de prueba y las borra al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Servidor a probar, ej. http://127.0.0.1:8000 (por defecto, en proceso).")
+        parser.add_argument('--endpoint', choices=list(RUTAS), default='json',
+                            help="json: emocion-detection/ en base64 como el frontend; binario: emocion-detection/frame/.")
+        parser.add_argument('--students', nargs='+', type=int,
+                            help="Etapas fijas de alumnos simultáneos (en lugar de la rampa automática).")
+        parser.add_argument('--start', type=int, default=5, help="Alumnos de la primera etapa de la rampa.")
+        parser.add_argument('--factor', type=float, default=2.0, help="Multiplicador de alumnos entre etapas.")
+        parser.add_argument('--max-students', type=int, default=640)
+        parser.add_argument('--refine', type=int, default=3,
+                            help="Etapas extra de búsqueda binaria entre la última etapa sana y la saturada.")
+        parser.add_argument('--stage-seconds', type=float, default=30.0, help="Duración de cada etapa.")
+        parser.add_argument('--interval-ms', type=int, default=1500, help="Intervalo de captura del frontend.")
+        parser.add_argument('--max-error-rate', type=float, default=0.01, help="Tasa de errores que se considera saturación.")
+        parser.add_argument('--images-dir', help="Carpeta con imágenes reales (por defecto, frames sintéticos).")
+        parser.add_argument('--width', type=int, default=640)
+        parser.add_argument('--height', type=int, default=480)
+        parser.add_argument('--quality', type=int, default=80, help="Calidad JPEG (el frontend usa 0.8).")
+        parser.add_argument('--variants', type=int, default=8, help="Frames distintos por alumno.")
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--json', dest='json_path', help="Guardar los resultados de cada etapa en este archivo JSON.")
+
+    # --- Peticiones ---
+
+    def _peticion(self, sesion_id, momento, jpeg):
+        if self.options['endpoint'] == 'json':
+            body = json.dumps({
+                'sesion_id': sesion_id,
+                'momento_segundo': momento,
+                'frame_base64': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii'),
+            }).encode()
+            return body, {'Content-Type': 'application/json'}
+        return jpeg, {'Content-Type': 'image/jpeg', 'X-Sesion-Id': str(sesion_id), 'X-Momento-Segundo': str(momento)}
+
+    def _cliente(self):
+        if self.options['url']:
+            return _ClienteHTTP(self.options['url'], self.options['timeout'])
+        return _ClienteLocal(self.options['timeout'])
+
+    def _alumno(self, indice, sesion_id, fin, muestras, lock):
+        intervalo = self.options['interval_ms'] / 1000.0
+        jpegs = self.variantes[indice % len(self.variantes)]
+        cliente = self._cliente()
+        # Arranques escalonados dentro del primer intervalo, como alumnos que entran a distintos tiempos
+        time.sleep((indice * 0.618 % 1.0) * intervalo)
+        inicio_sesion = time.perf_counter()
+        propias = [] # (envío, latencia, código HTTP o None si falló la conexión)
+        n = 0
+        try:
+            while time.perf_counter() < fin:
+                momento = int(time.perf_counter() - inicio_sesion)
+                body, headers = self._peticion(sesion_id, momento, jpegs[n % len(jpegs)])
+                n += 1
+                t0 = time.perf_counter()
+                try:
+                    codigo = cliente.post(RUTAS[self.options['endpoint']], body, headers)
+                except Exception:
+                    codigo = None
+                latencia = time.perf_counter() - t0
+                propias.append((t0, latencia, codigo))
+                # Lazo cerrado: el siguiente frame sale un intervalo después del anterior, o al responder si tardó más
+                time.sleep(max(0.0, intervalo - latencia))
+        finally:
+            cliente.cerrar()
+        with lock:
+            muestras.extend(propias)
+
+    def _calentar_servidor(self):
+        # Un frame antes de medir: el servidor carga el modelo en la primera detección
+        prefijo = f'ingestload-{uuid.uuid4().hex[:8]}'
+        sesion = crear_sesiones_benchmark(1, prefijo=prefijo)[0]
+        cliente = self._cliente()
+        try:
+            body, headers = self._peticion(sesion.id, 0, self.variantes[0][0])
+            codigo = cliente.post(RUTAS[self.options['endpoint']], body, headers)
+        except Exception as e:
+            raise CommandError(f"No se pudo contactar con {self.options['url']}: {e}")
+        finally:
+            cliente.cerrar()
+            borrar_sesiones_benchmark(prefijo)
+        if codigo >= 400:
+            raise CommandError(f"El servidor respondió {codigo} al frame de calentamiento.")
+
+    # --- Etapas ---
+
+    def _etapa(self, alumnos):
+        intervalo = self.options['interval_ms'] / 1000.0
+        prefijo = f'ingestload-{uuid.uuid4().hex[:8]}'
+        sesiones = crear_sesiones_benchmark(alumnos, prefijo=prefijo)
+        muestras = []
+        lock = threading.Lock()
+        inicio = time.perf_counter()
+        fin = inicio + self.options['stage_seconds']
+        try:
+            with ThreadPoolExecutor(max_workers=alumnos) as executor:
+                for i, sesion in enumerate(sesiones):
+                    executor.submit(self._alumno, i, sesion.id, fin, muestras, lock)
+        finally:
+            borrar_sesiones_benchmark(prefijo)
+
+        # Régimen estable: desde que entró el último alumno (primer intervalo) hasta el final de la etapa
+        ventana = [m for m in muestras if m[0] >= inicio + intervalo]
+        segundos = max(fin - inicio - intervalo, 1e-9)
+        codigos = {}
+        for _, _, codigo in ventana:
+            clave = str(codigo) if codigo is not None else 'conexion'
+            codigos[clave] = codigos.get(clave, 0) + 1
+        correctas = sum(1 for _, _, c in ventana if c is not None and c < 400)
+        etapa = {
+            'alumnos': alumnos,
+            'fps_ofrecidos': alumnos / intervalo,
+            'fps_sostenidos': correctas / segundos,
+            'latencia': summarize([lat for _, lat, c in ventana if c is not None]),
+            'tasa_errores': (len(ventana) - correctas) / len(ventana) if ventana else 1.0,
+            'codigos': dict(sorted(codigos.items())),
+        }
+        etapa['saturada'] = self._saturada(etapa, intervalo)
+        return etapa
+
+    def _saturada(self, etapa, intervalo):
+        # Saturación: el servidor no sostiene el ritmo del frontend, o responde con errores
+        motivos = []
+        if etapa['fps_sostenidos'] < 0.9 * etapa['fps_ofrecidos']:
+            motivos.append('throughput')
+        if etapa['latencia'].get('n') and etapa['latencia']['p95_ms'] > intervalo * 1000.0:
+            motivos.append('latencia p95 > intervalo')
+        if etapa['tasa_errores'] > self.options['max_error_rate']:
+            motivos.append('errores')
+        return motivos
+
+    def _imprimir(self, etapa):
+        lat = etapa['latencia']
+        linea = (
+            f"{etapa['alumnos']:>5} alumnos  ofrecidos={etapa['fps_ofrecidos']:7.1f} fps  "
+            f"sostenidos={etapa['fps_sostenidos']:7.1f} fps  "
+        )
+        if lat.get('n'):
+            linea += f"p50={lat['p50_ms']:7.1f} ms  p95={lat['p95_ms']:7.1f} ms  p99={lat['p99_ms']:7.1f} ms  "
+        linea += f"errores={100 * etapa['tasa_errores']:5.1f}%"
+        if etapa['saturada']:
+            self.stdout.write(self.style.WARNING(f"{linea}  SATURADA ({', '.join(etapa['saturada'])})"))
+        else:
+            self.stdout.write(linea)
+
+    def handle(self, *args, **options):
+        self.options = options
+        if options['url'] and urlsplit(options['url']).scheme not in ('http', 'https'):
+            raise CommandError("--url debe empezar por http:// o https://")
+
+        frames = load_frames(options['images_dir'], width=options['width'], height=options['height'])
+        frames = [cv2.resize(f, (options['width'], options['height'])) for f in frames]
+        self.variantes = [_variantes(f, options['variants'], i, options['quality']) for i, f in enumerate(frames)]
+
+        if not options['url']:
+            # En proceso: cargar el modelo antes de medir para que la primera etapa no pague la carga
+            from api.ml_model.detector import warmup
+            warmup()
+        else:
+            self._calentar_servidor()
+
+        destino = options['url'] or 'en proceso'
+        self.stdout.write(
+            f"Destino: {destino}  endpoint: {RUTAS[options['endpoint']]}  intervalo: {options['interval_ms']} ms  "
+            f"etapas de {options['stage_seconds']:.0f} s"
+        )
+
+        etapas = []
+        if options['students']:
+            for alumnos in options['students']:
+                etapas.append(self._etapa(alumnos))
+                self._imprimir(etapas[-1])
+        else:
+            # Rampa geométrica hasta la primera etapa saturada y luego búsqueda binaria
+            alumnos = options['start']
+            sana, saturada = None, None
+            while alumnos <= options['max_students']:
+                etapas.append(self._etapa(alumnos))
+                self._imprimir(etapas[-1])
+                if etapas[-1]['saturada']:
+                    saturada = alumnos
+                    break
+                sana = alumnos
+                alumnos = max(alumnos + 1, int(alumnos * options['factor']))
+            for _ in range(options['refine']):
+                if sana is None or saturada is None or saturada - sana <= 1:
+                    break
+                alumnos = (sana + saturada) // 2
+                etapas.append(self._etapa(alumnos))
+                self._imprimir(etapas[-1])
+                if etapas[-1]['saturada']:
+                    saturada = alumnos
+                else:
+                    sana = alumnos
+
+        sanas = [e for e in etapas if not e['saturada']]
+        if sanas:
+            mejor = max(sanas, key=lambda e: e['alumnos'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Capacidad: {mejor['alumnos']} alumnos simultáneos "
+                f"({mejor['fps_sostenidos']:.1f} frames/s, p95={mejor['latencia'].get('p95_ms', 0):.1f} ms)"
+            ))
+        else:
+            self.stdout.write(self.style.ERROR("Todas las etapas saturaron; pruebe con menos alumnos (--start)."))
+        if not options['students'] and not any(e['saturada'] for e in etapas):
+            self.stdout.write("No se alcanzó la saturación; suba --max-students.")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'destino': destino, 'endpoint': options['endpoint'], 'etapas': etapas}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json_path']}"))
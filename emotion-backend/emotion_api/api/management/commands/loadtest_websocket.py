@@ -0,0 +1,154 @@
+import asyncio
+import importlib.util
+import json
+import random
+import time
+import uuid
+
+import cv2
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarking import borrar_sesiones_benchmark, crear_sesiones_benchmark, load_frames, summarize
+from api.websocket import CABECERA_BYTES
+
+
+class _ConexionLocal:
+    """Cliente WebSocket en el mismo proceso: habla ASGI directamente con emotion_api.asgi.application."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    async def abrir(self, path):
+        from asgiref.testing import ApplicationCommunicator
+        from emotion_api.asgi import application
+        scope = {'type': 'websocket', 'path': path, 'query_string': b'', 'headers': [], 'subprotocols': []}
+        self._comm = ApplicationCommunicator(application, scope)
+        await self._comm.send_input({'type': 'websocket.connect'})
+        respuesta = await self._comm.receive_output(self.timeout)
+        if respuesta['type'] != 'websocket.accept':
+            raise ConnectionError(f"Conexión rechazada (código {respuesta.get('code')})")
+
+    async def enviar(self, data):
+        await self._comm.send_input({'type': 'websocket.receive', 'bytes': data})
+
+    async def recibir(self):
+        return (await self._comm.receive_output(self.timeout))['text']
+
+    async def cerrar(self):
+        await self._comm.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self._comm.wait(self.timeout)
+
+
+class _ConexionRed:
+    """Cliente WebSocket real contra un servidor ASGI (requiere el paquete 'websockets')."""
+
+    def __init__(self, url, timeout):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    async def abrir(self, path):
+        import websockets
+        self._ws = await asyncio.wait_for(websockets.connect(self.url + path, max_size=None), self.timeout)
+
+    async def enviar(self, data):
+        await self._ws.send(data)
+
+    async def recibir(self):
+        return await asyncio.wait_for(self._ws.recv(), self.timeout)
+
+    async def cerrar(self):
+        await self._ws.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga del canal WebSocket /ws/sesiones/<id>/: abre cientos de sesiones concurrentes que "
+        "envían un frame cada --interval-ms y mide la latencia hasta recibir el resultado. Sin --url se usa "
+        "la aplicación ASGI en este mismo proceso. Crea sesiones de prueba y las borra al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=200, help="Sesiones (sockets) concurrentes.")
+        parser.add_argument('--frames', type=int, default=10, help="Frames por sesión.")
+        parser.add_argument('--interval-ms', type=int, default=1500, help="Intervalo entre frames (el frontend usa 1500 ms).")
+        parser.add_argument('--url', help="Servidor ASGI, ej. ws://127.0.0.1:8000 (requiere 'pip install websockets').")
+        parser.add_argument('--images-dir', help="Carpeta con imágenes reales (por defecto, frames sintéticos).")
+        parser.add_argument('--width', type=int, default=640)
+        parser.add_argument('--height', type=int, default=480)
+        parser.add_argument('--quality', type=int, default=80)
+        parser.add_argument('--timeout', type=float, default=30.0, help="Segundos máximos de espera por respuesta.")
+
+    def _conexion(self, options):
+        if not options['url']:
+            return _ConexionLocal(options['timeout'])
+        if importlib.util.find_spec('websockets') is None:
+            raise CommandError("--url requiere el paquete 'websockets' (pip install websockets).")
+        return _ConexionRed(options['url'], options['timeout'])
+
+    async def _cliente(self, options, sesion_id, jpegs, stats):
+        intervalo = options['interval_ms'] / 1000.0
+        conexion = self._conexion(options)
+        # Arranques escalonados dentro del primer intervalo, como alumnos que entran a distintos tiempos
+        await asyncio.sleep(random.uniform(0, intervalo))
+        try:
+            await conexion.abrir(f'/ws/sesiones/{sesion_id}/')
+        except Exception as e:
+            stats['errores_conexion'].append(str(e))
+            return
+        try:
+            for momento in range(options['frames']):
+                inicio = time.perf_counter()
+                jpeg = jpegs[(sesion_id + momento) % len(jpegs)]
+                await conexion.enviar(momento.to_bytes(CABECERA_BYTES, 'big') + jpeg)
+                respuesta = await conexion.recibir()
+                latencia = time.perf_counter() - inicio
+                stats['latencias'].append(latencia)
+                codigo = str(json.loads(respuesta).get('status'))
+                stats['codigos'][codigo] = stats['codigos'].get(codigo, 0) + 1
+                await asyncio.sleep(max(0.0, intervalo - latencia))
+        except Exception as e:
+            stats['errores_envio'].append(repr(e))
+        finally:
+            try:
+                await conexion.cerrar()
+            except Exception:
+                pass
+
+    async def _ejecutar(self, options, sesiones, jpegs, stats):
+        await asyncio.gather(*(self._cliente(options, s.id, jpegs, stats) for s in sesiones))
+
+    def handle(self, *args, **options):
+        frames = load_frames(options['images_dir'], width=options['width'], height=options['height'])
+        params = [cv2.IMWRITE_JPEG_QUALITY, options['quality']]
+        jpegs = [cv2.imencode('.jpg', cv2.resize(f, (options['width'], options['height'])), params)[1].tobytes() for f in frames]
+
+        if not options['url']:
+            # En proceso: cargar el modelo antes de medir para que los primeros frames no paguen la carga
+            from api.ml_model.detector import warmup
+            warmup()
+
+        prefijo = f'wsload-{uuid.uuid4().hex[:8]}'
+        sesiones = crear_sesiones_benchmark(options['sessions'], prefijo=prefijo)
+        stats = {'latencias': [], 'codigos': {}, 'errores_conexion': [], 'errores_envio': []}
+        self.stdout.write(f"{len(sesiones)} sesiones x {options['frames']} frames cada {options['interval_ms']} ms "
+                          f"({'servidor ' + options['url'] if options['url'] else 'en proceso'})...")
+        inicio = time.perf_counter()
+        try:
+            asyncio.run(self._ejecutar(options, sesiones, jpegs, stats))
+        finally:
+            duracion = time.perf_counter() - inicio
+            borrar_sesiones_benchmark(prefijo)
+
+        resumen = summarize(stats['latencias'])
+        intervalo = options['interval_ms'] / 1000.0
+        atrasados = sum(1 for t in stats['latencias'] if t > intervalo)
+        self.stdout.write(f"Respuestas: {resumen['n']} en {duracion:.1f} s ({resumen['n'] / duracion:.1f} frames/s)  códigos={stats['codigos']}")
+        if resumen['n']:
+            self.stdout.write(
+                f"Latencia: media={resumen['mean_ms']:.1f} ms  p50={resumen['p50_ms']:.1f} ms  "
+                f"p95={resumen['p95_ms']:.1f} ms  p99={resumen['p99_ms']:.1f} ms  max={resumen['max_ms']:.1f} ms"
+            )
+            self.stdout.write(f"Frames que superaron el intervalo de {options['interval_ms']} ms: {atrasados}")
+        for clave in ('errores_conexion', 'errores_envio'):
+            if stats[clave]:
+                self.stdout.write(self.style.WARNING(f"{clave}: {len(stats[clave])} (ej. {stats[clave][0]})"))
@@ -0,0 +1,115 @@
+import json
+import math
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ml_model.backends import KerasBackend, TFLiteBackend, default_model_path
+from api.ml_model.conversion import agreement_report, convert_to_tflite_int8, load_face_crops
+from api.ml_model.detector import EMOTION_LABELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Cuantiza raf_model.keras a INT8 (TFLite) calibrando con una carpeta de recortes de rostros "
+        "y escribe un reporte de acuerdo por clase con el modelo float. Rechaza la cuantización si "
+        "el acuerdo queda por debajo de los umbrales."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('calibration_dir', help="Carpeta con recortes de rostros para calibrar.")
+        parser.add_argument('--eval-dir', help="Carpeta de rostros para el reporte. Si no se indica, se aparta "
+                                               "--holdout de la carpeta de calibración, que no se usa para calibrar.")
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help="Fracción de la carpeta de calibración reservada para el reporte si no hay --eval-dir.")
+        parser.add_argument('--source', default=default_model_path('keras'))
+        parser.add_argument('--output', default=default_model_path('tflite', 'int8'))
+        parser.add_argument('--report', help="Ruta del reporte JSON (por defecto, <output>.report.json).")
+        parser.add_argument('--max-calibration', type=int, default=500, help="Máximo de rostros usados para calibrar.")
+        parser.add_argument('--min-agreement', type=float, default=0.95,
+                            help="Acuerdo top-1 global mínimo con el modelo float.")
+        parser.add_argument('--min-class-agreement', type=float, default=0.90,
+                            help="Acuerdo mínimo por emoción (solo clases con al menos --min-class-samples).")
+        parser.add_argument('--min-class-samples', type=int, default=20)
+        parser.add_argument('--force', action='store_true', help="Conservar el modelo aunque no pase los umbrales.")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['source']):
+            raise CommandError(f"No existe el modelo de origen: {options['source']}")
+
+        if options['eval_dir']:
+            calibration = load_face_crops(options['calibration_dir'], limit=options['max_calibration'])
+            evaluation = load_face_crops(options['eval_dir'])
+            if not len(evaluation):
+                raise CommandError(f"No se encontraron imágenes en {options['eval_dir']}")
+        else:
+            # El acuerdo medido sobre las mismas imágenes de la calibración sale inflado: se reserva una parte
+            if not 0 < options['holdout'] < 1:
+                raise CommandError("--holdout debe estar entre 0 y 1.")
+            crops = load_face_crops(
+                options['calibration_dir'], limit=math.ceil(options['max_calibration'] / (1 - options['holdout']))
+            )
+            crops = crops[np.random.default_rng(0).permutation(len(crops))]
+            n_eval = math.ceil(len(crops) * options['holdout'])
+            evaluation, calibration = crops[:n_eval], crops[n_eval:n_eval + options['max_calibration']]
+            if len(crops) and not len(calibration):
+                raise CommandError("No quedan rostros para calibrar tras apartar --holdout; use --eval-dir.")
+        if not len(calibration):
+            raise CommandError(f"No se encontraron imágenes en {options['calibration_dir']}")
+        self.stdout.write(f"Calibrando con {len(calibration)} rostros, evaluando con {len(evaluation)}...")
+
+        reference = KerasBackend(options['source'])
+        with open(options['output'], 'wb') as f:
+            f.write(convert_to_tflite_int8(reference.model, calibration))
+        candidate = TFLiteBackend(options['output'])
+        if not candidate.quantized:
+            raise CommandError("El modelo generado no tiene entrada INT8.")
+
+        report = agreement_report(reference.predict(evaluation), candidate.predict(evaluation), EMOTION_LABELS)
+        report.update({
+            'source': options['source'],
+            'output': options['output'],
+            'source_size_bytes': os.path.getsize(options['source']),
+            'output_size_bytes': os.path.getsize(options['output']),
+            'calibration_samples': int(len(calibration)),
+            'evaluation_samples': int(len(evaluation)),
+            'evaluation': options['eval_dir'] or f"holdout {options['holdout']:.0%} de {options['calibration_dir']}",
+            'thresholds': {
+                'min_agreement': options['min_agreement'],
+                'min_class_agreement': options['min_class_agreement'],
+                'min_class_samples': options['min_class_samples'],
+            },
+        })
+
+        failures = []
+        if report['top1_agreement'] < options['min_agreement']:
+            failures.append(f"acuerdo global {report['top1_agreement']:.3f} < {options['min_agreement']}")
+        for label in EMOTION_LABELS:
+            stats = report['per_class'][label]
+            agreement = '-' if stats['agreement'] is None else f"{stats['agreement'] * 100:6.2f}%"
+            self.stdout.write(f"  {label:<10} n={stats['n']:<5} acuerdo={agreement}")
+            if stats['n'] >= options['min_class_samples'] and stats['agreement'] < options['min_class_agreement']:
+                failures.append(f"acuerdo de '{label}' {stats['agreement']:.3f} < {options['min_class_agreement']}")
+        report['accepted'] = not failures
+        report['failures'] = failures
+
+        report_path = options['report'] or f"{options['output']}.report.json"
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(
+            f"Acuerdo top-1: {report['top1_agreement'] * 100:.2f}%  "
+            f"Tamaño: {report['source_size_bytes'] / 1024:.1f} KiB -> {report['output_size_bytes'] / 1024:.1f} KiB  "
+            f"Reporte: {report_path}"
+        )
+
+        if failures:
+            if options['force']:
+                self.stdout.write(self.style.WARNING("Umbrales no superados (--force): " + "; ".join(failures)))
+                return
+            os.remove(options['output'])
+            raise CommandError("Cuantización rechazada: " + "; ".join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            f"Modelo INT8 aceptado: {options['output']}. "
+            "Actívalo con EMOCION_INFERENCE_BACKEND = 'tflite' y EMOCION_MODEL_VARIANT = 'int8'."
+        ))
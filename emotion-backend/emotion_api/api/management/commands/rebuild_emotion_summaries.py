@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import CeldaEmocionSesion, ResumenEmocionSesion, SesionActividad
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula desde AnalisisEmocion los resúmenes de emociones por sesión (ResumenEmocionSesion) "
+        "y las celdas del mapa de calor de las actividades (CeldaEmocionSesion). "
+        "Sirve para el backfill y para corregir un resumen tras cambios hechos directamente en la base "
+        "de datos. Las sesiones se procesan por lotes, cada uno en su propia transacción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sesion-id', type=int, nargs='+', help="Solo estas sesiones.")
+        parser.add_argument('--actividad-id', type=int, help="Solo las sesiones de esta actividad.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Sesiones por transacción.")
+
+    def handle(self, *args, **options):
+        sesiones = SesionActividad.objects.order_by('id')
+        if options['sesion_id']:
+            sesiones = sesiones.filter(id__in=options['sesion_id'])
+        if options['actividad_id']:
+            sesiones = sesiones.filter(actividad_id=options['actividad_id'])
+        ids = list(sesiones.values_list('id', flat=True))
+
+        started = time.perf_counter()
+        resumenes = celdas = 0
+        for i in range(0, len(ids), options['batch_size']):
+            lote = ids[i:i + options['batch_size']]
+            resumenes += ResumenEmocionSesion.objects.reconstruir(lote)
+            celdas += CeldaEmocionSesion.objects.reconstruir(lote)
+            self.stdout.write(f"  {min(i + len(lote), len(ids))}/{len(ids)} sesiones")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumenes} resúmenes y {celdas} celdas recalculados ({len(ids)} sesiones) "
+            f"en {time.perf_counter() - started:.1f} s."
+        ))
@@ -0,0 +1,43 @@
+import signal
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ml_model.inference_service import InferenceService, service_config
+
+
+class Command(BaseCommand):
+    help = (
+        "Arranca el servicio local de inferencia (pool de procesos que cargan el modelo). "
+        "Se usa junto a Django con EMOCION_INFERENCE_SERVICE['ENABLED'] = True."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Procesos de inferencia (por defecto, WORKERS de settings).")
+        parser.add_argument('--threads-per-worker', type=int, help="Hilos por proceso (por defecto, THREADS_PER_WORKER).")
+
+    def handle(self, *args, **options):
+        config = service_config()
+        try:
+            service = InferenceService(
+                config['ADDRESS'],
+                config['AUTHKEY'],
+                workers=options['workers'] or config['WORKERS'],
+                threads_per_worker=options['threads_per_worker'] or config['THREADS_PER_WORKER'],
+                timeout=config['TIMEOUT_SECONDS'],
+            )
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+        service.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"Servicio de inferencia escuchando en {service.address} "
+            f"({service.workers} workers x {service.threads_per_worker} hilos). Ctrl+C para detener."
+        ))
+        stop.wait()
+        self.stdout.write("Deteniendo el servicio de inferencia...")
+        service.stop()
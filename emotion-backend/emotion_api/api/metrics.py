@@ -0,0 +1,214 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Métricas del proceso en formato de texto de Prometheus (GET /api/metrics/).
+#
+# Implementación mínima sin dependencias: contadores, histogramas y valores instantáneos con
+# etiquetas. Cada proceso (worker de gunicorn/uvicorn, servicio de inferencia) tiene las suyas;
+# Prometheus debe consultar cada proceso por separado o agregarlas con las etiquetas de la instancia.
+
+# Límites (segundos) de los histogramas de latencia
+LATENCIA_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONSULTAS_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ''
+    pares = ','.join(
+        '{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for n, v in zip(nombres, valores)
+    )
+    return '{' + pares + '}'
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Counter:
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1, **etiquetas):
+        clave = tuple(etiquetas[n] for n in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def muestras(self):
+        with self._lock:
+            valores = dict(self._valores)
+        for clave, valor in sorted(valores.items()):
+            yield self.nombre, _etiquetas(self.etiquetas, clave), valor
+
+
+class Histogram:
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=LATENCIA_BUCKETS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {} # etiquetas -> [conteo por bucket (no acumulado) + inf, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, valor, **etiquetas):
+        clave = tuple(etiquetas[n] for n in self.etiquetas)
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def time(self, **etiquetas):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **etiquetas)
+
+    def muestras(self):
+        with self._lock:
+            series = {k: ([*v[0]], v[1], v[2]) for k, v in self._series.items()}
+        nombres_le = self.etiquetas + ('le',)
+        for clave, (conteos, suma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float('inf'),), conteos):
+                acumulado += conteo
+                yield f'{self.nombre}_bucket', _etiquetas(nombres_le, clave + (_numero(limite),)), acumulado
+            yield f'{self.nombre}_sum', _etiquetas(self.etiquetas, clave), suma
+            yield f'{self.nombre}_count', _etiquetas(self.etiquetas, clave), total
+
+
+class _Registro:
+    def __init__(self):
+        self._metricas = []
+        self._colectores = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def colector(self, fn):
+        """fn() devuelve [(nombre, ayuda, tipo, {etiquetas: valor})]; se evalúa en cada consulta."""
+        self._colectores.append(fn)
+        return fn
+
+    def render(self):
+        lineas = []
+        for metrica in self._metricas:
+            lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+            lineas.extend(f'{nombre}{etiquetas} {_numero(valor)}' for nombre, etiquetas, valor in metrica.muestras())
+        for colector in self._colectores:
+            try:
+                familias = colector()
+            except Exception:
+                continue # Un componente con error no debe tumbar el endpoint completo
+            for nombre, ayuda, tipo, valores in familias:
+                lineas.append(f'# HELP {nombre} {ayuda}')
+                lineas.append(f'# TYPE {nombre} {tipo}')
+                for etiquetas, valor in valores.items():
+                    nombres = tuple(n for n, _ in etiquetas)
+                    lineas.append(f'{nombre}{_etiquetas(nombres, [v for _, v in etiquetas])} {_numero(valor)}')
+        return '\n'.join(lineas) + '\n'
+
+
+REGISTRO = _Registro()
+
+ETAPA_SEGUNDOS = REGISTRO.registrar(Histogram(
+    'emociones_etapa_segundos', 'Duración de cada etapa del análisis de un frame.', ('etapa',)
+))
+RESULTADOS = REGISTRO.registrar(Counter(
+    'emociones_frames_total', 'Frames analizados por resultado.', ('resultado',)
+))
+PETICION_SEGUNDOS = REGISTRO.registrar(Histogram(
+    'emociones_http_peticion_segundos', 'Latencia de las peticiones HTTP por endpoint.', ('endpoint', 'metodo', 'codigo')
+))
+PETICION_CONSULTAS = REGISTRO.registrar(Histogram(
+    'emociones_http_consultas_db', 'Consultas a la base de datos por petición HTTP.', ('endpoint',),
+    buckets=CONSULTAS_BUCKETS,
+))
+
+_habilitado = None
+
+
+def habilitado():
+    global _habilitado
+    if _habilitado is None:
+        from django.conf import settings
+        _habilitado = getattr(settings, 'EMOCION_METRICS', {}).get('ENABLED', True)
+    return _habilitado
+
+
+def medir_etapa(etapa):
+    """Context manager que observa la duración de una etapa del análisis (no hace nada si está desactivado)."""
+    if not habilitado():
+        return nullcontext()
+    return ETAPA_SEGUNDOS.time(etapa=etapa)
+
+
+def contar_resultado(resultado):
+    if habilitado():
+        RESULTADOS.inc(resultado=resultado)
+
+
+def _aplanar(prefijo, datos, salida):
+    # {'a': {'b': 1}} -> {'prefijo_a_b': 1}; solo valores numéricos
+    for clave, valor in datos.items():
+        nombre = f'{prefijo}_{clave}'
+        if isinstance(valor, dict):
+            _aplanar(nombre, valor, salida)
+        elif isinstance(valor, bool):
+            salida[nombre] = int(valor)
+        elif isinstance(valor, (int, float)):
+            salida[nombre] = valor
+    return salida
+
+
+@REGISTRO.colector
+def _componentes():
+    # Estadísticas que ya llevan los componentes del detector (las mismas de emocion-detection/stats/)
+    from .ml_model.batching import current_batcher
+    from .ml_model.dedup import current_dedup_cache
+    from .ml_model.detector import model_status
+    from .ml_model.face_detector_pool import current_face_detector_pool
+    from .ml_model.tracking import current_tracker
+    from .write_behind import current_write_behind_buffer
+
+    familias = []
+    estado = model_status()
+    familias.append(('emociones_modelo_cargado', 'Si el modelo de emociones está cargado en este proceso.', 'gauge',
+                     {(): int(estado['loaded'])}))
+    if estado['load_seconds'] is not None:
+        familias.append(('emociones_modelo_carga_segundos', 'Tiempo que tardó la carga del modelo.', 'gauge',
+                         {(): estado['load_seconds']}))
+
+    componentes = {
+        'batching': current_batcher(),
+        'face_detector_pool': current_face_detector_pool(),
+        'face_tracking': current_tracker(),
+        'frame_dedup': current_dedup_cache(),
+        'write_behind': current_write_behind_buffer(),
+    }
+    for componente, objeto in componentes.items():
+        if objeto is None:
+            continue
+        for nombre, valor in _aplanar(f'emociones_{componente}', objeto.stats(), {}).items():
+            familias.append((nombre, f'{componente}.stats()', 'gauge', {(): valor}))
+    return familias
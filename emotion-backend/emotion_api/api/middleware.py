@@ -0,0 +1,37 @@
+import time
+
+from django.db import connection
+
+from .metrics import PETICION_CONSULTAS, PETICION_SEGUNDOS, habilitado
+
+
+class MetricsMiddleware:
+    """
+    Latencia y número de consultas a la base de datos de cada petición HTTP, por endpoint
+    (nombre de la ruta de Django, no la URL, para no crear una serie por cada id).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not habilitado():
+            return self.get_response(request)
+
+        consultas = 0
+
+        def contar(execute, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(contar):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = (match.view_name or match.route) if match else 'sin_ruta'
+        PETICION_SEGUNDOS.observe(elapsed, endpoint=endpoint, metodo=request.method, codigo=response.status_code)
+        PETICION_CONSULTAS.observe(consultas, endpoint=endpoint)
+        return response
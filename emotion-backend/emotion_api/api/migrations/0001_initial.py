@@ -0,0 +1,133 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:30
+
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Materia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('nrc', models.CharField(max_length=10)),
+                ('descripcion', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Nivel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Usuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('first_name', models.CharField(blank=True, max_length=150, verbose_name='first name')),
+                ('last_name', models.CharField(blank=True, max_length=150, verbose_name='last name')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='email address')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('genero', models.CharField(choices=[('M', 'Masculino'), ('F', 'Femenino'), ('O', 'Otro')], max_length=1)),
+                ('CI', models.CharField(max_length=20, unique=True)),
+                ('rol', models.CharField(choices=[('alumno', 'Alumno'), ('docente', 'Docente'), ('admin', 'Administrador')], max_length=10)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'verbose_name': 'user',
+                'verbose_name_plural': 'users',
+                'abstract': False,
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CursoDocente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('docente', models.ForeignKey(limit_choices_to={'rol': 'docente'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('materia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.materia')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CursoAlumno',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_inscripcion', models.DateField(auto_now_add=True)),
+                ('alumno', models.ForeignKey(limit_choices_to={'rol': 'alumno'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('materia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.materia')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Actividad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('descripcion', models.TextField()),
+                ('fecha_inicio', models.DateTimeField()),
+                ('duracion_analisis_minutos', models.PositiveIntegerField(default=30)),
+                ('materia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.materia')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='materia',
+            name='nivel',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.nivel'),
+        ),
+        migrations.CreateModel(
+            name='SesionActividad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_hora_inicio_real', models.DateTimeField(auto_now_add=True)),
+                ('fecha_hora_fin_real', models.DateTimeField(blank=True, null=True)),
+                ('actividad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sesiones', to='api.actividad')),
+                ('alumno', models.ForeignKey(limit_choices_to={'rol': 'alumno'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('actividad', 'alumno', 'fecha_hora_inicio_real')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Calificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nota', models.FloatField()),
+                ('observaciones', models.TextField(blank=True, null=True)),
+                ('fecha_calificacion', models.DateField(auto_now_add=True)),
+                ('docente', models.ForeignKey(limit_choices_to={'rol': 'docente'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('sesion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.sesionactividad')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnalisisEmocion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('momento_segundo', models.PositiveIntegerField()),
+                ('emocion_predominante', models.CharField(choices=[('enojo', 'Enojo'), ('disgusto', 'Disgusto'), ('miedo', 'Miedo'), ('felicidad', 'Felicidad'), ('tristeza', 'Tristeza'), ('sorpresa', 'Sorpresa'), ('neutral', 'Neutral')], max_length=20)),
+                ('confianza_emocion', models.FloatField()),
+                ('datos_raw_emociones', models.JSONField()),
+                ('sesion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.sesionactividad')),
+            ],
+        ),
+    ]
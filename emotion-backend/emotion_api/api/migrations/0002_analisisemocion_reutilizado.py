@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analisisemocion',
+            name='reutilizado',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_analisisemocion_reutilizado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analisisemocion',
+            name='emocion_predominante',
+            field=models.CharField(choices=[('enojo', 'Enojo'), ('disgusto', 'Disgusto'), ('miedo', 'Miedo'), ('felicidad', 'Felicidad'), ('tristeza', 'Tristeza'), ('sorpresa', 'Sorpresa'), ('neutral', 'Neutral'), ('no_detectado', 'No detectado')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:59
+
+from django.db import migrations, models
+
+EMOCIONES = ('sorpresa', 'miedo', 'disgusto', 'felicidad', 'tristeza', 'enojo', 'neutral')
+LOTE = 2000
+
+
+def json_a_columnas(apps, schema_editor):
+    # Copia datos_raw_emociones a las columnas prob_* por lotes, sin cargar la tabla entera en memoria
+    AnalisisEmocion = apps.get_model('api', 'AnalisisEmocion')
+    campos = [f'prob_{emocion}' for emocion in EMOCIONES]
+    lote = []
+    for analisis in AnalisisEmocion.objects.only('id', 'datos_raw_emociones').iterator(chunk_size=LOTE):
+        datos = analisis.datos_raw_emociones or {}
+        for emocion in EMOCIONES:
+            valor = datos.get(emocion)
+            setattr(analisis, f'prob_{emocion}', float(valor) if valor is not None else None)
+        lote.append(analisis)
+        if len(lote) >= LOTE:
+            AnalisisEmocion.objects.bulk_update(lote, campos)
+            lote = []
+    if lote:
+        AnalisisEmocion.objects.bulk_update(lote, campos)
+
+
+def columnas_a_json(apps, schema_editor):
+    AnalisisEmocion = apps.get_model('api', 'AnalisisEmocion')
+    campos = ['id'] + [f'prob_{emocion}' for emocion in EMOCIONES]
+    lote = []
+    for analisis in AnalisisEmocion.objects.only(*campos).iterator(chunk_size=LOTE):
+        analisis.datos_raw_emociones = {
+            emocion: valor for emocion in EMOCIONES
+            if (valor := getattr(analisis, f'prob_{emocion}')) is not None
+        }
+        lote.append(analisis)
+        if len(lote) >= LOTE:
+            AnalisisEmocion.objects.bulk_update(lote, ['datos_raw_emociones'])
+            lote = []
+    if lote:
+        AnalisisEmocion.objects.bulk_update(lote, ['datos_raw_emociones'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_analisisemocion_no_detectado'),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name='analisisemocion',
+                name=f'prob_{emocion}',
+                field=models.FloatField(blank=True, null=True),
+            )
+            for emocion in EMOCIONES
+        ],
+        # Nullable durante la copia para que la migración se pueda revertir sobre una tabla con filas
+        migrations.AlterField(
+            model_name='analisisemocion',
+            name='datos_raw_emociones',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(json_a_columnas, columnas_a_json),
+        migrations.RemoveField(
+            model_name='analisisemocion',
+            name='datos_raw_emociones',
+        ),
+    ]
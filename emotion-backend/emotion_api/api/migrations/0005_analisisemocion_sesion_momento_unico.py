@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:03
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def eliminar_duplicados(apps, schema_editor):
+    # Filas repetidas por reintentos del cliente: se conserva la última (mayor id) de cada (sesion, momento_segundo)
+    AnalisisEmocion = apps.get_model('api', 'AnalisisEmocion')
+    ultimas = AnalisisEmocion.objects.values('sesion_id', 'momento_segundo').annotate(ultima=Max('id')).values('ultima')
+    AnalisisEmocion.objects.exclude(id__in=ultimas).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_analisisemocion_probabilidades'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='analisisemocion',
+            constraint=models.UniqueConstraint(fields=('sesion', 'momento_segundo'), name='analisis_sesion_momento_unico'),
+        ),
+    ]
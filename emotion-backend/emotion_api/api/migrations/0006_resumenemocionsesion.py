@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+EMOCIONES = ('sorpresa', 'miedo', 'disgusto', 'felicidad', 'tristeza', 'enojo', 'neutral')
+
+
+def calcular_resumenes(apps, schema_editor):
+    # Resúmenes de las sesiones que ya tienen análisis (mismo cálculo que ResumenEmocionSesion.objects.reconstruir)
+    AnalisisEmocion = apps.get_model('api', 'AnalisisEmocion')
+    ResumenEmocionSesion = apps.get_model('api', 'ResumenEmocionSesion')
+    detectado = Q(emocion_predominante__in=EMOCIONES)
+    totales = AnalisisEmocion.objects.order_by().values('sesion_id').annotate(
+        frames=Count('id'),
+        frames_no_detectado=Count('id', filter=~detectado),
+        suma_confianza=Sum('confianza_emocion', filter=detectado, default=0.0),
+        **{f'frames_{emocion}': Count('id', filter=Q(emocion_predominante=emocion)) for emocion in EMOCIONES},
+    )
+    ResumenEmocionSesion.objects.bulk_create([ResumenEmocionSesion(**fila) for fila in totales], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_analisisemocion_sesion_momento_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenEmocionSesion',
+            fields=[
+                ('sesion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen_emociones', serialize=False, to='api.sesionactividad')),
+                ('frames', models.PositiveIntegerField(default=0)),
+                ('frames_no_detectado', models.PositiveIntegerField(default=0)),
+                ('frames_sorpresa', models.PositiveIntegerField(default=0)),
+                ('frames_miedo', models.PositiveIntegerField(default=0)),
+                ('frames_disgusto', models.PositiveIntegerField(default=0)),
+                ('frames_felicidad', models.PositiveIntegerField(default=0)),
+                ('frames_tristeza', models.PositiveIntegerField(default=0)),
+                ('frames_enojo', models.PositiveIntegerField(default=0)),
+                ('frames_neutral', models.PositiveIntegerField(default=0)),
+                ('suma_confianza', models.FloatField(default=0.0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(calcular_resumenes, migrations.RunPython.noop),
+    ]
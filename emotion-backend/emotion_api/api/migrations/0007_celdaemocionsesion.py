@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+
+EMOCIONES = ('sorpresa', 'miedo', 'disgusto', 'felicidad', 'tristeza', 'enojo', 'neutral')
+ANCHO_SEGUNDOS = 10
+
+
+def calcular_celdas(apps, schema_editor):
+    # Celdas de las sesiones que ya tienen análisis (mismo cálculo que CeldaEmocionSesion.objects.reconstruir)
+    AnalisisEmocion = apps.get_model('api', 'AnalisisEmocion')
+    CeldaEmocionSesion = apps.get_model('api', 'CeldaEmocionSesion')
+    detectado = Q(emocion_predominante__in=EMOCIONES)
+    totales = (
+        AnalisisEmocion.objects.order_by()
+        .annotate(intervalo=F('momento_segundo') / ANCHO_SEGUNDOS)
+        .values('sesion_id', 'intervalo')
+        .annotate(
+            frames=Count('id'),
+            frames_no_detectado=Count('id', filter=~detectado),
+            suma_confianza=Sum('confianza_emocion', filter=detectado, default=0.0),
+            **{f'frames_{emocion}': Count('id', filter=Q(emocion_predominante=emocion)) for emocion in EMOCIONES},
+        )
+    )
+    CeldaEmocionSesion.objects.bulk_create((CeldaEmocionSesion(**fila) for fila in totales), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_resumenemocionsesion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CeldaEmocionSesion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frames', models.PositiveIntegerField(default=0)),
+                ('frames_no_detectado', models.PositiveIntegerField(default=0)),
+                ('frames_sorpresa', models.PositiveIntegerField(default=0)),
+                ('frames_miedo', models.PositiveIntegerField(default=0)),
+                ('frames_disgusto', models.PositiveIntegerField(default=0)),
+                ('frames_felicidad', models.PositiveIntegerField(default=0)),
+                ('frames_tristeza', models.PositiveIntegerField(default=0)),
+                ('frames_enojo', models.PositiveIntegerField(default=0)),
+                ('frames_neutral', models.PositiveIntegerField(default=0)),
+                ('suma_confianza', models.FloatField(default=0.0)),
+                ('intervalo', models.PositiveIntegerField()),
+                ('sesion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='celdas_emociones', to='api.sesionactividad')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sesion', 'intervalo'), name='celda_sesion_intervalo_unica')],
+            },
+        ),
+        migrations.RunPython(calcular_celdas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,161 @@
+import os
+import threading
+
+import numpy as np
+
+# Backends intercambiables para el clasificador de emociones.
+# Todos reciben un lote float32 de forma (N, 48, 48, 1) con valores en [0, 1]
+# y devuelven un array (N, 7) con las probabilidades en el orden de EMOTION_LABELS.
+
+MODEL_DIR = os.path.dirname(__file__)
+
+DEFAULT_MODEL_FILES = {
+    'keras': 'raf_model.keras',
+    'tflite': 'raf_model.tflite',
+    'onnx': 'raf_model.onnx',
+}
+
+# Variantes cuantizadas (ver manage.py quantize_emotion_model); solo existen para TFLite
+QUANTIZED_MODEL_FILES = {
+    ('tflite', 'int8'): 'raf_model_int8.tflite',
+}
+
+
+class InferenceBackend:
+    name = None
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.model_path}>"
+
+
+class KerasBackend(InferenceBackend):
+    name = 'keras'
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        from tensorflow.keras.models import load_model
+        self.model = load_model(model_path)
+
+    def predict(self, batch):
+        # predict_on_batch evita el coste de montar un tf.data por llamada de model.predict
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+def _tflite_interpreter_class():
+    # Preferimos los runtimes ligeros; TensorFlow completo solo como último recurso
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteBackend(InferenceBackend):
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None):
+        super().__init__(model_path)
+        Interpreter = _tflite_interpreter_class()
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        # Un intérprete de TFLite no se puede invocar desde varios hilos a la vez
+        self._lock = threading.Lock()
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], list(batch.shape))
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self._output['index']))
+
+    @property
+    def quantized(self):
+        return self._input['dtype'] in (np.int8, np.uint8)
+
+    def _quantize(self, batch):
+        # Modelos INT8 de entero completo: float [0, 1] -> enteros con la escala/cero del tensor
+        dtype = self._input['dtype']
+        if dtype not in (np.int8, np.uint8):
+            return batch
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output):
+        if self._output['dtype'] not in (np.int8, np.uint8):
+            return output.copy()
+        scale, zero_point = self._output['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+
+class ONNXBackend(InferenceBackend):
+    name = 'onnx'
+
+    def __init__(self, model_path, num_threads=None):
+        super().__init__(model_path)
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self._input_name: batch})[0]
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    ONNXBackend.name: ONNXBackend,
+}
+
+
+def default_model_path(name, variant='float32'):
+    if variant == 'float32':
+        return os.path.join(MODEL_DIR, DEFAULT_MODEL_FILES[name])
+    try:
+        return os.path.join(MODEL_DIR, QUANTIZED_MODEL_FILES[(name, variant)])
+    except KeyError:
+        raise ValueError(f"El backend {name!r} no admite la variante {variant!r}.")
+
+
+def load_backend(name=None, model_path=None):
+    """
+    Crea el backend indicado (o el configurado en EMOCION_INFERENCE_BACKEND).
+    Si no se indica ruta se usa EMOCION_MODEL_PATH o el archivo por defecto del backend
+    para la variante de EMOCION_MODEL_VARIANT ('float32' o 'int8').
+    """
+    from django.conf import settings
+    name = name or getattr(settings, 'EMOCION_INFERENCE_BACKEND', 'keras')
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de inferencia desconocido: {name!r}. Opciones: {', '.join(BACKENDS)}")
+    variant = getattr(settings, 'EMOCION_MODEL_VARIANT', 'float32')
+    model_path = model_path or getattr(settings, 'EMOCION_MODEL_PATH', None) or default_model_path(name, variant)
+    kwargs = {}
+    if name != 'keras':
+        kwargs['num_threads'] = getattr(settings, 'EMOCION_INFERENCE_THREADS', None)
+    return BACKENDS[name](model_path, **kwargs)
@@ -0,0 +1,171 @@
+import atexit
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Agrupa rostros preprocesados que llegan desde peticiones concurrentes y
+    ejecuta una sola pasada del modelo por lote.
+
+    Cada llamada a `submit` devuelve un Future con el vector de probabilidades
+    de ese rostro. Un hilo de fondo espera el primer elemento, sigue juntando
+    elementos hasta `max_batch_size` o hasta que pasan `max_wait_ms` desde que
+    llegó el primero, apila el lote y llama a `predict_fn` una sola vez.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, name='emotion-batcher'):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size debe ser al menos 1.")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = collections.Counter()
+        self._queue_waits = collections.deque(maxlen=2048) # Ventana de esperas recientes (s)
+        self._predict_s = 0.0
+
+    def submit(self, tensor):
+        """Encola un rostro (ej. 48x48x1 float32) y devuelve un Future con sus probabilidades."""
+        if self._closed:
+            raise RuntimeError("El planificador de inferencia está cerrado.")
+        future = Future()
+        self._queue.put((tensor, future, time.perf_counter()))
+        return future
+
+    def predict(self, tensor, timeout=30):
+        """Versión bloqueante de `submit`."""
+        return self.submit(tensor).result(timeout=timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = first[2] + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Procesar lo ya recogido y luego terminar
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+
+            started = time.perf_counter()
+            waits = [started - enqueued for _, _, enqueued in batch]
+            try:
+                inputs = np.stack([tensor for tensor, _, _ in batch])
+                outputs = self.predict_fn(inputs)
+                if len(outputs) != len(batch):
+                    # No se sabe a qué rostro corresponde cada salida: falla el lote entero en vez de
+                    # dejar Futures sin resolver hasta su timeout
+                    raise RuntimeError(f"El modelo devolvió {len(outputs)} salidas para un lote de {len(batch)} rostros.")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._stats_lock:
+                    self._batches += 1
+                    self._items += len(batch)
+                    self._batch_sizes[len(batch)] += 1
+                    self._queue_waits.extend(waits)
+                    self._predict_s += elapsed
+
+            for (_, future, _), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def stats(self):
+        """Estadísticas para ajustar max_batch_size y max_wait_ms."""
+        with self._stats_lock:
+            waits_ms = np.asarray(self._queue_waits, dtype=np.float64) * 1000.0
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_s * 1000.0,
+                'batches': self._batches,
+                'items': self._items,
+                'mean_batch_size': (self._items / self._batches) if self._batches else 0.0,
+                'batch_size_histogram': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                'mean_predict_ms': (self._predict_s * 1000.0 / self._batches) if self._batches else 0.0,
+                'queue_wait_ms': {
+                    'mean': float(waits_ms.mean()) if waits_ms.size else 0.0,
+                    'p95': float(np.percentile(waits_ms, 95)) if waits_ms.size else 0.0,
+                    'max': float(waits_ms.max()) if waits_ms.size else 0.0,
+                },
+                'queue_depth': self._queue.qsize(),
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
+
+    def close(self, timeout=5):
+        """Deja de aceptar rostros, procesa lo pendiente y detiene el hilo de fondo."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher(predict_fn):
+    """Devuelve el planificador compartido del proceso, creándolo con la configuración de settings."""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                from django.conf import settings
+                _batcher = MicroBatcher(
+                    predict_fn,
+                    max_batch_size=getattr(settings, 'EMOCION_BATCH_MAX_SIZE', 16),
+                    max_wait_ms=getattr(settings, 'EMOCION_BATCH_MAX_WAIT_MS', 5),
+                )
+    return _batcher
+
+
+def current_batcher():
+    """El planificador compartido si ya fue creado (para estadísticas), o None."""
+    return _batcher
+
+
+def shutdown_batcher():
+    global _batcher
+    with _batcher_lock:
+        if _batcher is not None:
+            _batcher.close()
+            _batcher = None
+
+
+atexit.register(shutdown_batcher)
@@ -0,0 +1,131 @@
+import os
+
+import cv2
+import numpy as np
+
+# Conversión offline de raf_model.keras a formatos más rápidos en CPU.
+# Estas funciones importan TensorFlow y solo las usan los comandos de manage.py.
+
+INPUT_SHAPE = (48, 48, 1)
+
+
+def convert_to_tflite(keras_model):
+    """Devuelve los bytes de un modelo TFLite float32 equivalente."""
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    return converter.convert()
+
+
+def convert_to_tflite_int8(keras_model, calibration_inputs):
+    """
+    Cuantización post-entrenamiento a entero completo (pesos, activaciones, entrada y salida INT8).
+    Los rangos de las activaciones se calibran con `calibration_inputs` (N, 48, 48, 1) en [0, 1].
+    """
+    import tensorflow as tf
+
+    def representative_dataset():
+        for sample in calibration_inputs:
+            yield [sample[np.newaxis].astype(np.float32)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def load_face_crops(folder, limit=None):
+    """
+    Carga recortes de rostros de una carpeta (recursivamente) y los preprocesa igual que
+    detectar_emocion: escala de grises, 48x48 y valores en [0, 1].
+    """
+    crops = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            image = cv2.imread(os.path.join(root, name), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                continue
+            resized = cv2.resize(image, INPUT_SHAPE[:2])
+            crops.append(resized.astype(np.float32)[..., np.newaxis] / 255.0)
+            if limit and len(crops) >= limit:
+                return np.stack(crops)
+    if not crops:
+        return np.empty((0,) + INPUT_SHAPE, dtype=np.float32)
+    return np.stack(crops)
+
+
+def agreement_report(reference_out, candidate_out, labels):
+    """
+    Acuerdo por clase entre el modelo de referencia (float) y el candidato (ej. INT8):
+    para cada emoción, qué fracción de los rostros que el float asigna a esa clase
+    recibe la misma clase en el candidato, más la matriz de confusión float -> candidato.
+    """
+    ref_idx = reference_out.argmax(axis=1)
+    cand_idx = candidate_out.argmax(axis=1)
+    confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    np.add.at(confusion, (ref_idx, cand_idx), 1)
+
+    per_class = {}
+    for i, label in enumerate(labels):
+        mask = ref_idx == i
+        n = int(mask.sum())
+        per_class[label] = {
+            'n': n,
+            'agreement': float((cand_idx[mask] == i).mean()) if n else None,
+            'mean_abs_diff': float(np.abs(reference_out[mask] - candidate_out[mask]).mean()) if n else None,
+        }
+
+    return {
+        'samples': int(len(ref_idx)),
+        'top1_agreement': float((ref_idx == cand_idx).mean()) if len(ref_idx) else None,
+        'max_abs_diff': float(np.abs(reference_out - candidate_out).max()) if len(ref_idx) else None,
+        'per_class': per_class,
+        'confusion_matrix': {
+            'labels': list(labels),
+            'rows_reference_cols_candidate': confusion.tolist(),
+        },
+    }
+
+
+def convert_to_onnx(keras_model, output_path, opset=13):
+    """Exporta a ONNX con tf2onnx (dependencia opcional) usando un lote de tamaño dinámico."""
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name='input'),)
+
+    # Keras 3 no es compatible con tf2onnx.convert.from_keras; se exporta la llamada como tf.function
+    @tf.function
+    def forward(x):
+        return keras_model(x, training=False)
+
+    tf2onnx.convert.from_function(forward, input_signature=spec, opset=opset, output_path=output_path)
+
+
+def verification_inputs(samples, seed=0, extra=None):
+    """Lote de entradas para comparar modelos: rostros reales (si hay) más ruido uniforme."""
+    rng = np.random.default_rng(seed)
+    inputs = rng.random((samples,) + INPUT_SHAPE, dtype=np.float32)
+    if extra is not None and len(extra):
+        inputs = np.concatenate([np.asarray(extra, dtype=np.float32), inputs])
+    return inputs
+
+
+def compare_backends(reference, candidate, inputs, batch_size=32):
+    """Compara salidas de dos backends: diferencia absoluta máxima y acuerdo en la clase predicha."""
+    ref_out, cand_out = [], []
+    for start in range(0, len(inputs), batch_size):
+        batch = inputs[start:start + batch_size]
+        ref_out.append(reference.predict(batch))
+        cand_out.append(candidate.predict(batch))
+    ref_out = np.concatenate(ref_out)
+    cand_out = np.concatenate(cand_out)
+    return {
+        'max_abs_diff': float(np.abs(ref_out - cand_out).max()),
+        'mean_abs_diff': float(np.abs(ref_out - cand_out).mean()),
+        'top1_agreement': float((ref_out.argmax(axis=1) == cand_out.argmax(axis=1)).mean()),
+        'reference': ref_out,
+        'candidate': cand_out,
+    }
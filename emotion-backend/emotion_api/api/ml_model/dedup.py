@@ -0,0 +1,172 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Tamaño del dHash: 8x8 comparaciones entre píxeles vecinos = 64 bits
+HASH_SIZE = 8
+
+
+def frame_hash(image_bytes):
+    """
+    dHash de 64 bits de un JPEG/PNG codificado, o None si no se puede decodificar.
+
+    Se decodifica a 1/8 de resolución en escala de grises (el decodificador JPEG
+    escala en el dominio DCT), así que es mucho más barato que el imdecode completo.
+    """
+    buffer = np.frombuffer(image_bytes, np.uint8)
+    small = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    small = cv2.resize(small, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class _UltimoFrame:
+    __slots__ = ('hash', 'resultado', 'reusos', 'last_seen')
+
+    def __init__(self, hash_, resultado, now):
+        self.hash = hash_
+        self.resultado = resultado
+        self.reusos = 0
+        self.last_seen = now
+
+
+class FrameDedupCache:
+    """
+    Supresión de frames casi idénticos por sesión de actividad.
+
+    Guarda el hash perceptual del último frame analizado de cada sesión junto con su
+    resultado. Si un frame nuevo está a una distancia de Hamming <= `threshold` de ese
+    frame, se reutiliza el resultado sin decodificar ni ejecutar el modelo. Se compara
+    siempre con el último frame *analizado* (no con el último recibido) para que una
+    deriva lenta no se acumule, y tras `max_reuse` reutilizaciones seguidas se vuelve a
+    analizar igualmente. Las sesiones sin frames durante `ttl_seconds` se descartan.
+    """
+
+    def __init__(self, threshold=5, max_reuse=10, ttl_seconds=300):
+        self.threshold = threshold
+        self.max_reuse = max_reuse
+        self.ttl_seconds = ttl_seconds
+        self._frames = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+
+    def _sweep(self, now):
+        # Llamar con el lock tomado
+        if now - self._last_sweep < self.ttl_seconds / 4:
+            return
+        self._last_sweep = now
+        expirados = [k for k, f in self._frames.items() if now - f.last_seen > self.ttl_seconds]
+        for k in expirados:
+            del self._frames[k]
+        self._evicted += len(expirados)
+
+    def check(self, sesion_id, image_bytes):
+        """
+        Devuelve (hash, resultado_previo). resultado_previo es None si el frame debe analizarse;
+        en ese caso hay que llamar a remember() con el hash y el resultado nuevo.
+        """
+        hash_ = frame_hash(image_bytes)
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            ultimo = self._frames.get(sesion_id)
+            if (hash_ is not None and ultimo is not None
+                    and now - ultimo.last_seen <= self.ttl_seconds
+                    and ultimo.reusos < self.max_reuse
+                    and (hash_ ^ ultimo.hash).bit_count() <= self.threshold):
+                ultimo.reusos += 1
+                ultimo.last_seen = now
+                self._hits += 1
+                return hash_, ultimo.resultado
+            self._misses += 1
+            return hash_, None
+
+    def check_batch(self, sesion_id, frames):
+        """
+        check() para varios frames de una sesión en orden: cada frame se compara con el último
+        analizado, que puede ser uno anterior del mismo lote. Devuelve (hashes, origen, previo):
+        origen[i] es None si el frame i debe analizarse, j si reutiliza el resultado del frame j
+        del lote y -1 si reutiliza `previo` (el resultado guardado de la sesión). Después hay que
+        llamar a remember() con el último frame analizado y cuántos frames lo reutilizaron.
+        """
+        hashes = [frame_hash(f) for f in frames]
+        origen = []
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            ultimo = self._frames.get(sesion_id)
+            if ultimo is not None and now - ultimo.last_seen > self.ttl_seconds:
+                ultimo = None
+            referencia, indice, reusos = (ultimo.hash, -1, ultimo.reusos) if ultimo is not None else (None, None, 0)
+            for i, hash_ in enumerate(hashes):
+                if (hash_ is not None and referencia is not None and reusos < self.max_reuse
+                        and (hash_ ^ referencia).bit_count() <= self.threshold):
+                    origen.append(indice)
+                    reusos += 1
+                    self._hits += 1
+                    continue
+                origen.append(None)
+                self._misses += 1
+                if hash_ is not None:
+                    referencia, indice, reusos = hash_, i, 0
+            if ultimo is not None and -1 in origen:
+                ultimo.reusos += origen.count(-1)
+                ultimo.last_seen = now
+        return hashes, origen, ultimo.resultado if ultimo is not None else None
+
+    def remember(self, sesion_id, hash_, resultado, reusos=0):
+        if hash_ is None:
+            return
+        with self._lock:
+            ultimo = _UltimoFrame(hash_, resultado, time.monotonic())
+            ultimo.reusos = reusos
+            self._frames[sesion_id] = ultimo
+
+    def discard(self, sesion_id):
+        with self._lock:
+            self._frames.pop(sesion_id, None)
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'sessions': len(self._frames),
+                'frames': total,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / total if total else None,
+                'evicted': self._evicted,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_frame_dedup_cache():
+    """Devuelve la caché de frames duplicados del proceso, o None si está desactivada."""
+    global _cache
+    if _cache is None:
+        from django.conf import settings
+        config = getattr(settings, 'EMOCION_FRAME_DEDUP', {})
+        if not config.get('ENABLED', True):
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = FrameDedupCache(
+                    threshold=config.get('THRESHOLD', 5),
+                    max_reuse=config.get('MAX_REUSE', 10),
+                    ttl_seconds=config.get('TTL_SECONDS', 300),
+                )
+    return _cache
+
+
+def current_dedup_cache():
+    return _cache
@@ -1,77 +1,328 @@
-import os
+import logging
+import threading
+import time
+
 import cv2
 import numpy as np
-from tensorflow.keras.models import load_model
-import mediapipe as mp
+from django.conf import settings
+
+from ..metrics import medir_etapa
+from .backends import load_backend
+from .batching import get_batcher
+from .face_detector_pool import get_face_detector_pool
+from .inference_service import get_inference_client, service_enabled
+from .pipeline import FrameEscalonado
+from .tracking import current_tracker, get_face_tracker
 
 # Configuración RAF-DB
 EMOTION_LABELS = ['sorpresa', 'miedo', 'disgusto', 'felicidad', 'tristeza', 'enojo', 'neutral']
 IMG_SIZE = (48, 48)
 MIN_FACE_SIZE = 48
 
-# Ruta al modelo (en la misma carpeta ml_model)
-MODEL_PATH = os.path.join(os.path.dirname(__file__), 'raf_model.keras')
+# Mensajes de los resultados sin rostro utilizable (api/ingest.py los distingue en las métricas)
+MENSAJE_SIN_ROSTRO = 'No se detectaron rostros'
+MENSAJE_ROSTRO_PEQUENO = 'Rostro demasiado pequeño'
+
+logger = logging.getLogger(__name__)
+
+# El modelo (y TensorFlow) se cargan en la primera detección o en warmup(),
+# no al importar este módulo: así manage.py, el admin y las vistas CRUD arrancan rápido.
+# Si la carga falla (ej. el archivo aún no está montado o falta memoria) se vuelve a intentar tras
+# una espera que se duplica en cada fallo, de MODEL_RETRY_MIN_SECONDS a MODEL_RETRY_MAX_SECONDS.
+MODEL_RETRY_MIN_SECONDS = 5.0
+MODEL_RETRY_MAX_SECONDS = 300.0
 
-# Cargar modelo al inicio
-try:
-    model = load_model(MODEL_PATH)
-    print(f"Modelo RAF-DB cargado desde: {MODEL_PATH}")
-except Exception as e:
-    print(f"Error cargando modelo: {str(e)}")
-    model = None
+_model = None
+_model_error = None
+_model_load_seconds = None
+_model_failures = 0
+_model_retry_at = 0.0 # time.monotonic() a partir del cual se reintenta la carga
+_model_lock = threading.Lock()
 
-def detectar_emocion(imagen):
+def get_model():
+    """Devuelve el backend del modelo, cargándolo una sola vez (None si la carga falló y aún no toca reintentar)."""
+    global _model, _model_error, _model_load_seconds, _model_failures, _model_retry_at
+    if _model is None and time.monotonic() >= _model_retry_at:
+        with _model_lock:
+            if _model is None and time.monotonic() >= _model_retry_at:
+                started = time.perf_counter()
+                try:
+                    # Backend configurado en EMOCION_INFERENCE_BACKEND
+                    _model = load_backend()
+                    _model_load_seconds = time.perf_counter() - started
+                    _model_error = None
+                    _model_failures = 0
+                    logger.info("Modelo RAF-DB cargado: %r (%.2f s)", _model, _model_load_seconds)
+                except Exception as e:
+                    _model_error = str(e)
+                    _model_failures += 1
+                    espera = min(MODEL_RETRY_MIN_SECONDS * 2 ** (_model_failures - 1), MODEL_RETRY_MAX_SECONDS)
+                    _model_retry_at = time.monotonic() + espera
+                    logger.exception("Error cargando modelo (intento %d); se reintentará en %.0f s", _model_failures, espera)
+    return _model
+
+def model_status():
+    """Estado de carga del modelo para el endpoint de readiness."""
+    return {
+        'loaded': _model is not None,
+        'backend': repr(_model) if _model is not None else None,
+        'load_seconds': _model_load_seconds,
+        'error': _model_error,
+        'failures': _model_failures,
+        'retry_in_seconds': max(0.0, _model_retry_at - time.monotonic()) if _model is None and _model_error else None,
+    }
+
+def warmup():
+    """Carga el modelo, crea un detector de rostros y ejecuta una predicción de prueba."""
+    model = get_model()
     if model is None:
-        return {'detected': False, 'error': 'Modelo no disponible'}
-    
-    try:
-        # Detección de rostros
-        face_detection = mp.solutions.face_detection.FaceDetection(
-            model_selection=1,
-            min_detection_confidence=0.7
-        )
-        
-        rgb_frame = cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB)
-        results = face_detection.process(rgb_frame)
-        
-        if not results.detections:
-            return {'detected': False, 'message': 'No se detectaron rostros'}
+        return False
+    blank = np.zeros((IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.uint8)
+    get_face_detector_pool().process(blank)
+    model.predict(np.zeros((1,) + IMG_SIZE + (1,), dtype=np.float32))
+    return True
+
+def warmup_in_background():
+    if service_enabled():
+        return None # El modelo vive en el servicio de inferencia, no en este proceso
+    thread = threading.Thread(target=warmup, name='emotion-model-warmup', daemon=True)
+    thread.start()
+    return thread
+
+def preprocesar_rostro(face_region):
+    # Preprocesamiento RAF-DB: escala de grises, 48x48, [0, 1], forma (48, 48, 1)
+    return preprocesar_gris(cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY))
 
+def preprocesar_gris(gray_face):
+    # Recorte ya en escala de grises: redimensionar y normalizar en un único array float32
+    resized_face = cv2.resize(gray_face, IMG_SIZE)
+    return np.multiply(resized_face, 1.0 / 255.0, dtype=np.float32)[..., np.newaxis]
+
+def _predecir_lote(batch):
+    with medir_etapa('prediccion'):
+        return get_model().predict(batch)
+
+def predecir(input_tensor):
+    # Con micro-batching, los rostros de peticiones concurrentes comparten una sola pasada del modelo
+    if getattr(settings, 'EMOCION_BATCH_ENABLED', True):
+        return get_batcher(_predecir_lote).predict(input_tensor)
+    return _predecir_lote(input_tensor[np.newaxis])[0]
+
+def detectar_emocion(imagen, sesion_id=None):
+    # Con el servicio de inferencia activo, este proceso no carga el modelo: solo envía el frame
+    if service_enabled():
+        return get_inference_client().detectar_emocion(imagen, sesion_id=sesion_id)
+    return detectar_emocion_local(imagen, sesion_id=sesion_id)
+
+def detectar_emocion_bytes(data, sesion_id=None):
+    """Como detectar_emocion, pero a partir del JPEG/PNG codificado (decodificación por etapas)."""
+    if service_enabled():
+        return get_inference_client().detectar_emocion_bytes(data, sesion_id=sesion_id)
+    return detectar_emocion_bytes_local(data, sesion_id=sesion_id)
+
+def detectar_emociones_lote_bytes(frames, sesion_id=None):
+    """Analiza una lista de frames codificados de una sesión con una sola pasada del modelo."""
+    longitudes = [len(f) for f in frames]
+    data = b''.join(frames)
+    if service_enabled():
+        resultados = get_inference_client().detectar_emociones_lote_bytes(data, longitudes, sesion_id=sesion_id)
+        if isinstance(resultados, dict): # Error del servicio: aplica a todos los frames
+            return [resultados] * len(frames)
+        return resultados
+    return detectar_emociones_lote_bytes_local(data, longitudes, sesion_id=sesion_id)
+
+def detectar_emociones_multiples(imagen):
+    """Clasifica todos los rostros del frame (cámara compartida de un aula)."""
+    if service_enabled():
+        return get_inference_client().detectar_emociones_multiples(imagen)
+    return detectar_emociones_multiples_local(imagen)
+
+def olvidar_sesion(sesion_id):
+    """Descarta el seguimiento del rostro de una sesión finalizada (en el servicio expira por TTL)."""
+    tracker = current_tracker()
+    if tracker is not None:
+        tracker.discard(sesion_id)
+
+def _cajas_rostros(imagen):
+    # Detección completa de rostros con un detector reutilizable del pool
+    rgb_frame = cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB)
+    results = get_face_detector_pool().process(rgb_frame)
+
+    cajas = []
+    ih, iw = imagen.shape[:2]
+    for detection in results.detections or []:
         # Obtener coordenadas
-        bbox = results.detections[0].location_data.relative_bounding_box
-        ih, iw = imagen.shape[:2]
+        bbox = detection.location_data.relative_bounding_box
         x = int(bbox.xmin * iw)
         y = int(bbox.ymin * ih)
         w = int(bbox.width * iw)
         h = int(bbox.height * ih)
-        
+
         # Ajustar coordenadas
         x, y = max(0, x), max(0, y)
         w, h = min(iw - x, w), min(ih - y, h)
+        cajas.append((x, y, w, h))
+    return cajas
+
+def _detectar_rostro(imagen):
+    cajas = _cajas_rostros(imagen)
+    return cajas[0] if cajas else None
+
+def _resultado_emocion(predictions, box):
+    emotion_idx = np.argmax(predictions)
+    return {
+        'emotion': EMOTION_LABELS[emotion_idx],
+        'confidence': float(predictions[emotion_idx]),
+        'all_emotions': {e: float(p) for e, p in zip(EMOTION_LABELS, predictions)},
+        'face_box': box
+    }
 
-        if w < MIN_FACE_SIZE or h < MIN_FACE_SIZE:
-            return {'detected': False, 'message': 'Rostro demasiado pequeño'}
+def _recorte_gris_bgr(imagen):
+    def recorte_gris(box):
+        x, y, w, h = box
+        return cv2.cvtColor(imagen[y:y+h, x:x+w], cv2.COLOR_BGR2GRAY)
+    return recorte_gris
 
-        # Preprocesamiento RAF-DB
-        face_region = imagen[y:y+h, x:x+w]
-        gray_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
-        resized_face = cv2.resize(gray_face, IMG_SIZE)
-        normalized_face = resized_face.astype(np.float32) / 255.0
-        input_tensor = np.expand_dims(normalized_face, axis=(0, -1))
+def detectar_emocion_local(imagen, sesion_id=None):
+    return _clasificar_rostro(imagen, sesion_id, _recorte_gris_bgr(imagen), lambda box: box)
+
+def detectar_emocion_bytes_local(data, sesion_id=None):
+    # Detección sobre una decodificación reducida; la resolución completa solo si el rostro es pequeño
+    with medir_etapa('decodificacion'):
+        frame = FrameEscalonado(data)
+    if not frame.valido:
+        return {'detected': False, 'error': 'No se pudo decodificar la imagen.', 'invalid_image': True}
+    return _clasificar_rostro(frame.reducida, sesion_id, frame.recorte_gris, frame.caja_completa)
+
+def _localizar_rostro(imagen, sesion_id, recorte_gris, caja_completa):
+    # `imagen` es donde se detecta; recorte_gris/caja_completa llevan la caja a la resolución original.
+    # Devuelve (tensor de entrada, caja) o un diccionario de resultado si no hay rostro utilizable.
+    # Con sesión, se intenta seguir el rostro cerca de su última posición antes de detectar
+    tracker = get_face_tracker() if sesion_id is not None else None
+    box = None
+    if tracker is not None:
+        with medir_etapa('seguimiento'):
+            box = tracker.track(sesion_id, imagen)
+    seguido = box is not None
+
+    if box is None:
+        with medir_etapa('deteccion'):
+            box = _detectar_rostro(imagen)
+        if box is None:
+            if tracker is not None:
+                tracker.discard(sesion_id)
+            return {'detected': False, 'message': MENSAJE_SIN_ROSTRO}
+
+    x, y, w, h = caja_completa(box)
+    if w < MIN_FACE_SIZE or h < MIN_FACE_SIZE:
+        return {'detected': False, 'message': MENSAJE_ROSTRO_PEQUENO}
+    if tracker is not None and not seguido:
+        tracker.update(sesion_id, imagen, box)
+
+    # Preprocesamiento RAF-DB
+    with medir_etapa('preproceso'):
+        return preprocesar_gris(recorte_gris(box)), (x, y, w, h)
+
+def _clasificar_rostro(imagen, sesion_id, recorte_gris, caja_completa):
+    if get_model() is None:
+        return {'detected': False, 'error': 'Modelo no disponible'}
+    
+    try:
+        rostro = _localizar_rostro(imagen, sesion_id, recorte_gris, caja_completa)
+        if isinstance(rostro, dict):
+            return rostro
+        input_tensor, box = rostro
 
         # Predicción
-        predictions = model.predict(input_tensor, verbose=0)[0]
-        emotion_idx = np.argmax(predictions)
+        predictions = predecir(input_tensor)
+        return {'detected': True, **_resultado_emocion(predictions, box)}
+        
+    except Exception as e:
+        return {'detected': False, 'error': str(e)}
+
+def detectar_emociones_lote_bytes_local(data, longitudes, sesion_id=None):
+    """
+    Analiza varios frames codificados de una sesión (concatenados en `data`, con sus longitudes),
+    en orden, y clasifica todos los rostros encontrados en una sola pasada del modelo.
+    Devuelve una lista de resultados con el mismo formato que detectar_emocion.
+    """
+    if get_model() is None:
+        return [{'detected': False, 'error': 'Modelo no disponible'}] * len(longitudes)
+
+    def entradas():
+        data_ = memoryview(data)
+        inicio = 0
+        for longitud in longitudes:
+            with medir_etapa('decodificacion'):
+                frame = FrameEscalonado(data_[inicio:inicio + longitud])
+            inicio += longitud
+            if not frame.valido:
+                yield {'detected': False, 'error': 'No se pudo decodificar la imagen.', 'invalid_image': True}
+            else:
+                yield frame.reducida, frame.recorte_gris, frame.caja_completa
+    return _clasificar_lote(entradas(), sesion_id)
+
+def detectar_emociones_frames_local(imagenes, sesion_id=None):
+    """
+    Como detectar_emociones_lote_bytes_local, pero con frames BGR ya decodificados (ej. de un video).
+    `imagenes` puede ser un generador: cada frame se consume, se localiza el rostro y se libera
+    antes de leer el siguiente, así que solo se acumulan los recortes de 48x48.
+    """
+    if get_model() is None:
+        return [{'detected': False, 'error': 'Modelo no disponible'} for _ in imagenes]
+    return _clasificar_lote(((imagen, _recorte_gris_bgr(imagen), lambda box: box) for imagen in imagenes), sesion_id)
+
+def _clasificar_lote(entradas, sesion_id):
+    # `entradas`: por frame, (imagen de detección, recorte_gris, caja_completa) o un resultado ya resuelto
+    resultados, tensores, pendientes = [], [], []
+    for entrada in entradas:
+        if isinstance(entrada, dict):
+            resultados.append(entrada)
+            continue
+        try:
+            rostro = _localizar_rostro(entrada[0], sesion_id, entrada[1], entrada[2])
+        except Exception as e:
+            rostro = {'detected': False, 'error': str(e)}
+        if isinstance(rostro, dict):
+            resultados.append(rostro)
+            continue
+        tensores.append(rostro[0])
+        pendientes.append((len(resultados), rostro[1]))
+        resultados.append(None)
+
+    if tensores:
+        try:
+            predictions = _predecir_lote(np.stack(tensores))
+            for (i, box), p in zip(pendientes, predictions):
+                resultados[i] = {'detected': True, **_resultado_emocion(p, box)}
+        except Exception as e:
+            for i, _ in pendientes:
+                resultados[i] = {'detected': False, 'error': str(e)}
+    return resultados
+
+def detectar_emociones_multiples_local(imagen):
+    if get_model() is None:
+        return {'detected': False, 'error': 'Modelo no disponible'}
+
+    try:
+        max_rostros = getattr(settings, 'EMOCION_MULTI_FACE_MAX', 30)
+        with medir_etapa('deteccion'):
+            cajas = [
+                (x, y, w, h) for x, y, w, h in _cajas_rostros(imagen)
+                if w >= MIN_FACE_SIZE and h >= MIN_FACE_SIZE
+            ][:max_rostros]
+
+        if not cajas:
+            return {'detected': False, 'faces': [], 'message': MENSAJE_SIN_ROSTRO}
+
+        # Todos los rostros se clasifican en una sola pasada del modelo
+        batch = np.stack([preprocesar_rostro(imagen[y:y+h, x:x+w]) for x, y, w, h in cajas])
+        predictions = _predecir_lote(batch)
 
         return {
             'detected': True,
-            'emotion': EMOTION_LABELS[emotion_idx],
-            'confidence': float(predictions[emotion_idx]),
-            'all_emotions': {e: float(p) for e, p in zip(EMOTION_LABELS, predictions)},
-            'face_box': (x, y, w, h)
+            'faces': [_resultado_emocion(p, box) for p, box in zip(predictions, cajas)]
         }
-        
+
     except Exception as e:
         return {'detected': False, 'error': str(e)}
-    finally:
-        face_detection.close()
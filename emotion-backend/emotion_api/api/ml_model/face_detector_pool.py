@@ -0,0 +1,149 @@
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
+
+# Parámetros de MediaPipe usados por detectar_emocion
+MODEL_SELECTION = 1
+MIN_DETECTION_CONFIDENCE = 0.7
+
+
+class FaceDetectorPool:
+    """
+    Pool de detectores de rostros de MediaPipe de larga duración.
+
+    Un grafo FaceDetection no es seguro para usarse desde varios hilos a la vez,
+    así que cada hilo toma un detector en exclusiva mientras procesa un frame y
+    lo devuelve al terminar. Los detectores se crean bajo demanda hasta `size`
+    (normalmente uno por hilo del servidor) y se reutilizan entre frames.
+    """
+
+    def __init__(self, size=4, model_selection=MODEL_SELECTION, min_detection_confidence=MIN_DETECTION_CONFIDENCE):
+        if size < 1:
+            raise ValueError("El tamaño del pool de detectores debe ser al menos 1.")
+        self.size = size
+        self.model_selection = model_selection
+        self.min_detection_confidence = min_detection_confidence
+        self._idle = queue.LifoQueue() # LIFO: reutiliza el detector más "caliente"
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _create_detector(self):
+        # Importación diferida: MediaPipe solo se carga cuando se procesa el primer frame
+        import mediapipe as mp
+        return mp.solutions.face_detection.FaceDetection(
+            model_selection=self.model_selection,
+            min_detection_confidence=self.min_detection_confidence
+        )
+
+    def _take(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("El pool de detectores está cerrado.")
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._create_detector()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        # Todos los detectores están ocupados: esperar a que se libere uno
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No hay detectores de rostros disponibles.")
+
+    def _release(self, detector):
+        with self._lock:
+            closed = self._closed
+        if closed:
+            detector.close()
+        else:
+            self._idle.put(detector)
+
+    @contextmanager
+    def acquire(self, timeout=30):
+        """Presta un detector en exclusiva al hilo actual durante el bloque `with`."""
+        detector = self._take(timeout)
+        if self._closed:
+            # El pool se cerró mientras esperábamos
+            detector.close()
+            raise RuntimeError("El pool de detectores está cerrado.")
+        try:
+            yield detector
+        finally:
+            self._release(detector)
+
+    def process(self, rgb_frame):
+        """Atajo: ejecuta la detección de rostros sobre un frame RGB."""
+        with self.acquire() as detector:
+            return detector.process(rgb_frame)
+
+    def close(self):
+        """Cierra todos los detectores inactivos; los prestados se cierran al devolverse."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                detector = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            detector.close()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'created': self._created,
+            'idle': self._idle.qsize(),
+            'closed': self._closed,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_face_detector_pool():
+    """Devuelve el pool compartido del proceso, creándolo con el tamaño configurado."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from django.conf import settings
+                size = getattr(settings, 'EMOCION_FACE_DETECTOR_POOL_SIZE', 4)
+                _pool = FaceDetectorPool(size=size)
+    return _pool
+
+
+def current_face_detector_pool():
+    """El pool ya creado (sin crearlo); útil para estadísticas."""
+    return _pool
+
+
+def shutdown_face_detector_pool():
+    """Cierra el pool compartido (se registra con atexit para un apagado limpio)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+atexit.register(shutdown_face_detector_pool)
@@ -0,0 +1,452 @@
+import atexit
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+# Servicio local de inferencia fuera de proceso.
+#
+# Un proceso supervisor (manage.py run_inference_service) arranca WORKERS procesos que
+# son los únicos que cargan TensorFlow/MediaPipe. Los workers de Django no cargan el
+# modelo: copian el frame decodificado a un bloque de memoria compartida propio del
+# hilo y envían por socket solo su nombre, forma y dtype. El worker del servicio se
+# conecta a ese bloque, ejecuta la detección sin copiar el frame y devuelve el
+# diccionario de resultado.
+
+
+def service_config():
+    from django.conf import settings
+    config = {
+        'ENABLED': False,
+        'ADDRESS': ('127.0.0.1', 6010),
+        'AUTHKEY': None,
+        'WORKERS': 2,
+        'THREADS_PER_WORKER': 2,
+        'TIMEOUT_SECONDS': 10,
+    }
+    config.update(getattr(settings, 'EMOCION_INFERENCE_SERVICE', {}))
+    return config
+
+
+def _authkey(authkey):
+    # Los mensajes van con pickle: sin una clave secreta, cualquier proceso local que se conecte
+    # podría ejecutar código en el servicio. No hay clave por defecto.
+    if not authkey:
+        raise ImproperlyConfigured(
+            "Falta la clave del servicio de inferencia: define la variable de entorno EMOCION_INFERENCE_AUTHKEY "
+            "(la misma en el servicio y en Django)."
+        )
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+def _attach_shared_memory(name):
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix':
+        # El bloque pertenece al cliente: evitar que el resource_tracker de este
+        # proceso lo elimine (o avise de una "fuga") cuando el worker termine
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+# --- Lado del servicio ---
+
+def _worker_main(worker_id, conn, threads):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emotion_api.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    # Un detector de rostros por hilo; el micro-batching agrupa los rostros de los hilos
+    settings.EMOCION_FACE_DETECTOR_POOL_SIZE = threads
+
+    from .detector import (
+        detectar_emocion_bytes_local,
+        detectar_emocion_local,
+        detectar_emociones_lote_bytes_local,
+        detectar_emociones_multiples_local,
+        warmup,
+    )
+    warmup()
+    modos = {
+        'simple': detectar_emocion_local,
+        'bytes': detectar_emocion_bytes_local,
+        'multiple': detectar_emociones_multiples_local,
+        'lote': detectar_emociones_lote_bytes_local,
+    }
+
+    tasks = queue.Queue()
+    send_lock = threading.Lock()
+
+    def handle_tasks():
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, request = task
+            try:
+                shm = _attach_shared_memory(request['shm'])
+                try:
+                    frame = np.ndarray(request['shape'], dtype=np.dtype(request['dtype']), buffer=shm.buf)
+                    detectar = modos[request.get('modo', 'simple')]
+                    result = detectar(frame, **request.get('opciones', {}))
+                    del frame
+                finally:
+                    shm.close()
+            except Exception as e:
+                result = {'detected': False, 'error': f"Error en el worker de inferencia: {e}"}
+            with send_lock:
+                conn.send((task_id, result))
+
+    handlers = [
+        threading.Thread(target=handle_tasks, name=f'inference-worker-{worker_id}-{i}', daemon=True)
+        for i in range(threads)
+    ]
+    for handler in handlers:
+        handler.start()
+
+    # El hilo principal solo reparte tareas; None o el cierre del pipe indican que hay que terminar
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        tasks.put(task)
+    for _ in handlers:
+        tasks.put(None)
+    for handler in handlers:
+        handler.join()
+
+
+class _Pending:
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class _WorkerHandle:
+    """Proceso de inferencia con su pipe propio y las tareas que tiene en curso."""
+
+    def __init__(self, worker_id, process, conn):
+        self.worker_id = worker_id
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.inflight = set()
+
+
+class InferenceService:
+    """
+    Pool de procesos de inferencia con reinicio automático de workers caídos.
+
+    Cada worker tiene su propio pipe (en vez de colas compartidas), de modo que un
+    worker que muere a mitad de una operación no puede dejar bloqueado al resto.
+    Las tareas se reparten al worker con menos tareas en curso.
+    """
+
+    def __init__(self, address, authkey, workers=2, threads_per_worker=2, timeout=10):
+        self.address = tuple(address) if isinstance(address, list) else address
+        self.authkey = _authkey(authkey)
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.timeout = timeout
+        # 'spawn' evita heredar estado de TensorFlow/hilos del proceso padre
+        self._ctx = multiprocessing.get_context('spawn')
+        self._handles = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._stopping = threading.Event()
+        self._listener = None
+        self.restarts = 0
+
+    def _spawn_worker(self, worker_id):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, child_conn, self.threads_per_worker),
+            name=f'inference-worker-{worker_id}',
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        handle = _WorkerHandle(worker_id, process, parent_conn)
+        with self._lock:
+            self._handles[worker_id] = handle
+        threading.Thread(target=self._read_results, args=(handle,), daemon=True).start()
+
+    def start(self):
+        for worker_id in range(self.workers):
+            self._spawn_worker(worker_id)
+        # backlog amplio: muchos hilos de Django pueden conectarse a la vez al arrancar
+        self._listener = Listener(self.address, backlog=128, authkey=self.authkey)
+        for target in (self._supervise, self._accept):
+            threading.Thread(target=target, name=f'inference-service-{target.__name__}', daemon=True).start()
+
+    def _read_results(self, handle):
+        while True:
+            try:
+                task_id, result = handle.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                handle.inflight.discard(task_id)
+                pending = self._pending.pop(task_id, None)
+            if pending is not None:
+                pending.result = result
+                pending.event.set()
+
+    def _supervise(self):
+        while not self._stopping.wait(0.5):
+            for worker_id, handle in list(self._handles.items()):
+                if handle.process.is_alive() or self._stopping.is_set():
+                    continue
+                logger.warning("Worker de inferencia %s terminó (código %s); reiniciando.", worker_id, handle.process.exitcode)
+                self._fail_inflight(handle)
+                handle.conn.close()
+                self.restarts += 1
+                self._spawn_worker(worker_id)
+
+    def _fail_inflight(self, handle, error='El worker de inferencia se reinició.'):
+        with self._lock:
+            lost = [self._pending.pop(task_id, None) for task_id in handle.inflight]
+            handle.inflight.clear()
+        for pending in lost:
+            if pending is not None:
+                pending.result = {'detected': False, 'error': error}
+                pending.event.set()
+
+    def _accept(self):
+        while not self._stopping.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError):
+                if self._stopping.is_set():
+                    break
+                continue
+            except Exception:
+                # Cliente con clave incorrecta u otro error de handshake
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        with conn:
+            while not self._stopping.is_set():
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    conn.send(self.stats() if request.get('ping') else self.submit(request))
+                except (EOFError, OSError):
+                    break
+
+    def submit(self, request):
+        task_id = next(self._ids)
+        pending = _Pending()
+        with self._lock:
+            alive = [h for h in self._handles.values() if h.process.is_alive()]
+            if not alive:
+                return {'detected': False, 'error': 'No hay workers de inferencia disponibles.'}
+            sesion_id = request.get('opciones', {}).get('sesion_id')
+            if sesion_id is not None:
+                # Afinidad por sesión: el seguimiento del rostro vive en la memoria de cada worker
+                handle = alive[hash(sesion_id) % len(alive)]
+            else:
+                handle = min(alive, key=lambda h: len(h.inflight))
+            handle.inflight.add(task_id)
+            self._pending[task_id] = pending
+        try:
+            with handle.send_lock:
+                handle.conn.send((task_id, request))
+        except (EOFError, OSError):
+            self._fail_inflight(handle, 'El worker de inferencia no está disponible.')
+
+        if not pending.event.wait(self.timeout):
+            with self._lock:
+                handle.inflight.discard(task_id)
+                self._pending.pop(task_id, None)
+            return {'detected': False, 'error': 'Tiempo de espera agotado en el servicio de inferencia.'}
+        return pending.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': {wid: h.process.is_alive() for wid, h in self._handles.items()},
+                'inflight': {wid: len(h.inflight) for wid, h in self._handles.items()},
+                'pending': len(self._pending),
+                'restarts': self.restarts,
+            }
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._listener is not None:
+            self._listener.close()
+        handles = list(self._handles.values())
+        for handle in handles:
+            try:
+                with handle.send_lock:
+                    handle.conn.send(None)
+            except (EOFError, OSError):
+                pass
+        deadline = time.monotonic() + timeout
+        for handle in handles:
+            handle.process.join(max(0.0, deadline - time.monotonic()))
+            if handle.process.is_alive():
+                handle.process.terminate()
+            handle.conn.close()
+
+
+# --- Lado del cliente (procesos de Django) ---
+
+class InferenceClient:
+    """
+    Cliente del servicio de inferencia. Cada hilo mantiene su propia conexión y su
+    propio bloque de memoria compartida, que se reutiliza entre frames y solo se
+    recrea si llega un frame más grande.
+    """
+
+    def __init__(self, address, authkey, timeout=10):
+        self.address = tuple(address) if isinstance(address, list) else address
+        self.authkey = _authkey(authkey)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._segments = set()
+        self._segments_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _buffer(self, nbytes):
+        shm = getattr(self._local, 'shm', None)
+        if shm is None or shm.size < nbytes:
+            self._discard_buffer()
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._local.shm = shm
+            with self._segments_lock:
+                self._segments.add(shm)
+        return shm
+
+    def _discard_buffer(self):
+        shm = getattr(self._local, 'shm', None)
+        self._local.shm = None
+        if shm is not None:
+            with self._segments_lock:
+                self._segments.discard(shm)
+            shm.close()
+            shm.unlink()
+
+    def detectar_emocion(self, imagen, **opciones):
+        return self._enviar(imagen, 'simple', opciones)
+
+    def detectar_emocion_bytes(self, data, **opciones):
+        # Se envía el JPEG codificado: mucho menos que el frame decodificado, y el worker lo decodifica por etapas
+        return self._enviar(np.frombuffer(data, np.uint8), 'bytes', opciones)
+
+    def detectar_emociones_lote_bytes(self, data, longitudes, **opciones):
+        # Los frames van concatenados en un único bloque de memoria compartida
+        return self._enviar(np.frombuffer(data, np.uint8), 'lote', dict(opciones, longitudes=longitudes))
+
+    def detectar_emociones_multiples(self, imagen, **opciones):
+        return self._enviar(imagen, 'multiple', opciones)
+
+    def _enviar(self, imagen, modo, opciones):
+        frame = np.ascontiguousarray(imagen)
+        shm = self._buffer(frame.nbytes)
+        np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf)[...] = frame
+        request = {'shm': shm.name, 'shape': frame.shape, 'dtype': frame.dtype.str, 'modo': modo, 'opciones': opciones}
+
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send(request)
+                if not conn.poll(self.timeout):
+                    # El worker podría seguir leyendo el bloque: no reutilizarlo
+                    self._drop_connection()
+                    self._discard_buffer()
+                    return {'detected': False, 'error': 'Tiempo de espera agotado en el servicio de inferencia.'}
+                return conn.recv()
+            except (ConnectionError, EOFError, OSError) as e:
+                # Conexión caída (ej. servicio reiniciado): reconectar una vez
+                self._drop_connection()
+                if attempt:
+                    return {'detected': False, 'error': f"Servicio de inferencia no disponible: {e}"}
+
+    def ping(self):
+        """Estado del servicio (workers vivos, tareas pendientes, reinicios)."""
+        conn = self._connection()
+        try:
+            conn.send({'ping': True})
+            if not conn.poll(self.timeout):
+                raise TimeoutError("El servicio de inferencia no responde.")
+            return conn.recv()
+        except Exception:
+            self._drop_connection()
+            raise
+
+    def close(self):
+        self._drop_connection()
+        with self._segments_lock:
+            segments, self._segments = self._segments, set()
+        for shm in segments:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_inference_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                config = service_config()
+                _client = InferenceClient(config['ADDRESS'], config['AUTHKEY'], timeout=config['TIMEOUT_SECONDS'])
+    return _client
+
+
+def service_enabled():
+    from django.conf import settings
+    return getattr(settings, 'EMOCION_INFERENCE_SERVICE', {}).get('ENABLED', False)
+
+
+def shutdown_inference_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(shutdown_inference_client)
@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+
+# Lado corto mínimo (en píxeles) de la imagen reducida sobre la que se detectan rostros.
+# MediaPipe reescala internamente a 128/192 px, así que detectar sobre más píxeles no ayuda.
+DETECTION_MIN_SIDE = 240
+
+# Tamaño mínimo del recorte reducido para clasificar sin volver a decodificar (entrada del modelo)
+CROP_MIN_SIDE = 48
+
+# Lecturas reducidas de cv2.imdecode: el decodificador JPEG escala en el dominio DCT,
+# así que decodificar a 1/2, 1/4 o 1/8 es bastante más barato que la resolución completa
+_LECTURAS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Marcadores SOF de JPEG (todos los 0xC0-0xCF salvo DHT, JPG y DAC)
+_MARCADORES_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def dimensiones_jpeg(data):
+    """(ancho, alto) leídos de la cabecera SOF de un JPEG sin decodificarlo, o None si no es JPEG."""
+    data = memoryview(data)
+    if data[:2] != b'\xff\xd8':
+        return None
+    i, n = 2, len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF: # Relleno entre segmentos
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8: # Marcadores sin longitud
+            i += 2
+            continue
+        if marker in _MARCADORES_SOF:
+            alto = int.from_bytes(data[i + 5:i + 7], 'big')
+            ancho = int.from_bytes(data[i + 7:i + 9], 'big')
+            return ancho, alto
+        i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+    return None
+
+
+def factor_reduccion(dimensiones, min_side=DETECTION_MIN_SIDE):
+    """Mayor factor (8, 4 o 2) que deja el lado corto en al menos `min_side`; 1 si no se conoce el tamaño."""
+    if not dimensiones:
+        return 1
+    lado_corto = min(dimensiones)
+    for factor in (8, 4, 2):
+        if lado_corto // factor >= min_side:
+            return factor
+    return 1
+
+
+class FrameEscalonado:
+    """
+    Frame decodificado por etapas a partir de sus bytes (JPEG/PNG/WebP).
+
+    1. Se decodifica a resolución reducida en color: sobre esa imagen se detecta el rostro.
+    2. Si el rostro ocupa al menos CROP_MIN_SIDE píxeles en la imagen reducida, se recorta
+       de ahí mismo (ya basta para la entrada 48x48 del modelo).
+    3. Si no, se decodifica la resolución completa directamente en escala de grises (sin
+       conversión de color ni copia BGR) y se recorta la caja reescalada.
+    """
+
+    def __init__(self, data, min_side=DETECTION_MIN_SIDE):
+        self._data = memoryview(data)
+        self.factor = factor_reduccion(dimensiones_jpeg(self._data), min_side)
+        self.reducida = cv2.imdecode(np.frombuffer(self._data, np.uint8), _LECTURAS[self.factor])
+        self._gris_completa = None
+
+    @property
+    def valido(self):
+        return self.reducida is not None
+
+    @property
+    def decodificado_completo(self):
+        return self._gris_completa is not None
+
+    def caja_completa(self, box):
+        """Lleva una caja de la imagen reducida a coordenadas de la resolución completa."""
+        x, y, w, h = box
+        f = self.factor
+        return x * f, y * f, w * f, h * f
+
+    def recorte_gris(self, box):
+        """Recorte en escala de grises del rostro (caja en coordenadas de la imagen reducida)."""
+        x, y, w, h = box
+        if self.factor == 1 or (w >= CROP_MIN_SIDE and h >= CROP_MIN_SIDE):
+            return cv2.cvtColor(self.reducida[y:y+h, x:x+w], cv2.COLOR_BGR2GRAY)
+        if self._gris_completa is None:
+            self._gris_completa = cv2.imdecode(np.frombuffer(self._data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        x, y, w, h = self.caja_completa(box)
+        return self._gris_completa[y:y+h, x:x+w] # Vista, sin copia
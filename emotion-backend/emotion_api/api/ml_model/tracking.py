@@ -0,0 +1,171 @@
+import threading
+import time
+
+import cv2
+
+# Ancho (en píxeles) al que se reduce la plantilla del rostro para la búsqueda local
+TEMPLATE_WIDTH = 32
+
+# Motivos por los que un frame necesita la detección completa de MediaPipe
+MOTIVOS_DETECCION = ('sin_seguimiento', 'periodica', 'baja_confianza')
+
+
+class _Seguimiento:
+    __slots__ = ('box', 'template', 'scale', 'frames_since_full', 'last_seen')
+
+    def __init__(self, box, template, scale, now):
+        self.box = box
+        self.template = template
+        self.scale = scale
+        self.frames_since_full = 0
+        self.last_seen = now
+
+
+def _region_gris(imagen, x, y, w, h, scale):
+    gray = cv2.cvtColor(imagen[y:y+h, x:x+w], cv2.COLOR_BGR2GRAY)
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+class FaceTrackCache:
+    """
+    Seguimiento del rostro por sesión de actividad.
+
+    Un alumno permanece frente a la misma cámara durante toda la sesión, así que el
+    rostro casi no se mueve entre frames. Tras una detección completa se guarda la caja
+    y una plantilla reducida del rostro; en los frames siguientes se busca esa plantilla
+    (correlación normalizada) solo en una región alrededor de la última caja, lo que es
+    mucho más barato que ejecutar MediaPipe sobre el frame entero. La detección completa
+    se repite cada `full_detection_every` frames o cuando la correlación cae por debajo
+    de `min_confidence`. Las sesiones sin frames durante `ttl_seconds` se descartan.
+    """
+
+    def __init__(self, full_detection_every=10, min_confidence=0.6, search_margin=0.5, ttl_seconds=300):
+        if full_detection_every < 1:
+            raise ValueError("full_detection_every debe ser al menos 1.")
+        self.full_detection_every = full_detection_every
+        self.min_confidence = min_confidence
+        self.search_margin = search_margin
+        self.ttl_seconds = ttl_seconds
+        self._tracks = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._tracked = 0
+        self._full = dict.fromkeys(MOTIVOS_DETECCION, 0)
+        self._evicted = 0
+
+    def _sweep(self, now):
+        # Llamar con el lock tomado; recorre el diccionario como mucho una vez por cuarto de TTL
+        if now - self._last_sweep < self.ttl_seconds / 4:
+            return
+        self._last_sweep = now
+        expirados = [k for k, t in self._tracks.items() if now - t.last_seen > self.ttl_seconds]
+        for k in expirados:
+            del self._tracks[k]
+        self._evicted += len(expirados)
+
+    def track(self, sesion_id, imagen):
+        """
+        Busca el rostro de la sesión cerca de su última posición.
+        Devuelve (x, y, w, h) o None si el frame necesita la detección completa.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            track = self._tracks.get(sesion_id)
+            if track is not None and now - track.last_seen > self.ttl_seconds:
+                del self._tracks[sesion_id]
+                self._evicted += 1
+                track = None
+            if track is None:
+                self._full['sin_seguimiento'] += 1
+                return None
+            if track.frames_since_full + 1 >= self.full_detection_every:
+                self._full['periodica'] += 1
+                return None
+            box, template, scale = track.box, track.template, track.scale
+
+        # Región de búsqueda: la última caja ampliada por search_margin en cada lado
+        ih, iw = imagen.shape[:2]
+        x, y, w, h = box
+        mx, my = int(w * self.search_margin), int(h * self.search_margin)
+        rx, ry = max(0, x - mx), max(0, y - my)
+        rw, rh = min(iw, x + w + mx) - rx, min(ih, y + h + my) - ry
+        region = _region_gris(imagen, rx, ry, rw, rh, scale)
+
+        score = -1.0
+        if region.shape[0] >= template.shape[0] and region.shape[1] >= template.shape[1]:
+            result = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (lx, ly) = cv2.minMaxLoc(result)
+
+        with self._lock:
+            if score < self.min_confidence:
+                self._full['baja_confianza'] += 1
+                return None
+            nx = min(max(0, rx + int(round(lx / scale))), iw - w)
+            ny = min(max(0, ry + int(round(ly / scale))), ih - h)
+            track = self._tracks.get(sesion_id)
+            if track is not None:
+                track.box = (nx, ny, w, h)
+                track.frames_since_full += 1
+                track.last_seen = now
+            self._tracked += 1
+        return (nx, ny, w, h)
+
+    def update(self, sesion_id, imagen, box):
+        """Registra la caja de una detección completa y renueva la plantilla del rostro."""
+        x, y, w, h = box
+        scale = TEMPLATE_WIDTH / float(w)
+        template = _region_gris(imagen, x, y, w, h, scale)
+        with self._lock:
+            self._tracks[sesion_id] = _Seguimiento(box, template, scale, time.monotonic())
+
+    def discard(self, sesion_id):
+        with self._lock:
+            self._tracks.pop(sesion_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._tracks.clear()
+
+    def stats(self):
+        with self._lock:
+            full = sum(self._full.values())
+            frames = self._tracked + full
+            return {
+                'sessions': len(self._tracks),
+                'frames': frames,
+                'tracked': self._tracked,
+                'full_detections': full,
+                'full_detection_reasons': dict(self._full),
+                'skip_rate': self._tracked / frames if frames else None,
+                'evicted': self._evicted,
+            }
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_face_tracker():
+    """Devuelve la caché de seguimiento del proceso, o None si está desactivada en los ajustes."""
+    global _tracker
+    if _tracker is None:
+        from django.conf import settings
+        config = getattr(settings, 'EMOCION_FACE_TRACKING', {})
+        if not config.get('ENABLED', True):
+            return None
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = FaceTrackCache(
+                    full_detection_every=config.get('FULL_DETECTION_EVERY', 10),
+                    min_confidence=config.get('MIN_CONFIDENCE', 0.6),
+                    search_margin=config.get('SEARCH_MARGIN', 0.5),
+                    ttl_seconds=config.get('TTL_SECONDS', 300),
+                )
+    return _tracker
+
+
+def current_tracker():
+    """La caché ya creada (sin crearla); útil para estadísticas."""
+    return _tracker
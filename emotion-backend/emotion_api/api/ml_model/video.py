@@ -0,0 +1,98 @@
+import math
+import os
+
+import cv2
+
+# Lado de los workers del análisis de videos grabados (api/video_analysis.py).
+#
+# Cada tarea es un segmento del video: el worker abre el archivo, salta al inicio del segmento,
+# decodifica solo los frames que caen en la rejilla de muestreo (`fps` frames por segundo de
+# video) y clasifica sus rostros en una sola pasada del modelo. Este módulo no importa modelos
+# de Django para que los procesos 'spawn' lo puedan cargar antes de django.setup().
+
+
+def propiedades_video(path):
+    """fps, número de frames y duración (segundos) del video, o ValueError si OpenCV no lo puede abrir."""
+    captura = cv2.VideoCapture(path)
+    try:
+        if not captura.isOpened():
+            raise ValueError(f"No se pudo abrir el video '{path}'.")
+        fps = captura.get(cv2.CAP_PROP_FPS) or 0.0
+        frames = int(captura.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    finally:
+        captura.release()
+    if fps <= 0 or frames <= 0:
+        raise ValueError(f"El video '{path}' no informa fps ni número de frames.")
+    return {'fps': fps, 'frames': frames, 'duracion': frames / fps}
+
+
+def plan_segmentos(duracion, segundos_por_segmento):
+    """Lista de (inicio, fin) en segundos enteros que cubre todo el video."""
+    total = max(1, math.ceil(duracion / segundos_por_segmento))
+    return [
+        (i * segundos_por_segmento, min((i + 1) * segundos_por_segmento, math.ceil(duracion)))
+        for i in range(total)
+    ]
+
+
+def instantes_muestreo(inicio, fin, fps):
+    """Instantes (segundos) de la rejilla global k / fps que caen en [inicio, fin)."""
+    return [k / fps for k in range(math.ceil(inicio * fps - 1e-9), math.ceil(fin * fps - 1e-9))]
+
+
+def inicializar_worker(hilos):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emotion_api.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    # Cada worker procesa un segmento a la vez: un detector de rostros, sin micro-batching
+    # (los frames del segmento ya van en un lote) y pocos hilos para no competir con los demás workers
+    settings.EMOCION_FACE_DETECTOR_POOL_SIZE = 1
+    settings.EMOCION_BATCH_ENABLED = False
+    settings.EMOCION_INFERENCE_THREADS = hilos
+    cv2.setNumThreads(hilos)
+
+    from .detector import warmup
+    warmup()
+
+
+def analizar_segmento(path, indice, inicio, fin, fps):
+    """
+    Analiza un segmento del video (en un worker del pool). Devuelve (índice, [(momento_segundo, resultado)]),
+    con un resultado por instante de muestreo que se pudo leer.
+    """
+    from .detector import detectar_emociones_frames_local, olvidar_sesion
+
+    objetivos = instantes_muestreo(inicio, fin, fps)
+    momentos = []
+    captura = cv2.VideoCapture(path)
+    fps_video = captura.get(cv2.CAP_PROP_FPS) or 30.0
+    medio_frame = 0.5 / fps_video
+
+    def frames():
+        # grab() sin retrieve() avanza sin convertir el frame: solo se decodifican los muestreados
+        pendientes = iter(objetivos)
+        objetivo = next(pendientes, None)
+        if objetivo is not None and inicio > 0:
+            captura.set(cv2.CAP_PROP_POS_MSEC, inicio * 1000.0)
+        while objetivo is not None and captura.grab():
+            t = captura.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if t + medio_frame < objetivo:
+                continue
+            ok, imagen = captura.retrieve()
+            # El segundo es el del instante de muestreo, no el del frame (que puede caer justo antes)
+            momento = int(objetivo + 1e-9)
+            while objetivo is not None and objetivo <= t + medio_frame:
+                objetivo = next(pendientes, None)
+            if ok:
+                momentos.append(momento)
+                yield imagen
+
+    # El seguimiento del rostro (api/ml_model/tracking.py) se aplica dentro del segmento
+    clave = f'video:{path}:{indice}'
+    try:
+        resultados = detectar_emociones_frames_local(frames(), sesion_id=clave)
+    finally:
+        captura.release()
+        olvidar_sesion(clave)
+    return indice, list(zip(momentos, resultados))
@@ -1,4 +1,7 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
 
 # Create your models here.
 from django.contrib.auth.models import AbstractUser
@@ -77,6 +80,51 @@ class SesionActividad(models.Model):
         return f"Sesión {self.id} - {self.actividad.nombre} por {self.alumno.username}"
 
 # Análisis emocional asociado a una sesión
+class AnalisisEmocionQuerySet(models.QuerySet):
+    def upsert(self, filas, batch_size=None):
+        """
+        INSERT ... ON CONFLICT (sesion, momento_segundo) DO UPDATE: el reintento de un frame (o un diario
+        del write-behind que se vuelve a insertar) sobrescribe el análisis de ese segundo en lugar de duplicarlo.
+        """
+        unicas = {}
+        for fila in filas:
+            unicas[(fila.sesion_id, fila.momento_segundo)] = fila # Repetidas en el mismo lote: gana la última
+        if not unicas:
+            return []
+        campos = [
+            f.name for f in self.model._meta.concrete_fields
+            if not f.primary_key and f.name not in ('sesion', 'momento_segundo')
+        ]
+        momentos = defaultdict(list)
+        for sesion_id, momento in unicas:
+            momentos[sesion_id].append(momento)
+        existentes = Q()
+        for sesion_id, lista in momentos.items():
+            existentes |= Q(sesion_id=sesion_id, momento_segundo__in=lista)
+
+        with transaction.atomic(using=self.db):
+            # Dos reintentos concurrentes del mismo frame podrían leer ambos "sin fila anterior" y sumar
+            # dos veces. Antes de leer se bloquea el resumen de cada sesión: crearlo es una escritura
+            # (en SQLite toma el bloqueo de escritura de la base) y select_for_update bloquea la fila en
+            # las bases que lo soportan. Así, los upserts de una misma sesión se hacen de a uno.
+            sesiones = sorted(momentos)
+            ResumenEmocionSesion.objects.bulk_create(
+                [ResumenEmocionSesion(sesion_id=sesion_id) for sesion_id in sesiones], ignore_conflicts=True
+            )
+            list(ResumenEmocionSesion.objects.select_for_update().filter(sesion_id__in=sesiones)
+                 .order_by('sesion_id').values_list('sesion_id', flat=True))
+            # Las filas que se van a sobrescribir se restan de los contadores materializados (una consulta por lote)
+            anteriores = list(self.filter(existentes).values_list(*AnalisisEmocion.CAMPOS_CONTADORES))
+            guardadas = self.bulk_create(
+                list(unicas.values()), batch_size=batch_size,
+                update_conflicts=True, unique_fields=['sesion', 'momento_segundo'], update_fields=campos,
+            )
+            nuevas = [f.valores_contadores() for f in unicas.values()]
+            for modelo in (ResumenEmocionSesion, CeldaEmocionSesion):
+                modelo.objects.aplicar(anteriores, nuevas)
+        return guardadas
+
+
 class AnalisisEmocion(models.Model):
     EMOCIONES = [
         ('enojo', 'Enojo'),
@@ -85,14 +133,194 @@ class AnalisisEmocion(models.Model):
         ('felicidad', 'Felicidad'),
         ('tristeza', 'Tristeza'),
         ('sorpresa', 'Sorpresa'),
-        ('neutral', 'Neutral')
+        ('neutral', 'Neutral'),
+        ('no_detectado', 'No detectado') # Frame sin rostro utilizable
     ]
 
     sesion = models.ForeignKey(SesionActividad, on_delete=models.CASCADE)
     momento_segundo = models.PositiveIntegerField()
     emocion_predominante = models.CharField(max_length=20, choices=EMOCIONES)
     confianza_emocion = models.FloatField()
-    datos_raw_emociones = models.JSONField()
+    # Probabilidad de cada emoción en columnas propias (antes, un JSON por fila). Son NULL si no hubo detección.
+    prob_sorpresa = models.FloatField(null=True, blank=True)
+    prob_miedo = models.FloatField(null=True, blank=True)
+    prob_disgusto = models.FloatField(null=True, blank=True)
+    prob_felicidad = models.FloatField(null=True, blank=True)
+    prob_tristeza = models.FloatField(null=True, blank=True)
+    prob_enojo = models.FloatField(null=True, blank=True)
+    prob_neutral = models.FloatField(null=True, blank=True)
+    reutilizado = models.BooleanField(default=False) # True si el frame era casi idéntico al anterior y se reutilizó su resultado
+
+    objects = AnalisisEmocionQuerySet.as_manager()
+
+    # Lo que necesitan los contadores materializados (ResumenEmocionSesion, CeldaEmocionSesion) de cada fila
+    CAMPOS_CONTADORES = ('sesion_id', 'momento_segundo', 'emocion_predominante', 'confianza_emocion')
+
+    def valores_contadores(self):
+        return tuple(getattr(self, campo) for campo in self.CAMPOS_CONTADORES)
+
+    class Meta:
+        constraints = [
+            # Un análisis por segundo de sesión. Su índice (sesion_id, momento_segundo) sirve también
+            # para leer la línea de tiempo de una sesión por rango y ya ordenada.
+            models.UniqueConstraint(fields=['sesion', 'momento_segundo'], name='analisis_sesion_momento_unico'),
+        ]
+
+    # Emociones con columna de probabilidad, en el orden de salida del modelo (EMOTION_LABELS del detector)
+    PROBABILIDADES = ('sorpresa', 'miedo', 'disgusto', 'felicidad', 'tristeza', 'enojo', 'neutral')
+
+    # Vista como diccionario {emoción: probabilidad}, igual que el antiguo JSONField: la API no cambia
+    # y AnalisisEmocion(datos_raw_emociones={...}) sigue funcionando.
+    @property
+    def datos_raw_emociones(self):
+        return {
+            emocion: valor
+            for emocion in self.PROBABILIDADES
+            if (valor := getattr(self, f'prob_{emocion}')) is not None
+        }
+
+    @datos_raw_emociones.setter
+    def datos_raw_emociones(self, datos):
+        datos = datos or {}
+        for emocion in self.PROBABILIDADES:
+            valor = datos.get(emocion)
+            setattr(self, f'prob_{emocion}', float(valor) if valor is not None else None)
+
+class ContadoresEmocionQuerySet(models.QuerySet):
+    """
+    Contadores de emociones materializados a partir de AnalisisEmocion. Cada modelo define sus campos
+    clave (CLAVE) y cómo agrupar los análisis en ellos (agrupar).
+    """
+
+    def aplicar(self, anteriores, nuevas):
+        """
+        Suma las filas `nuevas` y resta las `anteriores` (tuplas de AnalisisEmocion.CAMPOS_CONTADORES)
+        con un UPDATE ... SET campo = campo + delta por clave, sin leer los análisis ya guardados.
+        """
+        deltas = defaultdict(lambda: defaultdict(int))
+        for signo, lista in ((-1, anteriores), (1, nuevas)):
+            for sesion_id, momento_segundo, emocion, confianza in lista:
+                delta = deltas[self.model.clave(sesion_id, momento_segundo)]
+                delta['frames'] += signo
+                if emocion in AnalisisEmocion.PROBABILIDADES:
+                    delta[f'frames_{emocion}'] += signo
+                    delta['suma_confianza'] += signo * (confianza or 0.0)
+                else:
+                    delta['frames_no_detectado'] += signo
+
+        extra = {'actualizado': timezone.now()} if hasattr(self.model, 'actualizado') else {}
+        for clave, delta in deltas.items():
+            cambios = {campo: F(campo) + valor for campo, valor in delta.items() if valor}
+            if not cambios:
+                continue
+            filtro = dict(zip(self.model.CLAVE, clave))
+            if not self.filter(**filtro).update(**cambios, **extra):
+                # Primer frame de la clave: se crea la fila (si otro hilo se adelantó, se usa la suya)
+                self.bulk_create([self.model(**filtro)], ignore_conflicts=True)
+                self.filter(**filtro).update(**cambios, **extra)
+
+    def reconstruir(self, sesion_ids=None):
+        """
+        Recalcula desde AnalisisEmocion las filas de las sesiones `sesion_ids` (o de todas).
+        Devuelve el número de filas guardadas.
+        """
+        analisis = AnalisisEmocion.objects.all()
+        existentes = self.all()
+        if sesion_ids is not None:
+            analisis = analisis.filter(sesion_id__in=sesion_ids)
+            existentes = existentes.filter(sesion_id__in=sesion_ids)
+        detectado = Q(emocion_predominante__in=AnalisisEmocion.PROBABILIDADES)
+        totales = self.model.agrupar(analisis.order_by()).annotate(
+            frames=Count('id'),
+            frames_no_detectado=Count('id', filter=~detectado),
+            suma_confianza=Sum('confianza_emocion', filter=detectado, default=0.0),
+            **{
+                f'frames_{emocion}': Count('id', filter=Q(emocion_predominante=emocion))
+                for emocion in AnalisisEmocion.PROBABILIDADES
+            },
+        )
+        with transaction.atomic(using=self.db):
+            existentes.delete()
+            return len(self.bulk_create([self.model(**fila) for fila in totales], batch_size=500))
+
+
+class ContadoresEmocion(models.Model):
+    """Campos comunes de los contadores materializados (ver ContadoresEmocionQuerySet)."""
+    frames = models.PositiveIntegerField(default=0)
+    frames_no_detectado = models.PositiveIntegerField(default=0)
+    frames_sorpresa = models.PositiveIntegerField(default=0)
+    frames_miedo = models.PositiveIntegerField(default=0)
+    frames_disgusto = models.PositiveIntegerField(default=0)
+    frames_felicidad = models.PositiveIntegerField(default=0)
+    frames_tristeza = models.PositiveIntegerField(default=0)
+    frames_enojo = models.PositiveIntegerField(default=0)
+    frames_neutral = models.PositiveIntegerField(default=0)
+    suma_confianza = models.FloatField(default=0.0) # De los frames con rostro detectado
+
+    objects = ContadoresEmocionQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @property
+    def conteo(self):
+        return {emocion: getattr(self, f'frames_{emocion}') for emocion in AnalisisEmocion.PROBABILIDADES}
+
+    @property
+    def frames_detectados(self):
+        return self.frames - self.frames_no_detectado
+
+    @property
+    def confianza_media(self):
+        return self.suma_confianza / self.frames_detectados if self.frames_detectados else None
+
+    @property
+    def emocion_dominante(self):
+        conteo = self.conteo
+        return max(conteo, key=conteo.get) if self.frames_detectados else None
+
+
+# Totales de emociones de una sesión para los tableros del docente. Se mantiene al registrar cada
+# frame (AnalisisEmocionQuerySet.upsert) con deltas atómicos, sin volver a leer los análisis de la
+# sesión; manage.py rebuild_emotion_summaries lo recalcula desde cero.
+class ResumenEmocionSesion(ContadoresEmocion):
+    sesion = models.OneToOneField(SesionActividad, on_delete=models.CASCADE, primary_key=True, related_name='resumen_emociones')
+    actualizado = models.DateTimeField(auto_now=True)
+
+    CLAVE = ('sesion_id',)
+
+    @staticmethod
+    def clave(sesion_id, momento_segundo):
+        return (sesion_id,)
+
+    @staticmethod
+    def agrupar(analisis):
+        return analisis.values('sesion_id')
+
+
+# Celdas del mapa de calor de una actividad (alumnos x tiempo): los contadores de una sesión en cada
+# intervalo de ANCHO_SEGUNDOS segundos (desde el inicio de la sesión). Se mantienen igual que
+# ResumenEmocionSesion, así que leer el mapa de una actividad no depende del número de frames.
+class CeldaEmocionSesion(ContadoresEmocion):
+    ANCHO_SEGUNDOS = 10 # El mapa de calor se sirve en múltiplos de este ancho
+
+    sesion = models.ForeignKey(SesionActividad, on_delete=models.CASCADE, related_name='celdas_emociones')
+    intervalo = models.PositiveIntegerField() # momento_segundo // ANCHO_SEGUNDOS
+
+    CLAVE = ('sesion_id', 'intervalo')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sesion', 'intervalo'], name='celda_sesion_intervalo_unica'),
+        ]
+
+    @classmethod
+    def clave(cls, sesion_id, momento_segundo):
+        return (sesion_id, momento_segundo // cls.ANCHO_SEGUNDOS)
+
+    @classmethod
+    def agrupar(cls, analisis):
+        return analisis.annotate(intervalo=F('momento_segundo') / cls.ANCHO_SEGUNDOS).values('sesion_id', 'intervalo')
 
 # Calificación dada a una sesión
 class Calificacion(models.Model):
@@ -1,6 +1,8 @@
+import re
+
 from rest_framework import serializers
 
-from .models import Materia, Nivel, Usuario, CursoAlumno, CursoDocente, Actividad, SesionActividad, AnalisisEmocion, Calificacion
+from .models import Materia, Nivel, Usuario, CursoAlumno, CursoDocente, Actividad, SesionActividad, AnalisisEmocion, ResumenEmocionSesion, CeldaEmocionSesion, Calificacion
 
 class UsuarioSerializer(serializers.ModelSerializer):
     class Meta:
@@ -198,23 +200,133 @@ class SesionActividadReadSerializer(serializers.ModelSerializer):
 
 # --- Serializadores de AnalisisEmocion ---
 
+# Mismos campos y orden que antes de guardar las probabilidades en columnas (datos_raw_emociones es una propiedad del modelo)
+ANALISIS_EMOCION_FIELDS = [
+    'id', 'sesion', 'momento_segundo', 'emocion_predominante', 'confianza_emocion', 'datos_raw_emociones', 'reutilizado',
+]
+
 # Serializador para escritura de AnalisisEmocion (POST, PUT, PATCH): Espera ID de la SesionActividad para la relación ForeignKey
 class AnalisisEmocionWriteSerializer(serializers.ModelSerializer):
     sesion = serializers.PrimaryKeyRelatedField(queryset=SesionActividad.objects.all())
+    datos_raw_emociones = serializers.JSONField() # Se guarda en las columnas prob_* del modelo
 
     class Meta:
         model = AnalisisEmocion
-        fields = '__all__'
+        fields = ANALISIS_EMOCION_FIELDS
+
+    def validate_datos_raw_emociones(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Debe ser un objeto {emoción: probabilidad}.")
+        desconocidas = set(value) - set(AnalisisEmocion.PROBABILIDADES)
+        if desconocidas:
+            raise serializers.ValidationError(f"Emociones desconocidas: {', '.join(sorted(desconocidas))}.")
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value.values()):
+            raise serializers.ValidationError("Las probabilidades deben ser numéricas.")
+        return value
+
+# Filtros de la línea de tiempo (GET analisis-emocion/?sesion=&desde=&hasta=), en segundos de la sesión
+class AnalisisEmocionRangoSerializer(serializers.Serializer):
+    sesion = serializers.IntegerField(required=False)
+    desde = serializers.IntegerField(required=False, min_value=0)
+    hasta = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, data):
+        if 'desde' in data and 'hasta' in data and data['desde'] > data['hasta']:
+            raise serializers.ValidationError("'desde' no puede ser mayor que 'hasta'.")
+        return data
 
 # Serializador para lectura de AnalisisEmocion (GET): Anida objeto SesionActividad completo usando SesionActividadReadSerializer
 class AnalisisEmocionReadSerializer(serializers.ModelSerializer):
     sesion = SesionActividadReadSerializer() # Anida el serializador de SesionActividad para lectura
+    datos_raw_emociones = serializers.JSONField(read_only=True)
 
     class Meta:
         model = AnalisisEmocion
-        fields = '__all__'
+        fields = ANALISIS_EMOCION_FIELDS
 
 
+# Resumen de emociones de una sesión (ResumenEmocionSesion); sin joins más allá de la sesión
+class ResumenEmocionSesionSerializer(serializers.ModelSerializer):
+    alumno = serializers.IntegerField(source='sesion.alumno_id', read_only=True)
+    actividad = serializers.IntegerField(source='sesion.actividad_id', read_only=True)
+    conteo = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    frames_detectados = serializers.IntegerField(read_only=True)
+    confianza_media = serializers.FloatField(read_only=True, allow_null=True)
+    emocion_dominante = serializers.CharField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = ResumenEmocionSesion
+        fields = [
+            'sesion', 'alumno', 'actividad', 'frames', 'frames_detectados', 'frames_no_detectado',
+            'conteo', 'confianza_media', 'emocion_dominante', 'actualizado',
+        ]
+
+# Parámetros de sesiones-actividad/<id>/linea-tiempo/?intervalo=30s&desde=&hasta=
+class LineaTiempoSerializer(serializers.Serializer):
+    intervalo = serializers.CharField(required=False, default='30s', help_text="Ancho de cada intervalo: 5s, 30s, 1m o segundos.")
+    desde = serializers.IntegerField(required=False, min_value=0)
+    hasta = serializers.IntegerField(required=False, min_value=0)
+
+    def validate_intervalo(self, value):
+        coincidencia = re.fullmatch(r'\s*(\d+)\s*([sm]?)\s*', value.lower())
+        if not coincidencia:
+            raise serializers.ValidationError("Use segundos o minutos, por ejemplo 5s, 30s o 1m.")
+        segundos = int(coincidencia.group(1)) * (60 if coincidencia.group(2) == 'm' else 1)
+        if not 1 <= segundos <= 3600:
+            raise serializers.ValidationError("El intervalo debe estar entre 1 s y 60 min.")
+        return segundos
+
+    def validate(self, data):
+        if 'desde' in data and 'hasta' in data and data['desde'] > data['hasta']:
+            raise serializers.ValidationError("'desde' no puede ser mayor que 'hasta'.")
+        return data
+
+# Parámetros de actividades/<id>/mapa-calor/: el intervalo debe ser múltiplo del de las celdas materializadas
+class MapaCalorSerializer(LineaTiempoSerializer):
+    intervalo = serializers.CharField(required=False, default='1m', help_text="Ancho de cada intervalo: 30s, 1m, 5m...")
+
+    def validate_intervalo(self, value):
+        segundos = super().validate_intervalo(value)
+        base = CeldaEmocionSesion.ANCHO_SEGUNDOS
+        if segundos % base:
+            raise serializers.ValidationError(f"El intervalo debe ser múltiplo de {base} s.")
+        return segundos
+
+# Filtros de exportar/emociones/ (las fechas son las de inicio de la sesión, inclusive)
+class ExportacionEmocionesSerializer(serializers.Serializer):
+    formato = serializers.ChoiceField(choices=['csv', 'ndjson'], required=False, default='csv')
+    materia = serializers.IntegerField(required=False)
+    actividad = serializers.IntegerField(required=False)
+    alumno = serializers.IntegerField(required=False)
+    desde = serializers.DateField(required=False)
+    hasta = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if 'desde' in data and 'hasta' in data and data['desde'] > data['hasta']:
+            raise serializers.ValidationError("'desde' no puede ser mayor que 'hasta'.")
+        return data
+
+# Filtros de sesiones-actividad/resumenes-emociones/ (varias sesiones en una sola consulta)
+class ResumenesFiltroSerializer(serializers.Serializer):
+    sesiones = serializers.CharField(required=False, help_text="IDs separados por comas.")
+    actividad = serializers.IntegerField(required=False)
+    alumno = serializers.IntegerField(required=False)
+
+    def validate_sesiones(self, value):
+        try:
+            ids = [int(i) for i in value.split(',') if i.strip()]
+        except ValueError:
+            raise serializers.ValidationError("Debe ser una lista de IDs separados por comas.")
+        maximo = 500
+        if len(ids) > maximo:
+            raise serializers.ValidationError(f"Se admiten como máximo {maximo} sesiones por consulta.")
+        return ids
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("Indique 'sesiones', 'actividad' o 'alumno'.")
+        return data
+
 
 # --- Serializadores de Calificacion ---
 
@@ -243,7 +355,34 @@ class CalificacionReadSerializer(serializers.ModelSerializer):
 
 
 # Nuevo Serializador para los datos del frame de emoción
-class EmotionFrameSerializer(serializers.Serializer):
+class FrameMetadataSerializer(serializers.Serializer):
     sesion_id = serializers.IntegerField()
+    momento_segundo = serializers.IntegerField(min_value=0)
+
+class EmotionFrameSerializer(FrameMetadataSerializer):
+    frame_base64 = serializers.CharField()
+
+class FrameLoteSerializer(serializers.Serializer):
+    momento_segundo = serializers.IntegerField(min_value=0)
     frame_base64 = serializers.CharField()
-    momento_segundo = serializers.IntegerField()
\ No newline at end of file
+
+class LoteFramesSerializer(serializers.Serializer):
+    sesion_id = serializers.IntegerField()
+    frames = FrameLoteSerializer(many=True, allow_empty=False)
+
+    def validate_frames(self, frames):
+        from django.conf import settings
+        maximo = getattr(settings, 'EMOCION_BATCH_UPLOAD_MAX_FRAMES', 20)
+        if len(frames) > maximo:
+            raise serializers.ValidationError(f"Se admiten como máximo {maximo} frames por lote.")
+        return frames
+
+class VideoAnalisisSerializer(serializers.Serializer):
+    sesion_id = serializers.IntegerField()
+    video = serializers.FileField()
+    fps = serializers.FloatField(required=False, min_value=0.01, max_value=1) # Un análisis por segundo como máximo
+
+    def validate_sesion_id(self, sesion_id):
+        if not SesionActividad.objects.filter(id=sesion_id).exists():
+            raise serializers.ValidationError("Sesión de actividad no encontrada.")
+        return sesion_id
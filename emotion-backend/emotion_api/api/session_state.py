@@ -0,0 +1,98 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+
+from .models import SesionActividad
+
+# Estado de las sesiones de actividad para la ruta de recepción de frames.
+# Se guarda en la caché de Django: con la caché local por defecto cada proceso tiene la suya y
+# end_session solo invalida la del proceso que lo atiende (el resto caduca a los TIMEOUT_ACTIVE
+# segundos); con una caché compartida (Redis, Memcached) la invalidación es inmediata para todos.
+
+ACTIVA = 'activa'
+FINALIZADA = 'finalizada'
+DESCONOCIDA = 'desconocida'
+
+_PREFIJO = 'emociones:sesion:'
+
+
+def _config():
+    return getattr(settings, 'EMOCION_SESSION_STATE', {})
+
+
+def _timeout(estado):
+    config = _config()
+    if estado == ACTIVA:
+        return config.get('TIMEOUT_ACTIVE', 30)
+    if estado == FINALIZADA:
+        return config.get('TIMEOUT_ENDED', 3600)
+    return config.get('TIMEOUT_UNKNOWN', 10)
+
+
+def _limite(fecha_hora_inicio_real, duracion_analisis_minutos):
+    # Fin de la ventana de análisis de la actividad, con un margen para frames en vuelo
+    if fecha_hora_inicio_real is None:
+        return None
+    gracia = _config().get('DEADLINE_GRACE_SECONDS', 60)
+    fin = fecha_hora_inicio_real + timedelta(minutes=duracion_analisis_minutos, seconds=gracia)
+    return fin.timestamp()
+
+
+def _guardar(sesion_id, estado, limite=None):
+    cache.set(f'{_PREFIJO}{sesion_id}', (estado, limite), _timeout(estado))
+
+
+def estado_sesion(sesion_id):
+    """(estado, límite) de la sesión; solo consulta la base de datos si no está en caché."""
+    valor = cache.get(f'{_PREFIJO}{sesion_id}')
+    if valor is not None:
+        return valor
+
+    sesion = (
+        SesionActividad.objects.filter(id=sesion_id)
+        .values('fecha_hora_inicio_real', 'fecha_hora_fin_real', 'actividad__duracion_analisis_minutos')
+        .first()
+    )
+    if sesion is None:
+        valor = (DESCONOCIDA, None)
+    elif sesion['fecha_hora_fin_real'] is not None:
+        valor = (FINALIZADA, None)
+    else:
+        valor = (ACTIVA, _limite(sesion['fecha_hora_inicio_real'], sesion['actividad__duracion_analisis_minutos']))
+    _guardar(sesion_id, *valor)
+    return valor
+
+
+def recordar_sesion_activa(sesion):
+    """Anota una sesión recién creada para que su primer frame tampoco consulte la base de datos."""
+    _guardar(sesion.id, ACTIVA, _limite(sesion.fecha_hora_inicio_real, sesion.actividad.duracion_analisis_minutos))
+
+
+def marcar_sesion_finalizada(sesion_id):
+    """Llamar desde end_session: los frames siguientes se rechazan sin consultar la base de datos."""
+    _guardar(sesion_id, FINALIZADA)
+
+
+def marcar_sesion_borrada(sesion_id):
+    """Llamar al borrar una sesión: sus frames en vuelo se rechazan (404) en vez de fallar al insertarse."""
+    _guardar(sesion_id, DESCONOCIDA)
+
+
+def olvidar_estado_sesion(sesion_id):
+    """Llamar al modificar una sesión: el próximo frame vuelve a leer su estado de la base de datos."""
+    cache.delete(f'{_PREFIJO}{sesion_id}')
+
+
+def validar_sesion_frame(sesion_id):
+    """None si la sesión admite frames; si no, (payload, código HTTP) con el motivo del rechazo."""
+    estado, limite = estado_sesion(sesion_id)
+    if estado == DESCONOCIDA:
+        return {"error": "Sesión de actividad no encontrada."}, status.HTTP_404_NOT_FOUND
+    if estado == FINALIZADA:
+        return {"error": "La sesión ya ha sido finalizada."}, status.HTTP_409_CONFLICT
+    if limite is not None and time.time() > limite:
+        return {"error": "La ventana de análisis de la actividad ya se cerró."}, status.HTTP_409_CONFLICT
+    return None
@@ -1,3 +1,729 @@
-from django.test import TestCase
+import asyncio
+import base64
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (
+    Actividad,
+    AnalisisEmocion,
+    CeldaEmocionSesion,
+    Materia,
+    Nivel,
+    ResumenEmocionSesion,
+    SesionActividad,
+    Usuario,
+)
+from .export import NOMBRES, lineas
+from .ingest import registrar_frame
+from .ml_model.batching import MicroBatcher
+from .ml_model.dedup import FrameDedupCache, frame_hash, get_frame_dedup_cache
+from .ml_model.pipeline import FrameEscalonado, dimensiones_jpeg, factor_reduccion
+from .ml_model.tracking import FaceTrackCache
+from .session_state import (
+    marcar_sesion_borrada,
+    marcar_sesion_finalizada,
+    recordar_sesion_activa,
+    validar_sesion_frame,
+)
+from .timeline import linea_tiempo_sesion, mapa_calor_actividad
+from .websocket import websocket_application
+from .write_behind import (
+    WriteBehindBuffer,
+    _fila_a_dict,
+    current_write_behind_buffer,
+    filas_en_diarios,
+    shutdown_write_behind,
+)
+
+
+def crear_sesiones(n=1):
+    nivel = Nivel.objects.create(nombre='Séptimo')
+    materia = Materia.objects.create(nivel=nivel, nombre='Matemáticas', nrc='1', descripcion='')
+    actividad = Actividad.objects.create(materia=materia, nombre='Quiz', descripcion='', fecha_inicio=timezone.now())
+    return [
+        SesionActividad.objects.create(
+            actividad=actividad,
+            alumno=Usuario.objects.create(username=f'alumno{i}', CI=f'ci{i}', rol='alumno', genero='O'),
+        )
+        for i in range(n)
+    ]
+
+
+def analisis(sesion_id, momento, emocion='felicidad', confianza=0.9):
+    datos = {emocion: confianza} if emocion in AnalisisEmocion.PROBABILIDADES else {}
+    return AnalisisEmocion(
+        sesion_id=sesion_id, momento_segundo=momento, emocion_predominante=emocion,
+        confianza_emocion=confianza if datos else 0.0, datos_raw_emociones=datos,
+    )
+
+
+def contadores(modelo):
+    """Filas de un modelo de contadores como tuplas comparables (sin la fecha de actualización)."""
+    campos = [*modelo.CLAVE, 'frames', 'frames_no_detectado',
+              *(f'frames_{e}' for e in AnalisisEmocion.PROBABILIDADES)]
+    filas = modelo.objects.order_by(*modelo.CLAVE).values_list(*campos, 'suma_confianza')
+    return [(*fila[:-1], round(fila[-1], 6)) for fila in filas]
+
+
+def jpeg(semilla=0, ancho=64, alto=48):
+    imagen = np.random.default_rng(semilla).integers(0, 256, (alto, ancho, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', imagen)[1].tobytes()
+
+
+# Resultado del detector para las pruebas de las vías de entrada (sin cargar el modelo)
+DETECTADO = {
+    'detected': True, 'emotion': 'felicidad', 'confidence': 0.8,
+    'all_emotions': {'felicidad': 0.8, 'neutral': 0.2},
+}
+
+
+class UpsertAnalisisTests(TestCase):
+    def setUp(self):
+        self.sesion, self.otra = crear_sesiones(2)
+
+    def test_upsert_sobrescribe_el_mismo_segundo(self):
+        AnalisisEmocion.objects.upsert([analisis(self.sesion.id, 5, 'felicidad')])
+        AnalisisEmocion.objects.upsert([analisis(self.sesion.id, 5, 'tristeza', 0.7)])
+
+        fila = AnalisisEmocion.objects.get(sesion=self.sesion, momento_segundo=5)
+        self.assertEqual(AnalisisEmocion.objects.count(), 1)
+        self.assertEqual(fila.emocion_predominante, 'tristeza')
+        self.assertEqual(fila.datos_raw_emociones, {'tristeza': 0.7})
+
+    def test_upsert_repetidas_en_el_lote_gana_la_ultima(self):
+        AnalisisEmocion.objects.upsert([
+            analisis(self.sesion.id, 1, 'felicidad'),
+            analisis(self.sesion.id, 1, 'enojo'),
+            analisis(self.otra.id, 1, 'neutral'),
+        ])
+
+        self.assertEqual(AnalisisEmocion.objects.count(), 2)
+        self.assertEqual(AnalisisEmocion.objects.get(sesion=self.sesion).emocion_predominante, 'enojo')
+
+
+class ContadoresEmocionTests(TestCase):
+    def setUp(self):
+        self.sesion, self.otra = crear_sesiones(2)
+
+    def test_contadores_coinciden_con_la_reconstruccion(self):
+        # Inserciones, sobrescrituras (con cambio de emoción y de detectado a no detectado) y varias celdas
+        AnalisisEmocion.objects.upsert([analisis(self.sesion.id, m, 'felicidad') for m in range(25)])
+        AnalisisEmocion.objects.upsert([analisis(self.otra.id, m, 'neutral', 0.5) for m in range(0, 40, 3)])
+        AnalisisEmocion.objects.upsert([
+            analisis(self.sesion.id, 3, 'tristeza', 0.6),
+            analisis(self.sesion.id, 12, 'no_detectado'),
+            analisis(self.sesion.id, 30, 'sorpresa', 0.8),
+        ])
+        AnalisisEmocion.objects.upsert([analisis(self.sesion.id, 12, 'miedo', 0.4)])
+
+        incrementales = {modelo: contadores(modelo) for modelo in (ResumenEmocionSesion, CeldaEmocionSesion)}
+        ResumenEmocionSesion.objects.reconstruir()
+        CeldaEmocionSesion.objects.reconstruir()
+
+        for modelo, filas in incrementales.items():
+            self.assertEqual(filas, contadores(modelo), modelo.__name__)
+        resumen = ResumenEmocionSesion.objects.get(sesion=self.sesion)
+        self.assertEqual(resumen.frames, 26)
+        self.assertEqual(resumen.frames_felicidad, 23)
+        self.assertEqual(resumen.frames_no_detectado, 0)
+
+    def test_aplicar_resta_las_filas_anteriores(self):
+        nueva = (self.sesion.id, 15, 'felicidad', 0.9)
+        ResumenEmocionSesion.objects.aplicar([], [nueva])
+        CeldaEmocionSesion.objects.aplicar([], [nueva])
+        ResumenEmocionSesion.objects.aplicar([nueva], [(self.sesion.id, 15, 'no_detectado', 0.0)])
+        CeldaEmocionSesion.objects.aplicar([nueva], [])
+
+        resumen = ResumenEmocionSesion.objects.get(sesion=self.sesion)
+        self.assertEqual((resumen.frames, resumen.frames_felicidad, resumen.frames_no_detectado), (1, 0, 1))
+        self.assertAlmostEqual(resumen.suma_confianza, 0.0)
+        celda = CeldaEmocionSesion.objects.get(sesion=self.sesion, intervalo=1)
+        self.assertEqual((celda.frames, celda.frames_felicidad), (0, 0))
+
+
+class WriteBehindTests(TransactionTestCase):
+    # TransactionTestCase: las claves foráneas de SQLite se comprueban al confirmar la transacción del upsert
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.sesion, = crear_sesiones(1)
+        self.buffers = []
+
+    def tearDown(self):
+        for buffer in self.buffers:
+            buffer.close()
+        shutil.rmtree(self.directorio)
+
+    def buffer(self, **kwargs):
+        # Sin vaciados automáticos: cada prueba llama a flush() o retry_spools()
+        buffer = WriteBehindBuffer(
+            AnalisisEmocion, self.directorio, flush_size=10_000, flush_interval=3600,
+            insertar=AnalisisEmocion.objects.upsert, **kwargs,
+        )
+        self.buffers.append(buffer)
+        return buffer
+
+    def escribir_diario(self, nombre, filas):
+        with open(os.path.join(self.directorio, nombre), 'w', encoding='utf-8') as f:
+            for fila in filas:
+                f.write(json.dumps(_fila_a_dict(fila)) + '\n')
+
+    def archivos(self, extension):
+        return glob.glob(os.path.join(self.directorio, f'*.{extension}'))
+
+    def test_recupera_diarios_de_un_proceso_anterior_con_el_mismo_pid(self):
+        pid = os.getpid()
+        self.escribir_diario(f'journal-{pid}-1.jsonl', [analisis(self.sesion.id, m) for m in range(3)])
+        self.escribir_diario(f'journal-{pid}-0123456789ab-1.spool', [analisis(self.sesion.id, m) for m in range(3, 6)])
+
+        buffer = self.buffer(recover_on_start=True)
+        buffer.add([analisis(self.sesion.id, 6)])
+        buffer.flush()
+
+        self.assertEqual(AnalisisEmocion.objects.filter(sesion=self.sesion).count(), 7)
+        self.assertEqual(buffer.stats()['recovered_rows'], 6)
+        self.assertEqual(self.archivos('spool'), [])
+
+    def test_no_recupera_el_diario_de_otro_buffer_vivo(self):
+        vivo = self.buffer()
+        vivo.add([analisis(self.sesion.id, 1)])
+
+        self.buffer(recover_on_start=True)
+
+        self.assertEqual(AnalisisEmocion.objects.count(), 0)
+        self.assertEqual(vivo.flush(), 1)
+
+    def test_filas_de_una_sesion_borrada_se_apartan_sin_perder_el_resto(self):
+        borrada = self.sesion.id
+        conservada = SesionActividad.objects.create(actividad=self.sesion.actividad, alumno=self.sesion.alumno)
+        buffer = self.buffer()
+        buffer.add([analisis(borrada, 1), analisis(conservada.id, 1), analisis(conservada.id, 2)])
+        self.sesion.delete()
+
+        with self.assertLogs('api.write_behind', 'WARNING'):
+            self.assertEqual(buffer.flush(), 2)
+
+        self.assertEqual(AnalisisEmocion.objects.filter(sesion=conservada).count(), 2)
+        rechazadas, = self.archivos('rejected')
+        with open(rechazadas, encoding='utf-8') as f:
+            lineas = [json.loads(linea) for linea in f]
+        self.assertEqual([linea['fila']['sesion_id'] for linea in lineas], [borrada])
+        self.assertEqual(buffer.stats()['rejected_rows'], 1)
+
+    def test_error_transitorio_queda_en_spool_y_se_reintenta(self):
+        buffer = self.buffer()
+        upsert = buffer.insertar
+        fallos = [OperationalError('database is locked')]
+
+        def insertar(filas):
+            if fallos:
+                raise fallos.pop()
+            return upsert(filas)
+
+        buffer.insertar = insertar
+        buffer.add([analisis(self.sesion.id, m) for m in range(4)])
+
+        with self.assertLogs('api.write_behind', 'WARNING'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(self.archivos('spool')), 1)
+        self.assertEqual(buffer.pending(self.sesion.id), 4)
+
+        self.assertEqual(buffer.retry_spools(), 4)
+        self.assertEqual(AnalisisEmocion.objects.count(), 4)
+        self.assertEqual(self.archivos('spool'), [])
+        self.assertEqual(buffer.pending(self.sesion.id), 0)
+
+    def test_un_archivo_que_falla_no_detiene_la_recuperacion(self):
+        self.escribir_diario('journal-999999999-aaaaaaaaaaaa-1.spool', [analisis(self.sesion.id, 1)])
+        self.escribir_diario('journal-999999999-bbbbbbbbbbbb-1.spool', [analisis(self.sesion.id, 2)])
+        llamadas = []
+
+        def insertar(filas):
+            llamadas.append(filas)
+            if len(llamadas) == 1:
+                raise OperationalError('database is locked')
+            return AnalisisEmocion.objects.upsert(filas)
+
+        with self.assertLogs('api.write_behind', 'ERROR'):
+            buffer = WriteBehindBuffer(AnalisisEmocion, self.directorio, flush_interval=3600, insertar=insertar,
+                                       recover_on_start=True)
+        self.buffers.append(buffer)
+
+        self.assertEqual(list(AnalisisEmocion.objects.values_list('momento_segundo', flat=True)), [2])
+        self.assertEqual(buffer.stats()['pending_spools'], 1)
+        self.assertEqual(buffer.retry_spools(), 1)
+        self.assertEqual(AnalisisEmocion.objects.count(), 2)
+
+    def test_pendientes_se_cuentan_sin_leer_diarios_de_otros_procesos(self):
+        self.escribir_diario('journal-999999999-aaaaaaaaaaaa-1.jsonl', [analisis(self.sesion.id, 1)])
+        buffer = self.buffer()
+        buffer.add([analisis(self.sesion.id, 2)])
+
+        self.assertEqual(buffer.pending(self.sesion.id), 1)
+        self.assertEqual(filas_en_diarios(self.directorio, {self.sesion.id}), 2)
+
+    def test_fila_invalida_se_rechaza_antes_de_encolarla(self):
+        cache.clear()
+        get_frame_dedup_cache().discard(self.sesion.id)
+        config = {'ENABLED': True, 'JOURNAL_DIR': self.directorio}
+        with override_settings(EMOCION_WRITE_BEHIND=config), mock.patch('api.ingest.detectar_emocion_bytes') as detectar:
+            try:
+                detectar.return_value = DETECTADO
+                self.assertEqual(registrar_frame(self.sesion.id, 1, jpeg())[1], 201)
+                detectar.return_value = {**DETECTADO, 'emotion': 'alegria'}
+                payload, codigo = registrar_frame(self.sesion.id, 2, jpeg(1))
+
+                self.assertEqual(codigo, 400)
+                self.assertIn('emocion_predominante', payload)
+                self.assertEqual(current_write_behind_buffer().pending(self.sesion.id), 1)
+            finally:
+                shutdown_write_behind()
+        self.assertEqual(list(AnalisisEmocion.objects.values_list('momento_segundo', flat=True)), [1])
+        self.assertEqual(self.archivos('rejected'), [])
+
+    def test_error_de_integridad_no_se_reintenta(self):
+        buffer = self.buffer()
+        buffer.insertar = lambda filas: (_ for _ in ()).throw(IntegrityError('UNIQUE constraint failed'))
+        buffer.add([analisis(self.sesion.id, 1)])
+
+        with self.assertLogs('api.write_behind', 'WARNING'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(self.archivos('spool'), [])
+        self.assertEqual(len(self.archivos('rejected')), 1)
+
+
+class SesionEstadoTests(TestCase):
+    def test_sesion_borrada_rechaza_frames_sin_esperar_la_cache(self):
+        sesion, = crear_sesiones(1)
+        recordar_sesion_activa(sesion)
+        self.assertIsNone(validar_sesion_frame(sesion.id))
+
+        sesion_id = sesion.id
+        sesion.delete()
+        marcar_sesion_borrada(sesion_id)
+
+        self.assertEqual(validar_sesion_frame(sesion_id)[1], 404)
+
+
+class FrameBinarioTests(TestCase):
+    def setUp(self):
+        cache.clear() # Los id de sesión se reutilizan entre pruebas: sin estados en caché de las anteriores
+        self.sesion, = crear_sesiones(1)
+        get_frame_dedup_cache().discard(self.sesion.id)
+        detector = mock.patch('api.ingest.detectar_emocion_bytes', return_value=DETECTADO)
+        self.detectar = detector.start()
+        self.addCleanup(detector.stop)
+
+    def enviar(self, cuerpo, momento=1):
+        return self.client.post(
+            reverse('emocion-detection-frame'), cuerpo, content_type='image/jpeg',
+            headers={'X-Sesion-Id': str(self.sesion.id), 'X-Momento-Segundo': str(momento)},
+        )
+
+    def test_cuerpo_crudo_registra_el_analisis(self):
+        respuesta = self.enviar(jpeg())
+
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json()['emocion'], 'felicidad')
+        self.assertEqual(bytes(self.detectar.call_args.args[0]), jpeg())
+        fila = AnalisisEmocion.objects.get(sesion=self.sesion)
+        self.assertEqual((fila.momento_segundo, fila.prob_felicidad), (1, 0.8))
+
+    def test_multipart_con_parametros_en_la_query(self):
+        respuesta = self.client.post(
+            f"{reverse('emocion-detection-frame')}?sesion_id={self.sesion.id}&momento_segundo=2",
+            {'frame': SimpleUploadedFile('frame.jpg', jpeg(), content_type='image/jpeg')},
+        )
+
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertTrue(AnalisisEmocion.objects.filter(sesion=self.sesion, momento_segundo=2).exists())
+
+    def test_cuerpo_vacio(self):
+        self.assertEqual(self.enviar(b'').status_code, 400)
+        self.detectar.assert_not_called()
+
+    def test_momento_negativo_se_rechaza_sin_analizar(self):
+        respuesta = self.enviar(jpeg(), momento=-1)
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('momento_segundo', respuesta.json())
+        self.detectar.assert_not_called()
+        self.assertFalse(AnalisisEmocion.objects.exists())
+
+    def test_frame_no_guardado_no_sirve_de_referencia_para_duplicados(self):
+        with mock.patch('api.ingest.guardar_analisis', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('api.ingest', 'ERROR'):
+            self.assertEqual(self.enviar(jpeg(), momento=1).status_code, 500)
+
+        segunda = self.enviar(jpeg(), momento=2)
+        tercera = self.enviar(jpeg(), momento=3)
+
+        self.assertFalse(segunda.json()['reutilizado'])
+        self.assertTrue(tercera.json()['reutilizado'])
+        self.assertEqual(self.detectar.call_count, 2)
+
+
+class LoteFramesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sesion, = crear_sesiones(1)
+        get_frame_dedup_cache().discard(self.sesion.id)
+        detector = mock.patch('api.ingest.detectar_emociones_lote_bytes',
+                              side_effect=lambda frames, sesion_id=None: [DETECTADO] * len(frames))
+        self.detectar = detector.start()
+        self.addCleanup(detector.stop)
+
+    def enviar(self, frames):
+        datos = {
+            'sesion_id': self.sesion.id,
+            'frames': [{'momento_segundo': m, 'frame_base64': base64.b64encode(f).decode()} for m, f in frames],
+        }
+        return self.client.post(reverse('emocion-detection-lote'), datos, content_type='application/json')
+
+    def test_frame_invalido_se_rechaza_con_su_indice(self):
+        respuesta = self.enviar([(0, jpeg()), (-1, jpeg(1)), (2, jpeg(2))])
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(list(respuesta.json()['frames']), ['1'])
+        self.assertIn('momento_segundo', respuesta.json()['frames']['1'])
+        self.assertFalse(AnalisisEmocion.objects.exists())
+
+    def test_frames_repetidos_del_lote_se_comparan_entre_si(self):
+        respuesta = self.enviar([(m, jpeg()) for m in range(3)] + [(3, jpeg(1))])
+
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual([r['reutilizado'] for r in respuesta.json()['resultados']], [False, True, True, False])
+        self.assertEqual([len(llamada.args[0]) for llamada in self.detectar.call_args_list], [2])
+        self.assertEqual(AnalisisEmocion.objects.filter(sesion=self.sesion, reutilizado=True).count(), 2)
+        # El último frame analizado del lote queda como referencia para el siguiente
+        siguiente = self.enviar([(4, jpeg(1))])
+        self.assertTrue(siguiente.json()['resultados'][0]['reutilizado'])
+
+    def test_referencia_con_error_hace_analizar_a_los_repetidos(self):
+        error = {'detected': False, 'error': 'fallo del modelo'}
+        self.detectar.side_effect = [[error], [DETECTADO, DETECTADO]]
+
+        respuesta = self.enviar([(m, jpeg()) for m in range(3)])
+
+        resultados = respuesta.json()['resultados']
+        self.assertEqual([r['emocion'] for r in resultados], ['no_detectado', 'felicidad', 'felicidad'])
+        self.assertEqual([r['reutilizado'] for r in resultados], [False, False, False])
+
+
+class ExportacionTests(TestCase):
+    def test_csv_y_ndjson(self):
+        inicio = datetime(2025, 3, 1, 8, 30, tzinfo=dt_timezone.utc)
+        fila = (1, 'Matemáticas', 2, 'Quiz', 3, 'ana', 4, inicio, 5, 'felicidad', 0.9, False,
+                *([None] * len(AnalisisEmocion.PROBABILIDADES)))
+
+        csv = list(lineas('csv', [fila]))
+        ndjson = list(lineas('ndjson', [fila]))
+
+        self.assertEqual(csv[0], ','.join(NOMBRES) + '\r\n')
+        self.assertTrue(csv[1].startswith('1,Matemáticas,2,Quiz,3,ana,4,2025-03-01T08:30:00+00:00,5,felicidad,0.9,False,'))
+        registro = json.loads(ndjson[0])
+        self.assertEqual(registro['inicio_sesion'], '2025-03-01T08:30:00+00:00')
+        self.assertEqual(registro['materia'], 'Matemáticas')
+        self.assertIsNone(registro['prob_felicidad'])
+
+
+class MicroBatcherTests(TestCase):
+    def test_lote_con_menos_salidas_falla_todos_los_futures(self):
+        batcher = MicroBatcher(lambda entradas: entradas[:-1], max_batch_size=4, max_wait_ms=50)
+        try:
+            futures = [batcher.submit(np.zeros(3, dtype=np.float32)) for _ in range(3)]
+            for future in futures:
+                with self.assertRaises(RuntimeError):
+                    future.result(timeout=5)
+        finally:
+            batcher.close()
+
+
+class FaceTrackCacheTests(TestCase):
+    ROSTRO = np.random.default_rng(7).integers(0, 256, (60, 60, 3), dtype=np.uint8)
+
+    def escena(self, x=None, y=None):
+        imagen = np.full((240, 320, 3), 90, dtype=np.uint8)
+        if x is not None:
+            imagen[y:y+60, x:x+60] = self.ROSTRO
+        return imagen
+
+    def test_sigue_el_rostro_cerca_de_la_ultima_caja(self):
+        cache_rostros = FaceTrackCache(full_detection_every=10)
+        self.assertIsNone(cache_rostros.track(1, self.escena(100, 80)))
+
+        cache_rostros.update(1, self.escena(100, 80), (100, 80, 60, 60))
+
+        self.assertEqual(cache_rostros.track(1, self.escena(106, 84)), (106, 84, 60, 60))
+        self.assertIsNone(cache_rostros.track(2, self.escena(106, 84))) # Otra sesión no comparte el seguimiento
+        self.assertEqual(cache_rostros.stats()['tracked'], 1)
+
+    def test_deteccion_completa_periodica(self):
+        cache_rostros = FaceTrackCache(full_detection_every=3)
+        cache_rostros.update(1, self.escena(100, 80), (100, 80, 60, 60))
+
+        cajas = [cache_rostros.track(1, self.escena(100, 80)) for _ in range(3)]
+
+        self.assertEqual(cajas, [(100, 80, 60, 60), (100, 80, 60, 60), None])
+        self.assertEqual(cache_rostros.stats()['full_detection_reasons']['periodica'], 1)
+
+    def test_rostro_que_desaparece_pide_deteccion_completa(self):
+        cache_rostros = FaceTrackCache()
+        cache_rostros.update(1, self.escena(100, 80), (100, 80, 60, 60))
+
+        self.assertIsNone(cache_rostros.track(1, self.escena()))
+        self.assertEqual(cache_rostros.stats()['full_detection_reasons']['baja_confianza'], 1)
+
+    def test_discard_y_ttl(self):
+        cache_rostros = FaceTrackCache(ttl_seconds=60)
+        cache_rostros.update(1, self.escena(100, 80), (100, 80, 60, 60))
+        cache_rostros.update(2, self.escena(100, 80), (100, 80, 60, 60))
+        cache_rostros.discard(1)
+
+        self.assertIsNone(cache_rostros.track(1, self.escena(100, 80)))
+        with mock.patch('api.ml_model.tracking.time.monotonic', return_value=time.monotonic() + 120):
+            self.assertIsNone(cache_rostros.track(2, self.escena(100, 80)))
+        self.assertEqual(cache_rostros.stats()['sessions'], 0)
+
+
+class FrameDedupCacheTests(TestCase):
+    def test_frame_casi_identico_reutiliza_el_resultado(self):
+        dedup = FrameDedupCache()
+        hash_, previo = dedup.check(1, jpeg(1))
+        self.assertIsNone(previo)
+        dedup.remember(1, hash_, DETECTADO)
+
+        self.assertEqual(dedup.check(1, jpeg(1)), (hash_, DETECTADO))
+        self.assertIsNone(dedup.check(1, jpeg(2))[1])
+        self.assertIsNone(dedup.check(2, jpeg(1))[1]) # Cada sesión tiene su propio último frame
+        self.assertEqual(dedup.stats()['hits'], 1)
+
+    def test_max_reuse_obliga_a_reanalizar(self):
+        dedup = FrameDedupCache(max_reuse=2)
+        hash_, _ = dedup.check(1, jpeg(1))
+        dedup.remember(1, hash_, DETECTADO)
+
+        previos = [dedup.check(1, jpeg(1))[1] for _ in range(3)]
+
+        self.assertEqual(previos, [DETECTADO, DETECTADO, None])
+
+    def test_bytes_invalidos_nunca_se_reutilizan(self):
+        dedup = FrameDedupCache()
+        self.assertIsNone(frame_hash(b'no es una imagen'))
+        dedup.remember(1, None, DETECTADO)
+
+        self.assertEqual(dedup.check(1, b'no es una imagen'), (None, None))
+        self.assertEqual(dedup.stats()['sessions'], 0)
+
+    def test_lote_compara_con_frames_anteriores_del_mismo_lote(self):
+        dedup = FrameDedupCache(max_reuse=2)
+        hash_, _ = dedup.check(1, jpeg(1))
+        dedup.remember(1, hash_, DETECTADO)
+
+        hashes, origen, previo = dedup.check_batch(1, [jpeg(1), jpeg(2), jpeg(2), b'roto', jpeg(2), jpeg(2)])
+
+        self.assertEqual(origen, [-1, None, 1, None, 1, None])
+        self.assertEqual(previo, DETECTADO)
+        self.assertIsNone(hashes[3])
+
+
+class FrameEscalonadoTests(TestCase):
+    def test_dimensiones_desde_la_cabecera(self):
+        self.assertEqual(dimensiones_jpeg(jpeg(1, 640, 480)), (640, 480))
+        png = cv2.imencode('.png', np.zeros((48, 64, 3), dtype=np.uint8))[1].tobytes()
+        self.assertIsNone(dimensiones_jpeg(png))
+        self.assertIsNone(dimensiones_jpeg(jpeg(1)[:20]))
+
+    def test_factor_reduccion(self):
+        self.assertEqual(factor_reduccion((1920, 1080)), 4)
+        self.assertEqual(factor_reduccion((640, 480)), 2)
+        self.assertEqual(factor_reduccion((320, 240)), 1)
+        self.assertEqual(factor_reduccion(None), 1)
+
+    def test_recorte_desde_la_imagen_reducida_o_la_completa(self):
+        frame = FrameEscalonado(jpeg(1, 1920, 1080))
+        self.assertTrue(frame.valido)
+        self.assertEqual(frame.factor, 4)
+        self.assertEqual(frame.reducida.shape, (270, 480, 3))
+
+        self.assertEqual(frame.recorte_gris((10, 20, 60, 60)).shape, (60, 60))
+        self.assertFalse(frame.decodificado_completo)
+
+        self.assertEqual(frame.recorte_gris((10, 20, 30, 30)).shape, (120, 120))
+        self.assertTrue(frame.decodificado_completo)
+        self.assertEqual(frame.caja_completa((10, 20, 30, 30)), (40, 80, 120, 120))
+
+    def test_bytes_invalidos(self):
+        self.assertFalse(FrameEscalonado(b'no es una imagen').valido)
+
+
+class WebSocketFramesTests(TransactionTestCase):
+    # TransactionTestCase: los frames se registran en otro hilo (sync_to_async) y deben ver la sesión creada aquí
+
+    def setUp(self):
+        cache.clear()
+        self.sesion, = crear_sesiones(1)
+        get_frame_dedup_cache().discard(self.sesion.id)
+        detector = mock.patch('api.ingest.detectar_emocion_bytes', return_value=DETECTADO)
+        detector.start()
+        self.addCleanup(detector.stop)
+
+    def conversar(self, mensajes, path=None, al_aceptar=None):
+        """Ejecuta la aplicación con los mensajes recibidos dados y devuelve los mensajes enviados."""
+        entrantes = [{'type': 'websocket.connect'}, *mensajes, {'type': 'websocket.disconnect', 'code': 1000}]
+        enviados = []
+
+        async def receive():
+            return entrantes.pop(0)
+
+        async def send(message):
+            enviados.append(message)
+            if message['type'] == 'websocket.accept' and al_aceptar:
+                al_aceptar()
+
+        scope = {'type': 'websocket', 'path': path or f'/ws/sesiones/{self.sesion.id}/'}
+        asyncio.run(websocket_application(scope, receive, send))
+        return enviados
+
+    def frame(self, momento, imagen):
+        return {'type': 'websocket.receive', 'bytes': momento.to_bytes(4, 'big') + imagen}
+
+    def test_frame_binario_responde_con_el_resultado(self):
+        aceptado, respuesta = self.conversar([self.frame(7, jpeg())])
+
+        self.assertEqual(aceptado, {'type': 'websocket.accept'})
+        datos = json.loads(respuesta['text'])
+        self.assertEqual((datos['status'], datos['momento_segundo'], datos['emocion']), (201, 7, 'felicidad'))
+        self.assertEqual(AnalisisEmocion.objects.get(sesion=self.sesion).momento_segundo, 7)
+
+    def test_mensaje_sin_imagen_responde_400_sin_cerrar(self):
+        enviados = self.conversar([{'type': 'websocket.receive', 'bytes': b'\x00\x01'}, self.frame(1, jpeg())])
+
+        self.assertEqual([json.loads(m['text'])['status'] for m in enviados[1:]], [400, 201])
+
+    def test_cierres_al_conectar(self):
+        self.assertEqual(self.conversar([], path='/ws/otra/'), [{'type': 'websocket.close', 'code': 4000}])
+        self.assertEqual(
+            self.conversar([], path=f'/ws/sesiones/{self.sesion.id + 1}/'),
+            [{'type': 'websocket.close', 'code': 4404}],
+        )
+        marcar_sesion_finalizada(self.sesion.id)
+        self.assertEqual(self.conversar([]), [{'type': 'websocket.close', 'code': 4410}])
+
+    def test_sesion_finalizada_con_el_socket_abierto_lo_cierra(self):
+        enviados = self.conversar(
+            [self.frame(1, jpeg())], al_aceptar=lambda: marcar_sesion_finalizada(self.sesion.id),
+        )
+
+        self.assertEqual(json.loads(enviados[1]['text'])['status'], 409)
+        self.assertEqual(enviados[2], {'type': 'websocket.close', 'code': 4410})
+        self.assertFalse(AnalisisEmocion.objects.exists())
+
+
+class LineaTiempoTests(TestCase):
+    def setUp(self):
+        self.sesion, = crear_sesiones(1)
+        AnalisisEmocion.objects.upsert([
+            analisis(self.sesion.id, 1, 'felicidad', 0.9),
+            analisis(self.sesion.id, 5, 'felicidad', 0.7),
+            analisis(self.sesion.id, 8, 'tristeza', 0.6),
+            analisis(self.sesion.id, 12, 'no_detectado'),
+            analisis(self.sesion.id, 25, 'enojo', 0.5),
+        ])
+
+    def test_agrupa_por_intervalos(self):
+        datos = linea_tiempo_sesion(self.sesion.id, 10)
+        indice = datos['emociones'].index
+
+        self.assertEqual(datos['inicio'], [0, 10, 20])
+        self.assertEqual(datos['frames'], [3, 1, 1])
+        self.assertEqual(datos['no_detectado'], [0, 1, 0])
+        self.assertEqual(datos['dominante'], [indice('felicidad'), None, indice('enojo')])
+        self.assertEqual(datos['conteo'][0][indice('tristeza')], 1)
+        self.assertEqual(datos['distribucion'][0][indice('felicidad')], 0.8)
+        self.assertIsNone(datos['distribucion'][0][indice('miedo')]) # Ningún frame del intervalo la reportó
+        self.assertIsNone(datos['distribucion'][1])
+
+    def test_filtra_desde_hasta(self):
+        datos = linea_tiempo_sesion(self.sesion.id, 10, desde=10, hasta=20)
+
+        self.assertEqual((datos['inicio'], datos['frames']), ([10], [1]))
+
+    def test_endpoint_valida_el_intervalo(self):
+        cliente = APIClient()
+        cliente.force_authenticate(Usuario.objects.create(username='admin', CI='admin', rol='admin', genero='O'))
+        url = reverse('sesion-actividad-linea-tiempo', args=[self.sesion.id])
+
+        respuesta = cliente.get(url, {'intervalo': '1m'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual((respuesta.json()['ancho_segundos'], respuesta.json()['frames']), (60, [5]))
+        self.assertEqual(cliente.get(url, {'intervalo': '0s'}).status_code, 400)
+        self.assertEqual(cliente.get(url, {'desde': 30, 'hasta': 10}).status_code, 400)
+
+
+class MapaCalorTests(TestCase):
+    def setUp(self):
+        self.ana, self.beto = crear_sesiones(2)
+        self.actividad = self.ana.actividad
+        AnalisisEmocion.objects.upsert([
+            analisis(self.ana.id, 1, 'felicidad'),
+            analisis(self.ana.id, 5, 'felicidad'),
+            analisis(self.ana.id, 15, 'tristeza'),
+            analisis(self.beto.id, 3, 'tristeza'),
+            analisis(self.beto.id, 40, 'no_detectado'),
+            analisis(self.beto.id, 65, 'neutral'),
+        ])
+
+    def test_matriz_desde_las_celdas(self):
+        datos = mapa_calor_actividad(self.actividad.id, 30)
+        indice = datos['emociones'].index
+
+        self.assertEqual([a['username'] for a in datos['alumnos']], ['alumno0', 'alumno1'])
+        self.assertEqual(datos['inicio'], [0, 30, 60])
+        self.assertEqual(datos['dominante'], [
+            [indice('felicidad'), None, None],
+            [indice('tristeza'), None, indice('neutral')],
+        ])
+        self.assertEqual(datos['distribucion'][0][indice('felicidad')], 2)
+        self.assertEqual(datos['distribucion'][0][indice('tristeza')], 2)
+        self.assertEqual(datos['frames'], [4, 1, 1])
+        self.assertEqual(datos['no_detectado'], [0, 1, 0])
+
+    def test_filtra_desde(self):
+        datos = mapa_calor_actividad(self.actividad.id, 30, desde=30)
+
+        self.assertEqual(datos['inicio'], [30, 60])
+        self.assertEqual(datos['dominante'][0], [None, None])
+
+    def test_actividad_sin_celdas(self):
+        CeldaEmocionSesion.objects.all().delete() # El mapa solo lee las celdas, no AnalisisEmocion
+
+        datos = mapa_calor_actividad(self.actividad.id, 60)
+
+        self.assertEqual((datos['inicio'], datos['dominante']), ([], [[], []]))
+
+    def test_endpoint_exige_multiplos_de_la_celda(self):
+        cliente = APIClient()
+        cliente.force_authenticate(Usuario.objects.create(username='admin', CI='admin', rol='admin', genero='O'))
+        url = reverse('actividad-mapa-calor', args=[self.actividad.id])
+
+        self.assertEqual(cliente.get(url, {'intervalo': '15s'}).status_code, 400)
+        respuesta = cliente.get(url, {'intervalo': '1m'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['frames'], [5, 1])
@@ -0,0 +1,131 @@
+import numpy as np
+from django.db.models import Avg, Count, F, Q, Sum
+
+from .models import AnalisisEmocion, CeldaEmocionSesion, SesionActividad
+
+# Línea de tiempo agregada de una sesión (GET sesiones-actividad/<id>/linea-tiempo/).
+#
+# Los análisis se agrupan en la base de datos en intervalos de `ancho` segundos (momento_segundo / ancho,
+# división entera) leyendo el índice (sesion_id, momento_segundo) por rango. La respuesta son arreglos
+# paralelos, uno por métrica, con un elemento por intervalo con frames: su tamaño depende del número
+# de intervalos, no del de frames.
+#
+# El mapa de calor de una actividad (GET actividades/<id>/mapa-calor/) se arma igual, pero a partir
+# de las celdas materializadas de CeldaEmocionSesion: no lee AnalisisEmocion.
+
+EMOCIONES = AnalisisEmocion.PROBABILIDADES
+DECIMALES = 4
+
+
+def agregar_por_intervalo(analisis, ancho):
+    """Filas {'intervalo', 'frames', 'no_detectado', 'c_<emoción>', 'p_<emoción>'} de un queryset de AnalisisEmocion."""
+    return (
+        analisis.order_by()
+        .annotate(intervalo=F('momento_segundo') / ancho)
+        .values('intervalo')
+        .annotate(
+            frames=Count('id'),
+            no_detectado=Count('id', filter=~Q(emocion_predominante__in=EMOCIONES)),
+            **{f'c_{e}': Count('id', filter=Q(emocion_predominante=e)) for e in EMOCIONES},
+            # AVG ignora los NULL: es el promedio de los frames con rostro detectado
+            **{f'p_{e}': Avg(f'prob_{e}') for e in EMOCIONES},
+        )
+        .order_by('intervalo')
+    )
+
+
+def linea_tiempo_sesion(sesion_id, ancho, desde=None, hasta=None):
+    analisis = AnalisisEmocion.objects.filter(sesion_id=sesion_id)
+    if desde is not None:
+        analisis = analisis.filter(momento_segundo__gte=desde)
+    if hasta is not None:
+        analisis = analisis.filter(momento_segundo__lte=hasta)
+
+    datos = {
+        'sesion': sesion_id,
+        'ancho_segundos': ancho,
+        'emociones': list(EMOCIONES),
+        'inicio': [],        # Segundo en que empieza cada intervalo
+        'frames': [],
+        'no_detectado': [],
+        'conteo': [],        # Frames por emoción predominante, en el orden de 'emociones'
+        'distribucion': [],  # Probabilidad media de cada emoción (null si no hubo rostro en el intervalo)
+        'dominante': [],     # Índice en 'emociones' de la emoción más frecuente, o null
+    }
+    for fila in agregar_por_intervalo(analisis, ancho):
+        conteo = [fila[f'c_{e}'] for e in EMOCIONES]
+        detectados = fila['frames'] - fila['no_detectado']
+        datos['inicio'].append(fila['intervalo'] * ancho)
+        datos['frames'].append(fila['frames'])
+        datos['no_detectado'].append(fila['no_detectado'])
+        datos['conteo'].append(conteo)
+        datos['distribucion'].append(
+            [None if fila[f'p_{e}'] is None else round(fila[f'p_{e}'], DECIMALES) for e in EMOCIONES]
+            if detectados else None
+        )
+        datos['dominante'].append(conteo.index(max(conteo)) if detectados else None)
+    return datos
+
+
+def mapa_calor_actividad(actividad_id, ancho, desde=None, hasta=None):
+    """
+    Matriz alumnos x intervalos con la emoción dominante de cada celda y la distribución de la clase
+    por intervalo. `ancho` debe ser múltiplo de CeldaEmocionSesion.ANCHO_SEGUNDOS.
+    """
+    base = CeldaEmocionSesion.ANCHO_SEGUNDOS
+    alumnos = list(
+        SesionActividad.objects.filter(actividad_id=actividad_id)
+        .order_by('alumno__last_name', 'alumno__first_name', 'alumno_id')
+        .values_list('alumno_id', 'alumno__username', 'alumno__first_name', 'alumno__last_name')
+        .distinct()
+    )
+    fila_de = {alumno[0]: i for i, alumno in enumerate(alumnos)}
+
+    celdas = CeldaEmocionSesion.objects.filter(sesion__actividad_id=actividad_id)
+    if desde is not None:
+        celdas = celdas.filter(intervalo__gte=desde // base)
+    if hasta is not None:
+        celdas = celdas.filter(intervalo__lte=hasta // base)
+    # Un alumno con varias sesiones en la actividad suma sus celdas
+    agregadas = list(
+        celdas.order_by()
+        .annotate(columna=F('intervalo') / (ancho // base))
+        .values('sesion__alumno_id', 'columna')
+        .annotate(no_detectado=Sum('frames_no_detectado'), **{f'c_{e}': Sum(f'frames_{e}') for e in EMOCIONES})
+        .values_list('sesion__alumno_id', 'columna', 'no_detectado', *(f'c_{e}' for e in EMOCIONES))
+    )
+
+    datos = {
+        'actividad': actividad_id,
+        'ancho_segundos': ancho,
+        'emociones': list(EMOCIONES),
+        'alumnos': [
+            {'id': id_, 'username': username, 'nombre': f'{nombre} {apellido}'.strip()}
+            for id_, username, nombre, apellido in alumnos
+        ],
+        'inicio': [],
+        'dominante': [[] for _ in alumnos], # Por alumno: índice en 'emociones' por intervalo, o null
+        'distribucion': [],                 # Por intervalo: frames de toda la clase por emoción
+        'frames': [],
+        'no_detectado': [],
+    }
+    if not agregadas:
+        return datos
+
+    matriz = np.asarray(agregadas, dtype=np.int64)
+    primera, ultima = int(matriz[:, 1].min()), int(matriz[:, 1].max())
+    columnas = ultima - primera + 1
+    conteo = np.zeros((len(alumnos), columnas, len(EMOCIONES)), dtype=np.int64)
+    no_detectado = np.zeros((len(alumnos), columnas), dtype=np.int64)
+    filas = np.asarray([fila_de[alumno_id] for alumno_id in matriz[:, 0]])
+    conteo[filas, matriz[:, 1] - primera] = matriz[:, 3:]
+    no_detectado[filas, matriz[:, 1] - primera] = matriz[:, 2]
+
+    dominante = np.where(conteo.sum(axis=2) > 0, conteo.argmax(axis=2), -1)
+    distribucion = conteo.sum(axis=0)
+    datos['inicio'] = [(primera + c) * ancho for c in range(columnas)]
+    datos['dominante'] = [[None if d < 0 else d for d in fila] for fila in dominante.tolist()]
+    datos['distribucion'] = distribucion.tolist()
+    datos['frames'] = (distribucion.sum(axis=1) + no_detectado.sum(axis=0)).tolist()
+    datos['no_detectado'] = no_detectado.sum(axis=0).tolist()
+    return datos
@@ -1,4 +1,4 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from .views import (
     resumen_admin,
@@ -12,7 +12,16 @@ from .views import (
     AnalisisEmocionViewSet,
     CalificacionViewSet,
     EmocionDetectionAPIView, # Vista para la detección de emociones
+    EmocionFrameUploadView,
+    EmocionLoteAPIView,
     TestEmotionDetectionView,
+    MultiFaceEmotionDetectionView,
+    EmocionVideoUploadView,
+    EmocionVideoEstadoView,
+    ExportacionEmocionesView,
+    InferenceStatsView,
+    ModelReadinessView,
+    metrics_view,
     LoginView
 )
 
@@ -41,6 +50,15 @@ urlpatterns = [
     path('test-detectar-emocion/', TestEmotionDetectionView.as_view(), name='test_detectar_emocion'),
     path('resumen-admin', resumen_admin),
     path('emocion-detection/', EmocionDetectionAPIView.as_view(), name='emocion-detection'),
+    path('emocion-detection/frame/', EmocionFrameUploadView.as_view(), name='emocion-detection-frame'),
+    path('emocion-detection/lote/', EmocionLoteAPIView.as_view(), name='emocion-detection-lote'),
+    path('emocion-detection/multi/', MultiFaceEmotionDetectionView.as_view(), name='emocion-detection-multi'),
+    path('emocion-detection/video/', EmocionVideoUploadView.as_view(), name='emocion-detection-video'),
+    re_path(r'^emocion-detection/video/(?P<trabajo>[0-9a-f]{32})/$', EmocionVideoEstadoView.as_view(), name='emocion-detection-video-estado'),
+    path('emocion-detection/stats/', InferenceStatsView.as_view(), name='emocion-detection-stats'),
+    path('health/model/', ModelReadinessView.as_view(), name='health-model'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('exportar/emociones/', ExportacionEmocionesView.as_view(), name='exportar-emociones'),
 
     # --- NUEVA RUTA PARA EL LOGIN ---
     path('login/', LoginView.as_view(), name='login'),
@@ -0,0 +1,242 @@
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from .ingest import datos_analisis
+from .ml_model.video import analizar_segmento, inicializar_worker, plan_segmentos, propiedades_video
+from .models import AnalisisEmocion, SesionActividad
+
+logger = logging.getLogger(__name__)
+
+# Análisis diferido de videos grabados de una actividad.
+#
+# El video se divide en segmentos de `segundos_por_segmento` segundos que se reparten entre los
+# procesos de un pool (ver api/ml_model/video.py). Este módulo, en el proceso principal, guarda
+# cada segmento terminado con un upsert y anota su índice en un archivo de checkpoint (JSON)
+# para poder reanudar.
+#
+# La memoria no depende de la duración del video: cada worker tiene un solo frame decodificado a
+# la vez y el proceso principal mantiene como mucho 2 segmentos en vuelo por worker.
+
+
+class CheckpointVideo:
+    """Progreso de un análisis en un archivo JSON (se reescribe de forma atómica tras cada segmento)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.datos = None
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.datos = json.load(f)
+
+    def iniciar(self, parametros, segmentos_total):
+        if self.datos is not None:
+            anteriores = {k: self.datos.get(k) for k in parametros}
+            if anteriores != parametros:
+                raise ValueError(
+                    f"El checkpoint '{self.path}' es de otro análisis ({anteriores}); bórrelo o use otro."
+                )
+            self.datos['estado'] = 'en_proceso'
+            return True
+        self.datos = {
+            **parametros,
+            'segmentos_total': segmentos_total,
+            'completados': [],
+            'frames_registrados': 0,
+            'estado': 'en_proceso',
+            'error': None,
+        }
+        self.guardar()
+        return False
+
+    @property
+    def completados(self):
+        return set(self.datos['completados'])
+
+    def segmento_completado(self, indice, frames):
+        self.datos['completados'].append(indice)
+        self.datos['frames_registrados'] += frames
+        self.guardar()
+
+    def finalizar(self, estado, error=None):
+        self.datos['estado'] = estado
+        self.datos['error'] = error
+        self.guardar()
+
+    def guardar(self):
+        temporal = f'{self.path}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.datos, f)
+        os.replace(temporal, self.path)
+
+
+def _guardar_segmento(sesion_id, resultados):
+    filas = [
+        AnalisisEmocion(sesion_id=sesion_id, **datos_analisis(sesion_id, momento, resultado, False))
+        for momento, resultado in resultados
+        if not resultado.get('invalid_image')
+    ]
+    # Upsert por (sesion, momento_segundo), en una sola transacción: si un intento anterior se cortó
+    # entre el INSERT y el checkpoint, el segmento se vuelve a guardar sobre las mismas filas
+    AnalisisEmocion.objects.upsert(filas, batch_size=500)
+    return len(filas)
+
+
+def analizar_video(path, sesion_id, fps=1.0, workers=None, segundos_por_segmento=60,
+                   checkpoint_path=None, progreso=None):
+    """
+    Analiza un video grabado y registra sus AnalisisEmocion en la sesión `sesion_id`.
+    Si existe el checkpoint de un análisis anterior con los mismos parámetros, solo se procesan
+    los segmentos pendientes. `progreso` recibe un diccionario tras cada segmento guardado.
+    Devuelve el contenido final del checkpoint.
+    """
+    SesionActividad.objects.only('id').get(id=sesion_id)
+    propiedades = propiedades_video(path)
+    segmentos = plan_segmentos(propiedades['duracion'], segundos_por_segmento)
+    workers = workers or os.cpu_count() or 1
+
+    checkpoint = CheckpointVideo(checkpoint_path or f'{path}.checkpoint.json')
+    checkpoint.iniciar({
+        'video': os.path.basename(path),
+        'sesion_id': sesion_id,
+        'fps': fps,
+        'segundos_por_segmento': segundos_por_segmento,
+    }, len(segmentos))
+    pendientes = [(i, inicio, fin) for i, (inicio, fin) in enumerate(segmentos) if i not in checkpoint.completados]
+
+    workers = max(1, min(workers, len(pendientes)))
+    started = time.perf_counter()
+    hilos = max(1, (os.cpu_count() or 1) // workers)
+    # 'spawn' evita heredar estado de TensorFlow/hilos del proceso padre
+    contexto = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=contexto,
+                                 initializer=inicializar_worker, initargs=(hilos,)) as pool:
+            en_vuelo = {}
+            cola = iter(pendientes)
+            while True:
+                # Como mucho 2 segmentos por worker: el resto del video no se lee hasta que haga falta
+                while len(en_vuelo) < 2 * workers:
+                    segmento = next(cola, None)
+                    if segmento is None:
+                        break
+                    indice, inicio, fin = segmento
+                    en_vuelo[pool.submit(analizar_segmento, path, indice, inicio, fin, fps)] = segmento
+                if not en_vuelo:
+                    break
+
+                terminados, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    indice, _, _ = en_vuelo.pop(futuro)
+                    _, resultados = futuro.result()
+                    frames = _guardar_segmento(sesion_id, resultados)
+                    checkpoint.segmento_completado(indice, frames)
+                    if progreso is not None:
+                        segundos = time.perf_counter() - started
+                        progreso({
+                            'segmentos_completados': len(checkpoint.completados),
+                            'segmentos_total': len(segmentos),
+                            'frames_registrados': checkpoint.datos['frames_registrados'],
+                            'segundos_transcurridos': segundos,
+                        })
+    except Exception as e:
+        checkpoint.finalizar('error', str(e))
+        raise
+    checkpoint.finalizar('completado')
+    return checkpoint.datos
+
+
+# --- Análisis en segundo plano de videos subidos (emocion-detection/video/) ---
+
+_trabajos = None
+_trabajos_lock = threading.Lock()
+
+
+def _config():
+    from django.conf import settings
+    return getattr(settings, 'EMOCION_VIDEO_ANALYSIS', {})
+
+
+def directorio_videos():
+    from django.conf import settings
+    directorio = _config().get('UPLOAD_DIR') or os.path.join(settings.BASE_DIR, 'videos')
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def _ejecutar_trabajo(path, sesion_id, fps):
+    config = _config()
+    # Los videos subidos se analizan dentro del proceso web: sus workers (cada uno con su TensorFlow)
+    # se limitan a MAX_WORKERS para no dejar sin CPU ni memoria a las peticiones
+    workers = min(config.get('WORKERS') or os.cpu_count() or 1, config.get('MAX_WORKERS', 2))
+    try:
+        analizar_video(
+            path, sesion_id, fps=fps,
+            workers=workers,
+            segundos_por_segmento=config.get('SEGMENT_SECONDS', 60),
+            checkpoint_path=_ruta_checkpoint(os.path.splitext(os.path.basename(path))[0]),
+        )
+        if config.get('DELETE_AFTER', True):
+            os.remove(path)
+    except Exception:
+        logger.exception("Falló el análisis del video '%s'", path)
+    finally:
+        from django.db import connection
+        connection.close()
+
+
+def _ruta_checkpoint(trabajo):
+    return os.path.join(directorio_videos(), f'{trabajo}.checkpoint.json')
+
+
+def _ruta_trabajo(trabajo):
+    return os.path.join(directorio_videos(), f'{trabajo}.trabajo.json')
+
+
+def encolar_video(archivo, sesion_id, fps, usuario_id=None):
+    """
+    Guarda el video subido (por bloques, sin cargarlo entero en memoria) y lo encola para analizarlo
+    en segundo plano. Los videos se analizan de uno en uno; cada uno usa todo el pool de procesos.
+    `usuario_id` (quien lo sube) es el único, junto con los administradores, que puede ver su estado.
+    Devuelve el identificador del trabajo.
+    """
+    global _trabajos
+    trabajo = uuid.uuid4().hex
+    extension = os.path.splitext(archivo.name)[1].lower() or '.mp4'
+    path = os.path.join(directorio_videos(), f'{trabajo}{extension}')
+    with open(_ruta_trabajo(trabajo), 'w', encoding='utf-8') as f:
+        json.dump({'usuario_id': usuario_id, 'sesion_id': sesion_id}, f)
+    with open(path, 'wb') as destino:
+        for bloque in archivo.chunks():
+            destino.write(bloque)
+
+    with _trabajos_lock:
+        if _trabajos is None:
+            _trabajos = ThreadPoolExecutor(max_workers=1, thread_name_prefix='analisis-video')
+    _trabajos.submit(_ejecutar_trabajo, path, sesion_id, fps)
+    return trabajo
+
+
+def propietario_trabajo(trabajo):
+    """Id del usuario que subió el video del trabajo, o None si no existe."""
+    try:
+        with open(_ruta_trabajo(trabajo), encoding='utf-8') as f:
+            return json.load(f)['usuario_id']
+    except FileNotFoundError:
+        return None
+
+
+def estado_trabajo(trabajo):
+    """Contenido del checkpoint del trabajo, {'estado': 'en_cola'} si aún no empezó, o None si no existe."""
+    checkpoint = CheckpointVideo(_ruta_checkpoint(trabajo))
+    if checkpoint.datos is not None:
+        return checkpoint.datos
+    if glob.glob(os.path.join(directorio_videos(), f'{trabajo}.*')):
+        return {'estado': 'en_cola'}
+    return None
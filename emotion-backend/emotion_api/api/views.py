@@ -1,6 +1,7 @@
 from django.shortcuts import render
+from django.http import HttpResponse, StreamingHttpResponse
 from django.conf import settings
-from django.db import IntegrityError # Importa IntegrityError para manejar duplicados
+from django.db import IntegrityError, transaction # Importa IntegrityError para manejar duplicados
 from django.utils import timezone # ¡IMPORTA ESTO para manejar zonas horarias!
 from django.db.models import Q # Importa Q para consultas complejas
 
@@ -11,7 +12,6 @@ from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, AllowAny # Importa permisos
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
-from tensorflow.keras.models import load_model
 
 # Importaciones para autenticación
 from django.contrib.auth import authenticate, login # Importa authenticate y login
@@ -28,6 +28,8 @@ from .models import (
     Actividad,
     SesionActividad,
     AnalisisEmocion,
+    ResumenEmocionSesion,
+    CeldaEmocionSesion,
     Calificacion
 )
 
@@ -48,6 +50,12 @@ from .serializers import (
     SesionActividadReadSerializer,
     AnalisisEmocionWriteSerializer,
     AnalisisEmocionReadSerializer,
+    AnalisisEmocionRangoSerializer,
+    ResumenEmocionSesionSerializer,
+    ResumenesFiltroSerializer,
+    LineaTiempoSerializer,
+    MapaCalorSerializer,
+    ExportacionEmocionesSerializer,
     CalificacionWriteSerializer, # Importa el serializador de escritura
     CalificacionReadSerializer,   # Importa el serializador de lectura
     EmotionFrameSerializer
@@ -58,8 +66,26 @@ import base64
 import cv2
 import numpy as np
 from datetime import datetime
-from .serializers import EmotionFrameSerializer
-from .ml_model.detector import detectar_emocion
+from .serializers import EmotionFrameSerializer, FrameMetadataSerializer, LoteFramesSerializer, VideoAnalisisSerializer
+from .ml_model.detector import (
+    detectar_emocion,
+    detectar_emociones_multiples,
+    get_model,
+    model_status,
+    olvidar_sesion,
+)
+from .ml_model.batching import current_batcher
+from .ml_model.face_detector_pool import get_face_detector_pool
+from .ml_model.tracking import current_tracker
+from .ml_model.dedup import current_dedup_cache
+from .ingest import registrar_frame, registrar_lote
+from .write_behind import current_write_behind_buffer, flush_write_behind, pending_write_behind
+from .session_state import marcar_sesion_borrada, marcar_sesion_finalizada, olvidar_estado_sesion, recordar_sesion_activa
+from .timeline import linea_tiempo_sesion, mapa_calor_actividad
+from .export import FORMATOS, analisis_a_exportar, lineas
+from .video_analysis import encolar_video, estado_trabajo, propietario_trabajo
+from .metrics import REGISTRO
+from .ml_model.inference_service import get_inference_client, service_enabled
 
 # --- Vistas para el Dashboard de Administración (Resúmenes) ---
 
@@ -376,8 +402,8 @@ class ActividadViewSet(viewsets.ModelViewSet):
 
     # Permisos: Admin y Docente CRUD. Alumno solo Read.
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
-            self.permission_classes = [IsDocente] # Docentes y Admins (por IsDocente) pueden CRUD
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'mapa_calor']:
+            self.permission_classes = [IsDocente] # Docentes y Admins (por IsDocente) pueden CRUD y ver el mapa de la clase
         else: # 'list', 'retrieve'
             self.permission_classes = [IsAuthenticated] # Alumnos, Docentes, Admins pueden leer
         return super().get_permissions()
@@ -401,6 +427,15 @@ class ActividadViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save()
 
+    # Mapa de calor de la clase: emoción dominante de cada alumno por intervalo (?intervalo=1m&desde=&hasta=)
+    @action(detail=True, methods=['get'], url_path='mapa-calor')
+    def mapa_calor(self, request, pk=None):
+        parametros = MapaCalorSerializer(data=request.query_params)
+        parametros.is_valid(raise_exception=True)
+        datos = parametros.validated_data
+        actividad = self.get_object()
+        return Response(mapa_calor_actividad(actividad.id, datos['intervalo'], datos.get('desde'), datos.get('hasta')))
+
 
 
 # ViewSet para el modelo SesionActividad
@@ -439,7 +474,21 @@ class SesionActividadViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         # Al crear una SesionActividad, establece la fecha_hora_inicio_real con timezone.now()
-        serializer.save(fecha_hora_inicio_real=timezone.now())
+        sesion = serializer.save(fecha_hora_inicio_real=timezone.now())
+        recordar_sesion_activa(sesion)
+
+    def perform_update(self, serializer):
+        sesion = serializer.save()
+        olvidar_estado_sesion(sesion.id) # Fechas o actividad pueden haber cambiado: se relee en el próximo frame
+
+    def perform_destroy(self, instance):
+        sesion_id = instance.id
+        instance.delete()
+        marcar_sesion_borrada(sesion_id) # Los frames en vuelo se rechazan antes de llegar al INSERT
+        olvidar_sesion(sesion_id)
+        dedup = current_dedup_cache()
+        if dedup is not None:
+            dedup.discard(sesion_id)
 
     # Acción personalizada para finalizar una sesión de actividad
     @action(detail=True, methods=['post'])
@@ -454,14 +503,59 @@ class SesionActividadViewSet(viewsets.ModelViewSet):
             
             sesion.fecha_hora_fin_real = timezone.now() # Usar timezone.now()
             sesion.save()
+            marcar_sesion_finalizada(sesion.id) # Los frames siguientes se rechazan sin consultar la base de datos
+            flush_write_behind() # Los análisis encolados en este proceso quedan guardados antes de responder
+            # Frames de este proceso que aún no están en la base de datos (spools que reintenta el hilo de
+            # fondo; se cuentan en memoria): el resumen de la sesión se completará cuando se guarden
+            pendientes = pending_write_behind(sesion.id)
+            olvidar_sesion(sesion.id) # Liberar el seguimiento del rostro de esta sesión
+            dedup = current_dedup_cache()
+            if dedup is not None:
+                dedup.discard(sesion.id)
             
             serializer = SesionActividadReadSerializer(sesion) # Usar el serializador de lectura para la respuesta
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return Response({**serializer.data, 'analisis_pendientes': pendientes}, status=status.HTTP_200_OK)
         except SesionActividad.DoesNotExist:
             return Response({"error": "Sesión de actividad no encontrada."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    # Resumen de emociones de una sesión: totales por emoción, confianza media, emoción dominante y frames sin rostro
+    @action(detail=True, methods=['get'], url_path='resumen-emociones')
+    def resumen_emociones(self, request, pk=None):
+        sesion = self.get_object()
+        # Una sesión sin frames todavía no tiene resumen: se responde con todo en cero
+        resumen = getattr(sesion, 'resumen_emociones', None) or ResumenEmocionSesion(sesion=sesion)
+        return Response(ResumenEmocionSesionSerializer(resumen).data)
+
+    # Línea de tiempo agregada por intervalos (?intervalo=5s|30s|1m&desde=&hasta=) para graficar sesiones largas
+    @action(detail=True, methods=['get'], url_path='linea-tiempo')
+    def linea_tiempo(self, request, pk=None):
+        parametros = LineaTiempoSerializer(data=request.query_params)
+        parametros.is_valid(raise_exception=True)
+        datos = parametros.validated_data
+        sesion = self.get_object()
+        return Response(linea_tiempo_sesion(sesion.id, datos['intervalo'], datos.get('desde'), datos.get('hasta')))
+
+    # Resúmenes de varias sesiones en una sola consulta: ?sesiones=1,2,3 y/o ?actividad=X y/o ?alumno=Y
+    @action(detail=False, methods=['get'], url_path='resumenes-emociones')
+    def resumenes_emociones(self, request):
+        filtros = ResumenesFiltroSerializer(data=request.query_params)
+        filtros.is_valid(raise_exception=True)
+        datos = filtros.validated_data
+
+        sesiones = self.get_queryset() # Cada rol ve solo las sesiones que ya puede ver
+        if 'sesiones' in datos:
+            sesiones = sesiones.filter(id__in=datos['sesiones'])
+        if 'actividad' in datos:
+            sesiones = sesiones.filter(actividad_id=datos['actividad'])
+        if 'alumno' in datos:
+            sesiones = sesiones.filter(alumno_id=datos['alumno'])
+        sesiones = sesiones.select_related('resumen_emociones').order_by('id')
+
+        resumenes = [getattr(sesion, 'resumen_emociones', None) or ResumenEmocionSesion(sesion=sesion) for sesion in sesiones]
+        return Response(ResumenEmocionSesionSerializer(resumenes, many=True).data)
+
 
 
 # ViewSet para el modelo AnalisisEmocion
@@ -495,10 +589,50 @@ class AnalisisEmocionViewSet(viewsets.ModelViewSet):
             elif user.rol == 'alumno':
                 # Alumno no tiene acceso a esta tabla, el permiso ya lo deniega
                 queryset = AnalisisEmocion.objects.none() # Asegurarse de que no vea nada
+
+        if self.action in ['list', 'retrieve']:
+            # El serializador de lectura anida sesión, alumno, actividad, materia y nivel: sin esto serían consultas por fila
+            queryset = queryset.select_related(
+                'sesion__alumno', 'sesion__actividad__materia__nivel'
+            ).prefetch_related('sesion__actividad__materia__cursodocente_set')
+
+        if self.action == 'list':
+            # Línea de tiempo de una sesión: ?sesion=X&desde=&hasta= (segundos, inclusive). Con 'sesion'
+            # se lee el índice único (sesion_id, momento_segundo) por rango y ya en orden.
+            filtros = AnalisisEmocionRangoSerializer(data=self.request.query_params)
+            filtros.is_valid(raise_exception=True)
+            datos = filtros.validated_data
+            if 'sesion' in datos:
+                queryset = queryset.filter(sesion_id=datos['sesion'])
+            if 'desde' in datos:
+                queryset = queryset.filter(momento_segundo__gte=datos['desde'])
+            if 'hasta' in datos:
+                queryset = queryset.filter(momento_segundo__lte=datos['hasta'])
+            queryset = queryset.order_by('sesion_id', 'momento_segundo')
         return queryset
 
+    # Los cambios hechos a mano también se reflejan en el resumen y el mapa de calor de la sesión
     def perform_create(self, serializer):
-        serializer.save()
+        with transaction.atomic():
+            analisis = serializer.save()
+            _aplicar_contadores([], [analisis.valores_contadores()])
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            anterior = serializer.instance.valores_contadores()
+            analisis = serializer.save()
+            _aplicar_contadores([anterior], [analisis.valores_contadores()])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            anterior = instance.valores_contadores()
+            instance.delete()
+            _aplicar_contadores([anterior], [])
+
+
+def _aplicar_contadores(anteriores, nuevas):
+    for modelo in (ResumenEmocionSesion, CeldaEmocionSesion):
+        modelo.objects.aplicar(anteriores, nuevas)
 
 
 
@@ -561,6 +695,13 @@ class CalificacionViewSet(viewsets.ModelViewSet):
 
 
 
+# Flujo común de las vistas de recepción de frames (ver api/ingest.py)
+def registrar_frame_emocion(sesion_id, momento_segundo, image_bytes):
+    payload, codigo = registrar_frame(sesion_id, momento_segundo, image_bytes)
+    return Response(payload, status=codigo)
+
+
+
 # Vista para la Recepción de Datos de Emoción en Tiempo Real
 class EmocionDetectionAPIView(APIView):
     parser_classes = [JSONParser] 
@@ -575,73 +716,241 @@ class EmocionDetectionAPIView(APIView):
         frame_base64 = serializer.validated_data['frame_base64']
         momento_segundo = serializer.validated_data['momento_segundo']
 
+        if ',' in frame_base64:
+            _, frame_base64 = frame_base64.split(',', 1)
         try:
-            sesion = SesionActividad.objects.get(id=sesion_id)
-            
+            image_bytes = base64.b64decode(frame_base64)
+        except ValueError:
+            return Response({"error": "No se pudo decodificar la imagen Base64 o es inválida."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return registrar_frame_emocion(sesion_id, momento_segundo, image_bytes)
+
+
+
+# Vista hermana de EmocionDetectionAPIView que recibe el frame en binario (sin base64 ni JSON):
+# - cuerpo crudo con Content-Type image/jpeg, image/webp u application/octet-stream, o
+# - multipart con el archivo en el campo 'frame'.
+# sesion_id y momento_segundo van en las cabeceras X-Sesion-Id / X-Momento-Segundo o en la query string.
+class EmocionFrameUploadView(APIView):
+    parser_classes = [MultiPartParser]
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        meta = FrameMetadataSerializer(data={
+            'sesion_id': request.headers.get('X-Sesion-Id', request.query_params.get('sesion_id')),
+            'momento_segundo': request.headers.get('X-Momento-Segundo', request.query_params.get('momento_segundo')),
+        })
+        meta.is_valid(raise_exception=True)
+
+        if request.content_type.startswith('multipart/'):
+            archivo = request.FILES.get('frame')
+            if archivo is None:
+                return Response({"error": "Falta el archivo 'frame'."}, status=status.HTTP_400_BAD_REQUEST)
+            image_bytes = archivo.read()
+        else:
+            # Cuerpo crudo: request.body ya son los bytes del JPEG, sin copias adicionales
+            image_bytes = request.body
+
+        if not image_bytes:
+            return Response({"error": "El cuerpo de la petición está vacío."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return registrar_frame_emocion(meta.validated_data['sesion_id'], meta.validated_data['momento_segundo'], image_bytes)
+
+
+
+# Vista para recibir varios frames de una sesión en una sola petición (clientes con mala conexión
+# que acumulan unos segundos de frames). Se analizan en una sola pasada del modelo y se guardan
+# con un único upsert; la respuesta trae un resultado por frame, ordenado por momento_segundo.
+class EmocionLoteAPIView(APIView):
+    parser_classes = [JSONParser]
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        serializer = LoteFramesSerializer(data=request.data)
+        if not serializer.is_valid():
+            errores = dict(serializer.errors)
+            if isinstance(errores.get('frames'), list) and all(isinstance(e, dict) for e in errores['frames']):
+                # Un error por frame inválido, con su índice en la lista enviada
+                errores['frames'] = {i: error for i, error in enumerate(errores['frames']) if error}
+            return Response(errores, status=status.HTTP_400_BAD_REQUEST)
+
+        frames = []
+        for i, frame in enumerate(serializer.validated_data['frames']):
+            frame_base64 = frame['frame_base64']
             if ',' in frame_base64:
                 _, frame_base64 = frame_base64.split(',', 1)
-            
-            image_bytes = base64.b64decode(frame_base64)
-            np_array = np.frombuffer(image_bytes, np.uint8)
-            imagen_cv2 = cv2.imdecode(np_array, cv2.IMREAD_COLOR) 
-
-            if imagen_cv2 is None:
-                return Response({"error": "No se pudo decodificar la imagen Base64 o es inválida."}, status=status.HTTP_400_BAD_REQUEST)
-
-            # --- LLAMADA AL NUEVO detector.py ---
-            emotion_results = detectar_emocion(imagen_cv2)
-
-            # Preparar datos para AnalisisEmocion
-            analisis_data = {
-                'sesion': sesion.id,
-                'momento_segundo': momento_segundo,
-                'emocion_predominante': None, # Valor por defecto
-                'confianza_emocion': 0.0, # Valor por defecto
-                'datos_raw_emociones': {} # Valor por defecto
-            }
-
-            if emotion_results and emotion_results.get('detected', False): # Si hubo detección exitosa
-                analisis_data['emocion_predominante'] = emotion_results.get('emotion')
-                analisis_data['confianza_emocion'] = emotion_results.get('confidence')
-                analisis_data['datos_raw_emociones'] = emotion_results.get('all_emotions', {})
-                print(f"DEBUG: Rostro detectado y emoción procesada para sesion_id={sesion_id}, momento_segundo={momento_segundo}")
-            else: # No hubo detección o hubo un error en el detector
-                # Podemos usar un valor específico para 'no_detectado' si tu modelo lo permite
-                # o simplemente mantener el valor por defecto de None/0.0
-                analisis_data['emocion_predominante'] = 'no_detectado' # Asigna un valor para "no detectado"
-                analisis_data['confianza_emocion'] = 0.0
-                analisis_data['datos_raw_emociones'] = emotion_results.get('all_emotions', {}) if emotion_results else {} # Intenta obtener all_emotions si result está presente
-                
-                # Mensaje de depuración más específico
-                if emotion_results:
-                    print(f"DEBUG: Detección fallida para sesion_id={sesion_id}, momento_segundo={momento_segundo}. Mensaje: {emotion_results.get('message', 'N/A')}, Error: {emotion_results.get('error', 'N/A')}")
-                else:
-                    print(f"DEBUG: detect_emotion retornó None inesperadamente para sesion_id={sesion_id}, momento_segundo={momento_segundo}")
+            try:
+                frames.append((frame['momento_segundo'], base64.b64decode(frame_base64)))
+            except ValueError:
+                return Response(
+                    {"error": f"Base64 inválido en el frame {i} (momento_segundo={frame['momento_segundo']})."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
+        payload, codigo = registrar_lote(serializer.validated_data['sesion_id'], frames)
+        return Response(payload, status=codigo)
 
-            # Usar AnalisisEmocionWriteSerializer para guardar
-            analisis_serializer = AnalisisEmocionWriteSerializer(data=analisis_data)
-            if analisis_serializer.is_valid():
-                analisis_serializer.save()
-                
-                response_data = {
-                    "emocion": analisis_data['emocion_predominante'],
-                    "confianza": analisis_data['confianza_emocion'],
-                    "message": "Análisis de emoción registrado."
-                }
-                if not (emotion_results and emotion_results.get('detected', False)):
-                    response_data["message"] = "Frame recibido, pero no se detectó rostro o hubo un problema."
-
-                return Response(response_data, status=status.HTTP_201_CREATED)
-            else:
-                print(f"ERROR: Errores de validación al guardar AnalisisEmocion: {analisis_serializer.errors}")
-                return Response(analisis_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        except SesionActividad.DoesNotExist:
+
+# Vista para clasificar todos los rostros de un frame (una cámara apuntando a un grupo de alumnos)
+# Acepta una imagen multipart ('image') o JSON con 'frame_base64'; no guarda análisis
+class MultiFaceEmotionDetectionView(APIView):
+    parser_classes = [JSONParser, MultiPartParser]
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        file = request.FILES.get('image')
+        if file:
+            image_bytes = file.read()
+        else:
+            frame_base64 = request.data.get('frame_base64')
+            if not frame_base64:
+                return Response({'error': "Se requiere 'image' o 'frame_base64'.", 'detected': False}, status=status.HTTP_400_BAD_REQUEST)
+            if ',' in frame_base64:
+                _, frame_base64 = frame_base64.split(',', 1)
+            try:
+                image_bytes = base64.b64decode(frame_base64)
+            except ValueError:
+                return Response({'error': 'Base64 inválido.', 'detected': False}, status=status.HTTP_400_BAD_REQUEST)
+
+        imagen_cv2 = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if imagen_cv2 is None:
+            return Response({'error': 'No se pudo decodificar la imagen.', 'detected': False}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultados = detectar_emociones_multiples(imagen_cv2)
+        if resultados.get('error'):
+            return Response({'detected': False, 'rostros': [], 'error': resultados['error']}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        rostros = [{
+            'emocion': r['emotion'],
+            'confianza': round(r['confidence'], 4),
+            'datos_raw_emociones': r['all_emotions'],
+            'face_box': r['face_box'],
+        } for r in resultados.get('faces', [])]
+        return Response({
+            'detected': bool(rostros),
+            'total_rostros': len(rostros),
+            'rostros': rostros,
+        }, status=status.HTTP_200_OK)
+
+
+
+# Vista para subir un video grabado de una actividad y analizarlo en segundo plano (api/video_analysis.py).
+# Responde 202 con el identificador del trabajo; el progreso se consulta en emocion-detection/video/<trabajo>/
+class EmocionVideoUploadView(APIView):
+    parser_classes = [MultiPartParser]
+    permission_classes = [IsDocente]
+
+    def post(self, request, *args, **kwargs):
+        serializer = VideoAnalisisSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        sesion_id = serializer.validated_data['sesion_id']
+        sesiones = SesionActividad.objects.filter(id=sesion_id)
+        if request.user.rol == 'docente':
+            # Docente solo analiza videos de sesiones de sus materias
+            sesiones = sesiones.filter(actividad__materia__in=Materia.objects.filter(cursodocente__docente=request.user))
+        if not sesiones.exists():
             return Response({"error": "Sesión de actividad no encontrada."}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            print(f"ERROR: Error interno del servidor en EmocionDetectionAPIView: {str(e)}")
-            return Response({"error": f"Error interno del servidor: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        fps = serializer.validated_data.get('fps') or settings.EMOCION_VIDEO_ANALYSIS.get('SAMPLE_FPS', 1.0)
+        trabajo = encolar_video(serializer.validated_data['video'], sesion_id, fps, usuario_id=request.user.id)
+        return Response({
+            'trabajo': trabajo,
+            'estado': 'en_cola',
+            'estado_url': request.build_absolute_uri(f'{trabajo}/'),
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class EmocionVideoEstadoView(APIView):
+    permission_classes = [IsDocente]
+
+    def get(self, request, trabajo, *args, **kwargs):
+        # Solo quien subió el video (o un administrador) ve el trabajo; para el resto no existe
+        if request.user.rol != 'admin' and propietario_trabajo(trabajo) != request.user.id:
+            return Response({"error": "Trabajo de análisis no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        estado = estado_trabajo(trabajo)
+        if estado is None:
+            return Response({"error": "Trabajo de análisis no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(estado, status=status.HTTP_200_OK)
+
+
+
+# Exportación para investigación: CSV o NDJSON en streaming (?formato=csv|ndjson&materia=&actividad=&alumno=&desde=&hasta=)
+# Las filas se leen y se envían por bloques, sin cargar la consulta completa en memoria.
+class ExportacionEmocionesView(APIView):
+    permission_classes = [IsDocente]
+
+    def get(self, request, *args, **kwargs):
+        parametros = ExportacionEmocionesSerializer(data=request.query_params)
+        parametros.is_valid(raise_exception=True)
+        datos = dict(parametros.validated_data)
+        formato = datos.pop('formato')
+
+        analisis = AnalisisEmocion.objects.all()
+        if request.user.rol == 'docente':
+            # Docente exporta solo los análisis de las materias que imparte
+            materias_impartidas = Materia.objects.filter(cursodocente__docente=request.user)
+            analisis = analisis.filter(sesion__actividad__materia__in=materias_impartidas)
+
+        content_type, extension = FORMATOS[formato]
+        respuesta = StreamingHttpResponse(lineas(formato, analisis_a_exportar(analisis, **datos)), content_type=content_type)
+        respuesta['Content-Disposition'] = f'attachment; filename="emociones_{timezone.now():%Y%m%d_%H%M%S}.{extension}"'
+        return respuesta
+
+
+# Vista con estadísticas de inferencia (tamaño de lotes, espera en cola, pool de detectores)
+class InferenceStatsView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        batcher = current_batcher()
+        tracker = current_tracker()
+        dedup = current_dedup_cache()
+        write_behind = current_write_behind_buffer()
+        return Response({
+            'batching': batcher.stats() if batcher else None,
+            'face_detector_pool': get_face_detector_pool().stats(),
+            'face_tracking': tracker.stats() if tracker else None,
+            'frame_dedup': dedup.stats() if dedup else None,
+            'write_behind': write_behind.stats() if write_behind else None,
+        }, status=status.HTTP_200_OK)
+
+
+
+# Métricas del proceso en formato de texto de Prometheus (ver api/metrics.py)
+def metrics_view(request):
+    return HttpResponse(REGISTRO.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+
+# Vista de readiness: indica si el modelo de emociones ya está cargado en este proceso
+# Responde 503 mientras no lo esté, para que el balanceador no envíe frames todavía
+class ModelReadinessView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        if service_enabled():
+            # El modelo vive en el servicio de inferencia: estamos listos si responde
+            try:
+                servicio = get_inference_client().ping()
+            except Exception as e:
+                return Response({'loaded': False, 'service': None, 'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            listo = any(servicio['workers'].values())
+            codigo = status.HTTP_200_OK if listo else status.HTTP_503_SERVICE_UNAVAILABLE
+            return Response({'loaded': listo, 'service': servicio}, status=codigo)
+
+        if model_status()['error']:
+            # La última carga falló: get_model() la reintenta si ya pasó la espera
+            get_model()
+        estado = model_status()
+        estado['face_detectors'] = get_face_detector_pool().stats()['created']
+        codigo = status.HTTP_200_OK if estado['loaded'] else status.HTTP_503_SERVICE_UNAVAILABLE
+        return Response(estado, status=codigo)
 
 
 
@@ -0,0 +1,76 @@
+import json
+import re
+
+from asgiref.sync import sync_to_async
+
+from .ingest import registrar_frame
+from .session_state import validar_sesion_frame
+
+# Canal WebSocket por sesión de actividad: ws://<host>/ws/sesiones/<sesion_id>/
+#
+# La sesión se valida al conectar (y en cada frame, contra la caché de api/session_state.py). Después, cada mensaje binario es un frame:
+#   4 bytes (entero sin signo big-endian) con momento_segundo + el JPEG/WebP codificado.
+# Por cada frame se responde con un mensaje de texto JSON con el mismo contenido que
+# emocion-detection/ más 'momento_segundo' y 'status'. La inferencia y el INSERT se ejecutan
+# en hilos (sync_to_async) para no bloquear el event loop.
+
+RUTA_SESION = re.compile(r'^/ws/sesiones/(?P<sesion_id>\d+)/?$')
+
+# Códigos de cierre propios (rango 4000-4999 reservado a aplicaciones)
+CIERRE_RUTA_DESCONOCIDA = 4000
+CIERRE_SESION_NO_ENCONTRADA = 4404
+CIERRE_SESION_FINALIZADA = 4410
+
+# Respuestas de validar_sesion_frame que cierran el socket
+CIERRES = {404: CIERRE_SESION_NO_ENCONTRADA, 409: CIERRE_SESION_FINALIZADA}
+
+CABECERA_BYTES = 4
+
+
+async def _enviar_json(send, data):
+    await send({'type': 'websocket.send', 'text': json.dumps(data)})
+
+
+async def websocket_application(scope, receive, send):
+    """Aplicación ASGI para las conexiones WebSocket (se enruta desde emotion_api/asgi.py)."""
+    match = RUTA_SESION.match(scope['path'])
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CIERRE_RUTA_DESCONOCIDA})
+        return
+
+    sesion_id = int(match.group('sesion_id'))
+    rechazo = await sync_to_async(validar_sesion_frame)(sesion_id)
+    if rechazo is not None:
+        await send({'type': 'websocket.close', 'code': CIERRES[rechazo[1]]})
+        return
+    await send({'type': 'websocket.accept'})
+
+    # thread_sensitive=False: los frames de distintas sesiones se procesan en paralelo
+    registrar = sync_to_async(registrar_frame, thread_sensitive=False)
+
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            break
+        if message['type'] != 'websocket.receive':
+            continue
+
+        data = message.get('bytes')
+        if not data or len(data) <= CABECERA_BYTES:
+            await _enviar_json(send, {
+                'error': "Se esperaba un mensaje binario: 4 bytes con momento_segundo seguidos de la imagen.",
+                'status': 400,
+            })
+            continue
+
+        momento_segundo = int.from_bytes(data[:CABECERA_BYTES], 'big')
+        # Los frames de un mismo socket se procesan en orden; la concurrencia viene de las distintas sesiones
+        payload, codigo = await registrar(sesion_id, momento_segundo, memoryview(data)[CABECERA_BYTES:])
+        await _enviar_json(send, {**payload, 'momento_segundo': momento_segundo, 'status': codigo})
+        if codigo in CIERRES:
+            # La sesión terminó (end_session o fin de la ventana de análisis) mientras el socket seguía abierto
+            await send({'type': 'websocket.close', 'code': CIERRES[codigo]})
+            break
@@ -0,0 +1,447 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+import numpy as np
+from django.db import DataError, IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# Buffers abiertos en este proceso: sus diarios no se recuperan aunque tengan el pid actual
+_tokens_activos = set()
+
+
+def _fila_a_dict(fila):
+    return {
+        f.attname: getattr(fila, f.attname)
+        for f in fila._meta.concrete_fields if not f.primary_key
+    }
+
+
+def _pid_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _dueno(path):
+    """(pid, token) de un diario 'journal-<pid>-<uuid>-<n>.<ext>' (o 'journal-<pid>-<n>' de versiones anteriores)."""
+    partes = os.path.basename(path).rsplit('.', 1)[0].split('-')
+    return int(partes[1]), '-'.join(partes[1:-1])
+
+
+class WriteBehindBuffer:
+    """
+    Cola de escritura diferida para filas de un modelo (AnalisisEmocion).
+
+    Las vistas encolan las filas y responden sin esperar al INSERT; un hilo en segundo plano
+    las guarda con un único bulk_create cuando la cola llega a `flush_size` filas o cada
+    `flush_interval` segundos. flush() fuerza el guardado síncrono (ej. al finalizar una sesión).
+
+    Para no perder filas si el proceso muere, cada fila se anota también en un diario JSONL
+    antes de encolarse. El diario lleva el pid y un identificador único del buffer, así que un
+    proceso nuevo que reutiliza el pid de otro ya terminado no escribe en su diario. Al vaciar la
+    cola el diario se rota: si el INSERT funciona se borra, y si falla por un error transitorio
+    (ej. base de datos bloqueada) se conserva como archivo .spool que el hilo de fondo reintenta
+    con espera exponencial (de `retry_min_seconds` a `retry_max_seconds`). recover() vuelve a
+    insertar los diarios y spools que dejaron procesos que ya no existen.
+
+    Si el INSERT falla por un error de integridad (ej. la sesión se borró mientras sus frames
+    estaban en cola) el lote se divide a la mitad hasta aislar las filas que no se pueden guardar:
+    el resto se guarda y esas filas se apartan en un archivo .rejected junto con el error.
+
+    `insertar(filas)` hace el INSERT en bloque (por defecto, model.objects.bulk_create). Si es un
+    upsert, reinsertar un diario que ya se había guardado en parte no duplica filas.
+    """
+
+    def __init__(self, model, journal_dir, flush_size=200, flush_interval=1.0, fsync=False, insertar=None,
+                 retry_min_seconds=1.0, retry_max_seconds=60.0, recover_on_start=False):
+        self.model = model
+        self.insertar = insertar or model.objects.bulk_create
+        self.journal_dir = journal_dir
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.retry_min_seconds = retry_min_seconds
+        self.retry_max_seconds = retry_max_seconds
+        os.makedirs(journal_dir, exist_ok=True)
+        self._token = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+        self._prefix = os.path.join(journal_dir, f'journal-{self._token}')
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # Un solo vaciado a la vez (hilo de fondo o flush() explícito)
+        self._wakeup = threading.Event()
+        self._pending = []
+        self._journal_seq = 0
+        self._journal = None
+        self._closed = False
+        self._spools = []                   # Spools pendientes de reintento (propios o recuperados)
+        self._filas_spool = {}              # Filas por sesión de cada spool pendiente, para pending() sin leer archivos
+        self._retry_delay = retry_min_seconds
+        self._retry_at = 0.0                # time.monotonic() del próximo reintento
+        # Métricas
+        self._flushes = 0
+        self._rows_flushed = 0
+        self._failed_flushes = 0
+        self._spooled_rows = 0
+        self._recovered_rows = 0
+        self._rejected_rows = 0
+        self._flush_ms = deque(maxlen=1000)
+        self._last_error = None
+        _tokens_activos.add(self._token)
+        if recover_on_start:
+            # Antes de abrir el diario propio: así nunca se mezcla con los de procesos anteriores
+            try:
+                self.recover()
+            except Exception:
+                logger.exception("No se pudieron recuperar filas pendientes del write-behind")
+        self._journal = self._open_journal()
+        self._thread = threading.Thread(target=self._run, name='analisis-write-behind', daemon=True)
+        self._thread.start()
+
+    def _open_journal(self):
+        self._journal_seq += 1
+        return open(f'{self._prefix}-{self._journal_seq}.jsonl', 'a', encoding='utf-8')
+
+    def add(self, filas):
+        """Encola filas (instancias sin guardar) para el próximo bulk_create."""
+        lineas = ''.join(json.dumps(_fila_a_dict(f)) + '\n' for f in filas)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("El buffer de escritura diferida está cerrado.")
+            self._journal.write(lineas)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._pending.extend(filas)
+            lleno = len(self._pending) >= self.flush_size
+        if lleno:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._closed:
+                break
+            self.flush()
+            if self._spools and time.monotonic() >= self._retry_at:
+                self.retry_spools()
+        # El hilo usa su propia conexión a la base de datos
+        from django.db import connection
+        connection.close()
+
+    def _guardar(self, filas):
+        """
+        Inserta las filas y devuelve las que no se pudieron guardar, como [(fila, error)]. Si el lote
+        falla por un error de integridad se divide a la mitad hasta aislar esas filas; cualquier otro
+        error (transitorio) se propaga para reintentar el lote completo.
+        """
+        try:
+            self.insertar(filas)
+            return []
+        except (IntegrityError, DataError) as e:
+            if len(filas) == 1:
+                return [(filas[0], str(e))]
+        mitad = len(filas) // 2
+        return self._guardar(filas[:mitad]) + self._guardar(filas[mitad:])
+
+    def _rechazar(self, path, rechazadas):
+        if not rechazadas:
+            return
+        destino = path.rsplit('.', 1)[0] + '.rejected'
+        with open(destino, 'a', encoding='utf-8') as f:
+            for fila, error in rechazadas:
+                f.write(json.dumps({'fila': fila if isinstance(fila, str) else _fila_a_dict(fila), 'error': error}) + '\n')
+        self._rejected_rows += len(rechazadas)
+        logger.warning("%d filas del write-behind no se pueden guardar; se apartaron en %s (%s)",
+                       len(rechazadas), destino, rechazadas[0][1])
+
+    def _reinsertar(self, path):
+        """Inserta las filas de un diario o spool y lo borra. Devuelve cuántas se guardaron."""
+        filas, rechazadas = [], []
+        with open(path, encoding='utf-8') as f:
+            for linea in f:
+                if not linea.strip():
+                    continue
+                try:
+                    datos = json.loads(linea)
+                    filas.append(self.model(**datos))
+                except (ValueError, TypeError) as e:
+                    # Línea truncada (el proceso murió mientras escribía) o campos que ya no existen
+                    rechazadas.append((linea.rstrip('\n'), str(e)))
+        with self._lock:
+            self._filas_spool[path] = Counter(f.sesion_id for f in filas)
+        fallidas = self._guardar(filas) if filas else []
+        self._rechazar(path, rechazadas + fallidas)
+        os.remove(path)
+        with self._lock:
+            self._filas_spool.pop(path, None)
+        return len(filas) - len(fallidas)
+
+    def flush(self):
+        """Guarda ahora todas las filas encoladas. Devuelve cuántas se guardaron."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                filas, self._pending = self._pending, []
+                journal = self._journal
+                self._journal = self._open_journal()
+            journal.close()
+
+            started = time.perf_counter()
+            try:
+                rechazadas = self._guardar(filas)
+            except Exception as e:
+                # Se conserva el diario como spool para reintentarlo desde el hilo de fondo
+                spool = journal.name[:-len('.jsonl')] + '.spool'
+                os.replace(journal.name, spool)
+                self._spools.append(spool)
+                with self._lock:
+                    self._filas_spool[spool] = Counter(f.sesion_id for f in filas)
+                self._programar_reintento()
+                self._failed_flushes += 1
+                self._spooled_rows += len(filas)
+                self._last_error = str(e)
+                logger.warning("No se pudieron guardar %d filas del write-behind; se reintentarán desde %s: %s",
+                               len(filas), spool, e)
+                return 0
+            self._rechazar(journal.name, rechazadas)
+            os.remove(journal.name)
+            self._flush_ms.append((time.perf_counter() - started) * 1000.0)
+            self._flushes += 1
+            self._rows_flushed += len(filas) - len(rechazadas)
+            return len(filas) - len(rechazadas)
+
+    def _programar_reintento(self):
+        self._retry_at = time.monotonic() + self._retry_delay
+        self._retry_delay = min(self._retry_delay * 2, self.retry_max_seconds)
+
+    def retry_spools(self):
+        """Reintenta los spools pendientes en orden. Devuelve cuántas filas se guardaron."""
+        guardadas = 0
+        with self._flush_lock:
+            while self._spools:
+                path = self._spools[0]
+                try:
+                    guardadas += self._reinsertar(path) if os.path.exists(path) else 0
+                except Exception as e:
+                    self._last_error = str(e)
+                    self._programar_reintento()
+                    logger.warning("Reintento del spool %s fallido; siguiente en %.0f s: %s",
+                                   path, self._retry_at - time.monotonic(), e)
+                    break
+                self._spools.pop(0)
+                with self._lock:
+                    self._filas_spool.pop(path, None) # Ya no existe (ej. lo recuperó otro proceso)
+            else:
+                self._retry_delay = self.retry_min_seconds
+        self._recovered_rows += guardadas
+        return guardadas
+
+    def _archivos_de_otros(self, own=False):
+        """Diarios y spools que este buffer no está escribiendo (de procesos terminados, y los propios con own=True)."""
+        archivos = glob.glob(os.path.join(self.journal_dir, 'journal-*.jsonl'))
+        archivos += glob.glob(os.path.join(self.journal_dir, 'journal-*.spool'))
+        with self._lock:
+            actual = self._journal.name if self._journal is not None else None
+        for path in sorted(archivos):
+            if path == actual or path in self._spools:
+                continue
+            try:
+                pid, token = _dueno(path)
+            except (IndexError, ValueError):
+                continue # No es un diario de este módulo
+            if token == self._token:
+                if own:
+                    yield path
+            elif token in _tokens_activos:
+                continue # Otro buffer vivo de este mismo proceso
+            elif pid == os.getpid() or not _pid_vivo(pid):
+                # Con el pid actual pero de otro buffer: un proceso anterior que tenía el mismo pid
+                yield path
+
+    def recover(self, own=False):
+        """
+        Reinserta las filas de diarios/spools de procesos terminados (y de este, con own=True).
+        Un archivo que falla no detiene la recuperación del resto: queda como spool de este buffer
+        y se reintenta desde el hilo de fondo. Devuelve el número de filas recuperadas.
+        """
+        recuperadas = 0
+        for path in self._archivos_de_otros(own=own):
+            try:
+                recuperadas += self._reinsertar(path)
+            except Exception as e:
+                logger.exception("No se pudieron recuperar las filas de %s; se reintentarán más tarde", path)
+                self._last_error = str(e)
+                self._spools.append(path)
+                self._programar_reintento()
+        self._recovered_rows += recuperadas
+        return recuperadas
+
+    def pending(self, sesion_id=None):
+        """
+        Filas que este buffer aún no guardó (de una sesión, o todas): su cola y sus spools por reintentar.
+        Se cuenta en memoria, sin leer los diarios; los de otros procesos los cuenta filas_en_diarios().
+        """
+        with self._lock:
+            if sesion_id is None:
+                return len(self._pending) + sum(sum(c.values()) for c in self._filas_spool.values())
+            return (sum(1 for f in self._pending if f.sesion_id == sesion_id)
+                    + sum(c[sesion_id] for c in self._filas_spool.values()))
+
+    def close(self):
+        """Detiene el hilo de fondo y guarda lo que quede en la cola."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                journal = self._journal
+            journal.close()
+            if os.path.exists(journal.name) and not os.path.getsize(journal.name):
+                os.remove(journal.name)
+            # Los spools que queden los recupera el próximo buffer (de este u otro proceso)
+            _tokens_activos.discard(self._token)
+
+    def stats(self):
+        with self._lock:
+            depth = len(self._pending)
+        flush_ms = np.asarray(self._flush_ms, dtype=np.float64)
+        return {
+            'queue_depth': depth,
+            'flushes': self._flushes,
+            'rows_flushed': self._rows_flushed,
+            'flush_ms': {
+                'mean': float(flush_ms.mean()) if flush_ms.size else None,
+                'p95': float(np.percentile(flush_ms, 95)) if flush_ms.size else None,
+                'max': float(flush_ms.max()) if flush_ms.size else None,
+            },
+            'failed_flushes': self._failed_flushes,
+            'spooled_rows': self._spooled_rows,
+            'pending_spools': len(self._spools),
+            'recovered_rows': self._recovered_rows,
+            'rejected_rows': self._rejected_rows,
+            'last_error': self._last_error,
+        }
+
+
+def filas_en_diarios(journal_dir, sesion_ids=None):
+    """
+    Filas anotadas en los diarios y spools de `journal_dir` (de las sesiones `sesion_ids`, o todas) aún sin
+    guardar, de todos los procesos. Lee cada archivo: es para comandos de gestión, no para una petición.
+    """
+    total = 0
+    archivos = glob.glob(os.path.join(journal_dir, 'journal-*.jsonl'))
+    archivos += glob.glob(os.path.join(journal_dir, 'journal-*.spool'))
+    for path in archivos:
+        try:
+            with open(path, encoding='utf-8') as f:
+                for linea in f:
+                    if linea.strip() and (sesion_ids is None or json.loads(linea).get('sesion_id') in sesion_ids):
+                        total += 1
+        except FileNotFoundError:
+            continue # Otro proceso lo guardó y lo borró mientras se leía
+        except ValueError:
+            continue # Línea a medio escribir en el diario de otro proceso
+    return total
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def directorio_write_behind():
+    from django.conf import settings
+    config = getattr(settings, 'EMOCION_WRITE_BEHIND', {})
+    return config.get('JOURNAL_DIR') or os.path.join(settings.BASE_DIR, 'write_behind')
+
+
+def get_write_behind_buffer():
+    """Buffer de escritura diferida de AnalisisEmocion del proceso, o None si está desactivado."""
+    global _buffer
+    if _buffer is None:
+        from django.conf import settings
+        config = getattr(settings, 'EMOCION_WRITE_BEHIND', {})
+        if not config.get('ENABLED', False):
+            return None
+        with _buffer_lock:
+            if _buffer is None:
+                from .models import AnalisisEmocion
+                _buffer = WriteBehindBuffer(
+                    AnalisisEmocion,
+                    journal_dir=directorio_write_behind(),
+                    flush_size=config.get('FLUSH_SIZE', 200),
+                    flush_interval=config.get('FLUSH_INTERVAL_SECONDS', 1.0),
+                    fsync=config.get('FSYNC', False),
+                    insertar=AnalisisEmocion.objects.upsert,
+                    retry_min_seconds=config.get('RETRY_MIN_SECONDS', 1.0),
+                    retry_max_seconds=config.get('RETRY_MAX_SECONDS', 60.0),
+                    # Filas que quedaron sin guardar si un proceso anterior terminó de forma abrupta,
+                    # recuperadas antes de que el buffer abra su propio diario
+                    recover_on_start=True,
+                )
+    return _buffer
+
+
+def current_write_behind_buffer():
+    return _buffer
+
+
+def flush_write_behind():
+    """Guarda síncronamente lo encolado (no hace nada si el buffer no se ha creado)."""
+    if _buffer is not None:
+        return _buffer.flush()
+    return 0
+
+
+def pending_write_behind(sesion_id=None):
+    """
+    Filas (de la sesión) que este proceso aún no guardó: su cola y sus spools, que reintenta el hilo de
+    fondo. Se cuenta en memoria, así que sirve en una petición. 0 si el buffer no se ha creado.
+    """
+    if _buffer is None:
+        return 0
+    return _buffer.pending(sesion_id)
+
+
+def esperar_write_behind(sesion_ids, timeout=30.0):
+    """
+    Espera a que estén guardadas las filas encoladas de estas sesiones, en este proceso y en los servidores
+    que comparten JOURNAL_DIR (ej. antes de borrar sesiones de prueba que acaban de recibir frames).
+    Devuelve cuántas siguen pendientes si se agota `timeout`.
+    """
+    flush_write_behind()
+    sesion_ids = set(sesion_ids)
+    limite = time.monotonic() + timeout
+    while True:
+        pendientes = filas_en_diarios(directorio_write_behind(), sesion_ids)
+        if not pendientes or time.monotonic() >= limite:
+            return pendientes
+        time.sleep(0.2)
+
+
+def shutdown_write_behind():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            _buffer.close()
+            _buffer = None
+
+
+atexit.register(shutdown_write_behind)
@@ -13,4 +13,21 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emotion_api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Las conexiones WebSocket (/ws/sesiones/<id>/) van a la aplicación de api/websocket.py;
+# el resto de peticiones HTTP las atiende Django como siempre.
+from api.websocket import websocket_application
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
+
+# Precarga opcional del modelo de emociones para que el primer frame no pague la carga
+from django.conf import settings
+
+if getattr(settings, 'EMOCION_WARMUP_ON_STARTUP', False):
+    from api.ml_model.detector import warmup_in_background
+    warmup_in_background()
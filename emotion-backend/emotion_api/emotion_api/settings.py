@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,6 +55,7 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware', # Latencia y consultas por endpoint (ver /api/metrics/)
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -138,4 +140,139 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
 
-AUTH_USER_MODEL = 'api.Usuario'
\ No newline at end of file
+AUTH_USER_MODEL = 'api.Usuario'
+
+# --- Configuración del detector de emociones ---
+
+# Número de detectores de rostros (MediaPipe) reutilizables por proceso.
+# Lo ideal es uno por hilo de trabajo del servidor.
+EMOCION_FACE_DETECTOR_POOL_SIZE = 4
+
+# Micro-batching: agrupa rostros de peticiones concurrentes en una sola pasada del modelo.
+# MAX_WAIT_MS es lo máximo que espera el primer rostro de un lote a que lleguen otros.
+EMOCION_BATCH_ENABLED = True
+EMOCION_BATCH_MAX_SIZE = 16
+EMOCION_BATCH_MAX_WAIT_MS = 5
+
+# Backend del clasificador: 'keras', 'tflite' u 'onnx' (ver manage.py export_emotion_model).
+EMOCION_INFERENCE_BACKEND = 'keras'
+# Variante del modelo: 'float32' o 'int8' (solo con 'tflite', ver manage.py quantize_emotion_model).
+EMOCION_MODEL_VARIANT = 'float32'
+# Ruta del modelo; None usa el archivo por defecto del backend y la variante dentro de api/ml_model/.
+EMOCION_MODEL_PATH = None
+# Hilos de CPU para los intérpretes TFLite/ONNX (None = valor por defecto del runtime).
+EMOCION_INFERENCE_THREADS = None
+
+# Carga del modelo: por defecto TensorFlow/MediaPipe se importan en la primera detección.
+# Con WARMUP_ON_STARTUP el servidor (wsgi/asgi) los precarga en segundo plano al arrancar.
+EMOCION_WARMUP_ON_STARTUP = False
+
+# Servicio de inferencia fuera de proceso (manage.py run_inference_service).
+# Con ENABLED, los workers de Django no cargan el modelo: envían los frames al servicio
+# por memoria compartida. WORKERS procesos con THREADS_PER_WORKER hilos cada uno; los
+# workers caídos se reinician solos. AUTHKEY autentica las conexiones (los mensajes van con pickle):
+# se lee de EMOCION_INFERENCE_AUTHKEY, sin valor por defecto, y sin ella el servicio no arranca.
+EMOCION_INFERENCE_SERVICE = {
+    'ENABLED': False,
+    'ADDRESS': ('127.0.0.1', 6010),
+    'AUTHKEY': os.environ.get('EMOCION_INFERENCE_AUTHKEY'),
+    'WORKERS': 2,
+    'THREADS_PER_WORKER': 2,
+    'TIMEOUT_SECONDS': 10,
+}
+
+# Seguimiento del rostro por sesión: tras una detección completa, los frames siguientes
+# buscan el rostro solo alrededor de la última caja. La detección completa se repite cada
+# FULL_DETECTION_EVERY frames o cuando la correlación baja de MIN_CONFIDENCE. SEARCH_MARGIN
+# amplía la caja (fracción de su tamaño) para la búsqueda; TTL_SECONDS descarta sesiones inactivas.
+EMOCION_FACE_TRACKING = {
+    'ENABLED': True,
+    'FULL_DETECTION_EVERY': 10,
+    'MIN_CONFIDENCE': 0.6,
+    'SEARCH_MARGIN': 0.5,
+    'TTL_SECONDS': 300,
+}
+
+# Máximo de rostros clasificados por frame en emocion-detection/multi/ (cámara de aula).
+EMOCION_MULTI_FACE_MAX = 30
+
+# Supresión de frames casi idénticos en emocion-detection/: si el dHash (64 bits) de un frame
+# está a <= THRESHOLD bits del último frame analizado de la sesión, se guarda el mismo resultado
+# marcado como 'reutilizado' sin ejecutar el modelo. Tras MAX_REUSE reutilizaciones seguidas se
+# vuelve a analizar; TTL_SECONDS descarta sesiones inactivas.
+EMOCION_FRAME_DEDUP = {
+    'ENABLED': True,
+    'THRESHOLD': 5,
+    'MAX_REUSE': 10,
+    'TTL_SECONDS': 300,
+}
+
+# Máximo de frames por petición en emocion-detection/lote/. Un lote de frames en base64 puede
+# superar el límite por defecto de Django (2.5 MB) para el cuerpo de la petición.
+EMOCION_BATCH_UPLOAD_MAX_FRAMES = 20
+DATA_UPLOAD_MAX_MEMORY_SIZE = 16 * 1024 * 1024
+
+# Escritura diferida de AnalisisEmocion: las filas se encolan y un hilo las inserta con bulk_create
+# cada FLUSH_SIZE filas o cada FLUSH_INTERVAL_SECONDS (y al finalizar una sesión o apagar el proceso).
+# Cada fila se anota antes en un diario JSONL dentro de JOURNAL_DIR (None = <BASE_DIR>/write_behind)
+# para recuperarla si el proceso muere; FSYNC fuerza el diario a disco en cada frame. Los lotes que
+# fallan por un error transitorio se reintentan cada RETRY_MIN_SECONDS..RETRY_MAX_SECONDS (espera
+# exponencial). Desactivada por defecto: con ella un frame se responde antes de estar en la base de
+# datos (se activa con EMOCION_WRITE_BEHIND=1).
+EMOCION_WRITE_BEHIND = {
+    'ENABLED': os.environ.get('EMOCION_WRITE_BEHIND') == '1',
+    'FLUSH_SIZE': 200,
+    'FLUSH_INTERVAL_SECONDS': 1.0,
+    'RETRY_MIN_SECONDS': 1.0,
+    'RETRY_MAX_SECONDS': 60.0,
+    'JOURNAL_DIR': None,
+    'FSYNC': False,
+}
+
+# Caché del estado de las sesiones para validar frames sin consultar la base de datos.
+# TIMEOUT_* en segundos por estado (activa / finalizada / inexistente). Los frames posteriores al
+# fin de la ventana de análisis de la actividad (duracion_analisis_minutos desde el inicio real,
+# más DEADLINE_GRACE_SECONDS) se rechazan con 409.
+EMOCION_SESSION_STATE = {
+    'TIMEOUT_ACTIVE': 30,
+    'TIMEOUT_ENDED': 3600,
+    'TIMEOUT_UNKNOWN': 10,
+    'DEADLINE_GRACE_SECONDS': 60,
+}
+
+# Análisis de videos grabados (manage.py analyze_video y emocion-detection/video/).
+# SAMPLE_FPS frames analizados por segundo de video (como mucho 1, un análisis por segundo); el video se reparte en segmentos de
+# SEGMENT_SECONDS entre WORKERS procesos (None = uno por CPU). Los videos subidos se analizan dentro
+# del proceso web, con como mucho MAX_WORKERS procesos. Se guardan en UPLOAD_DIR
+# (None = <BASE_DIR>/videos) junto a su checkpoint y se borran al terminar con DELETE_AFTER.
+EMOCION_VIDEO_ANALYSIS = {
+    'SAMPLE_FPS': 1.0,
+    'SEGMENT_SECONDS': 60,
+    'WORKERS': None,
+    'MAX_WORKERS': 2,
+    'UPLOAD_DIR': None,
+    'DELETE_AFTER': True,
+}
+
+# Métricas en formato Prometheus en /api/metrics/ (por proceso): latencia por etapa del análisis,
+# resultados de detección, latencia y consultas por endpoint, carga del modelo y estadísticas de
+# los componentes del detector. LOG_SAMPLE_RATE es la fracción de frames que se anotan en el log
+# del logger 'api.ingest' (los errores internos se registran siempre).
+EMOCION_METRICS = {
+    'ENABLED': True,
+    'LOG_SAMPLE_RATE': 0.01,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '{asctime} {levelname} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emotion_api.settings')
 
 application = get_wsgi_application()
+
+# Precarga opcional del modelo de emociones para que el primer frame no pague la carga
+from django.conf import settings
+
+if getattr(settings, 'EMOCION_WARMUP_ON_STARTUP', False):
+    from api.ml_model.detector import warmup_in_background
+    warmup_in_background()